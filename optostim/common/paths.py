@@ -5,6 +5,8 @@ import os
 class Paths:
 
     camera_images = "Images"
+    camera_recordings = "Recordings"
+    protocol_timings = "Timings"
 
     @staticmethod
     def join(path1, path2):
@@ -0,0 +1,59 @@
+import functools
+import logging
+import os
+import sys
+
+import numpy as np
+from PyQt5.QtCore import QCoreApplication
+
+package_directory = os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir)
+sys.path.append(package_directory)
+sys.path.append(os.path.join(package_directory, os.pardir))
+
+from optostim.models.datamodels.labjack_state_model import LabJackStateModel
+from pyjohnstonlab.devices.labjack_device import LabJackDevice
+from pyjohnstonlab.devices.trigger import TriggerCondition
+from pyjohnstonlab.devices.virtual_u3 import LatencyModel, VirtualU3
+from pyjohnstonlab.threading.execute_states_thread import ExecuteStatesWorker
+
+# Runs LabJack state sequences against a simulated U3 and reports how far the output edges land from where they
+# were scheduled. Usage: python labjack_timing_benchmark.py [loops] [latency ms] [jitter ms]
+
+logging.basicConfig(level=logging.INFO)
+
+loops = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+latency = float(sys.argv[2]) / 1000.0 if len(sys.argv) > 2 else 0.001
+jitter = float(sys.argv[3]) / 1000.0 if len(sys.argv) > 3 else 0.0002
+
+app = QCoreApplication(sys.argv)
+
+backend = functools.partial(VirtualU3, latency_model=LatencyModel(latency=latency, jitter=jitter, seed=0),
+                            inputs={7: [(0.2, 0), (0.21, 1)]})
+labjack = LabJackDevice(backend=backend, fio4_label='Laser', fio5_label='PMT', fio6_label='Sync', fio7_label='Wait')
+labjack.check_device = False
+labjack._check_device()
+device = labjack._device
+
+detected = labjack.wait_for_signal(io_number=7, condition=TriggerCondition.FALLING, timeout=1.0)
+print("Scripted trigger detected {:.3f} ms after it fell.".format((detected - device.opened) / 1e6 - 200.0))
+
+states = [
+    LabJackStateModel(fio4state=True, fio6state=True, duration=0.005),
+    LabJackStateModel(fio4state=False, fio6state=False, duration=0.02),
+    LabJackStateModel(fio4state=True, duration=0.005),
+    LabJackStateModel(fio4state=False, duration=0.02),
+]
+
+first_command = len(device.commands)
+worker = ExecuteStatesWorker(number_of_times=loops, delay=0.0, device=labjack, states=states)
+worker.do_work()
+
+laser_edges = np.array([timestamp for timestamp, _ in device.writes(4, start=first_command)], dtype=np.int64)
+events = worker.recorder.recorded()
+scheduled = events['scheduled'][:len(laser_edges)]
+errors_us = (laser_edges - scheduled) / 1000.0
+
+print("Laser edges: {}, transactions: {}".format(len(laser_edges), device.transactions))
+print("Edge error vs schedule (us): mean={:.1f} std={:.1f} p99={:.1f} max={:.1f}".format(
+    errors_us.mean(), errors_us.std(), np.percentile(errors_us, 99), errors_us.max()))
+print("Drift first->last edge (us): {:.1f}".format(errors_us[-1] - errors_us[0]))
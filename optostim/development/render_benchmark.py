@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+package_directory = os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir)
+sys.path.append(package_directory)
+sys.path.append(os.path.join(package_directory, os.pardir))
+
+from optostim.graphics.offscreenrenderer import headless_application, OffscreenRenderTarget
+from optostim.models.datamodels.protocol_frames import render_frame
+from optostim.widgets.stimulus_render_window import DEFAULT_STATE, StimulusRenderer
+from pyjohnstonlab.gui.glresources import release_gl_resources
+
+# Uploads random protocol frames to a StimulusRenderer's frame array and draws them with its paint into an offscreen
+# framebuffer, the same shaders and draw calls as the stimulus render window, then reports the throughput.
+# Every frame is compared with the golden frames, which are written instead if the file does not exist yet. Exits
+# with 1 if any frame differs.
+# Usage: python render_benchmark.py [frames] [width] [height] [golden.npy]
+# Without a display on Linux this needs Xvfb installed, it is started for the run, see headless_application.
+
+FRAME_COUNT = 16
+
+frames = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+width = int(sys.argv[2]) if len(sys.argv) > 2 else 1920
+height = int(sys.argv[3]) if len(sys.argv) > 3 else 1080
+golden_path = sys.argv[4] if len(sys.argv) > 4 else None
+
+app = headless_application(sys.argv)
+
+target = OffscreenRenderTarget(width, height)
+renderer = StimulusRenderer(window=None, state=DEFAULT_STATE)
+state = dict(DEFAULT_STATE, size=(width, height))
+
+rng = np.random.default_rng(0)
+fov = 512
+images = []
+for _ in range(FRAME_COUNT):
+    corners = rng.integers(0, fov - 32, size=(8, 2))
+    rects = tuple((x, y, x + 32, y + 32) for x, y in corners)
+    images.append(render_frame(rects, fov, width, height))
+
+with target.current():
+    renderer.initialise_gl()
+    start = time.perf_counter()
+    renderer.frame_array.upload(images)
+    upload_time = time.perf_counter() - start
+
+rendered = np.stack([target.render(lambda: renderer.paint(state, layer)) for layer in range(FRAME_COUNT)])
+
+mismatched = 0
+if golden_path:
+    if os.path.exists(golden_path):
+        golden = np.load(golden_path)
+        if golden.shape != rendered.shape:
+            print("Golden frames {} are {}, rendered frames are {}.".format(golden_path, golden.shape, rendered.shape))
+            mismatched = FRAME_COUNT
+        else:
+            for layer in range(FRAME_COUNT):
+                different = np.count_nonzero(np.any(rendered[layer] != golden[layer], axis=-1))
+                if different:
+                    print("Frame {}: {} pixels differ from {}.".format(layer, different, golden_path))
+                    mismatched += 1
+            print("{} of {} frames match {}.".format(FRAME_COUNT - mismatched, FRAME_COUNT, golden_path))
+    else:
+        np.save(golden_path, rendered)
+        print("Wrote golden frames {}.".format(golden_path))
+
+start = time.perf_counter()
+for i in range(frames):
+    target.render(lambda: renderer.paint(state, i % FRAME_COUNT), read_back=False)
+render_time = time.perf_counter() - start
+
+start = time.perf_counter()
+for i in range(frames):
+    target.render(lambda: renderer.paint(state, i % FRAME_COUNT))
+readback_time = time.perf_counter() - start
+
+print("{}x{}, {} frames".format(width, height, frames))
+print("Upload of {} frames: {:.1f} ms".format(FRAME_COUNT, 1000 * upload_time))
+print("Draw + read back: {:.0f} frames/s ({:.2f} ms/frame)".format(
+    frames / readback_time, 1000 * readback_time / frames))
+print("Draw, no read back: {:.0f} frames/s".format(frames / render_time))
+
+with target.current():
+    renderer.frame_array.release()
+    release_gl_resources(target.context)
+target.release()
+
+sys.exit(1 if mismatched else 0)
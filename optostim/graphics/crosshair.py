@@ -3,16 +3,18 @@ import logging
 import numpy as np
 from OpenGL import GL
 from PyQt5.QtCore import QObject, Qt
-from PyQt5.QtGui import QOpenGLShaderProgram, QOpenGLShader, QMatrix4x4, QVector3D, QPen
+from PyQt5.QtGui import QMatrix4x4, QVector3D, QPen
 from PyQt5.QtWidgets import QGraphicsLineItem
 
+from pyjohnstonlab.gui.glresources import gl_resources
+
 log = logging.getLogger(__name__)
 
 # todo - Even thickness, translate to edges properly
 
 VERTEX = '''
     #version 330
-    in vec3 vertexPosition;
+    layout(location=0) in vec3 vertexPosition;
     uniform mat4 projection_matrix;
     uniform mat4 view_matrix;
     out mat4 transformation;
@@ -44,47 +46,25 @@ FRAGMENT = '''
 
 class CrosshairLine(QObject):
 
-    def __init__(self, parent, vertex_data):
+    def __init__(self, parent, name, vertex_data):
         super().__init__(parent)
-        self.shader_program = QOpenGLShaderProgram(parent=self)
+        self.name = name
+        self.shader_program = None
         self.vertex_attribute_object = None
         self.vertex_data = vertex_data
-        self.vertex_position_uniform = None
 
     def get_uniform_location(self, name):
-        location = self.shader_program.uniformLocation(name)
-        if location == -1:
-            raise ValueError("Uniform {} has no location.".format(name))
-        return location
+        return gl_resources().uniform_location(self.shader_program, name, required=True)
 
     def initialise_gl(self):
-        self.shader_program.addShaderFromSourceCode(QOpenGLShader.Vertex, VERTEX)
-        self.shader_program.addShaderFromSourceCode(QOpenGLShader.Fragment, FRAGMENT)
-
-        if not self.shader_program.link():
-            raise Exception("Could not link shaders - {}".format(self.shader_program.log()))
-
-        self.vertex_attribute_object = GL.glGenVertexArrays(1)
-        GL.glBindVertexArray(self.vertex_attribute_object)
-
-        vertex_buffer_object = GL.glGenBuffers(1)
-        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, vertex_buffer_object)
-        GL.glBufferData(GL.GL_ARRAY_BUFFER, self.vertex_data.nbytes, self.vertex_data,
-                        GL.GL_STATIC_DRAW)
-
-        self.vertex_position = self.shader_program.attributeLocation("vertexPosition")
+        resources = gl_resources()
+        self.shader_program = resources.program(VERTEX, FRAGMENT)
+        self.vertex_attribute_object = resources.vertex_array(self.name, self.vertex_data.reshape(-1, 3))
 
         self.inverted_uniform = self.get_uniform_location("inverted")
         self.projection_matrix_uniform = self.get_uniform_location("projection_matrix")
         self.view_matrix_uniform = self.get_uniform_location("view_matrix")
 
-        GL.glVertexAttribPointer(self.vertex_position, 3, GL.GL_FLOAT, GL.GL_FALSE, 0,
-                                 None)
-
-        GL.glEnableVertexAttribArray(0)
-        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
-        GL.glBindVertexArray(0)
-
     def paint_gl(self, inverted, projection_matrix, view_matrix):
         self.shader_program.bind()
         self.shader_program.setUniformValue(self.inverted_uniform, inverted)
@@ -121,8 +101,8 @@ class Crosshair(QObject):
             -self.loc, -corner, 0.1,
             -self.loc, corner, 0.1
         ], dtype=np.float32)
-        self.vertical_line = CrosshairLine(parent=self, vertex_data=vertical_vertices)
-        self.horizontal_line = CrosshairLine(parent=self, vertex_data=horizontal_vertices)
+        self.vertical_line = CrosshairLine(parent=self, name='crosshair_vertical', vertex_data=vertical_vertices)
+        self.horizontal_line = CrosshairLine(parent=self, name='crosshair_horizontal', vertex_data=horizontal_vertices)
         self.view_matrix = QMatrix4x4()
 
     def initialise_gl(self):
@@ -0,0 +1,181 @@
+import ctypes
+import logging
+import time
+
+import numpy as np
+from OpenGL import GL
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot, QTimer
+from PyQt5.QtGui import QImage
+
+log = logging.getLogger(__name__)
+
+PREVIEW_WIDTH = 320
+# Seconds between previews, the stimulus window itself is never held up waiting for one.
+PREVIEW_INTERVAL = 0.1
+POLL_INTERVAL_MS = 5
+
+
+class FramebufferPreview(QObject):
+    """Small, throttled copies of what a QOpenGLWidget shows, read back without stalling its rendering.
+
+    After a frame is swapped the widget's framebuffer is blitted into a preview sized framebuffer and read into a
+    pixel buffer object behind a fence. The pixels are only mapped once the fence has signalled, on a later swap or
+    poll, so the copy never waits on the GPU.
+    """
+
+    previewReady = pyqtSignal(QImage)
+
+    def __init__(self, widget, width=PREVIEW_WIDTH, interval=PREVIEW_INTERVAL, parent=None):
+        super().__init__(parent)
+        self.widget = widget
+        self.width = width
+        self.interval = interval
+        self.fence = None
+        self.frame_buffer = None
+        self.pixel_buffer = None
+        self.render_buffer = None
+        self.running = False
+        self.size = None
+        self._last_request = 0.0
+        self.poll_timer = QTimer(self)
+        self.poll_timer.setSingleShot(True)
+        self.poll_timer.setInterval(POLL_INTERVAL_MS)
+        self.poll_timer.timeout.connect(self.on_poll_timer_timeout)
+        # Catches the last frame of a burst that came in faster than the interval.
+        self.request_timer = QTimer(self)
+        self.request_timer.setSingleShot(True)
+        self.request_timer.timeout.connect(self.on_request_timer_timeout)
+
+    def allocate(self, width, height):
+        self.release_gl()
+        self.render_buffer = GL.glGenRenderbuffers(1)
+        GL.glBindRenderbuffer(GL.GL_RENDERBUFFER, self.render_buffer)
+        GL.glRenderbufferStorage(GL.GL_RENDERBUFFER, GL.GL_RGBA8, width, height)
+        GL.glBindRenderbuffer(GL.GL_RENDERBUFFER, 0)
+
+        self.frame_buffer = GL.glGenFramebuffers(1)
+        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, self.frame_buffer)
+        GL.glFramebufferRenderbuffer(GL.GL_FRAMEBUFFER, GL.GL_COLOR_ATTACHMENT0, GL.GL_RENDERBUFFER,
+                                     self.render_buffer)
+        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, self.widget.defaultFramebufferObject())
+
+        self.pixel_buffer = GL.glGenBuffers(1)
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, self.pixel_buffer)
+        GL.glBufferData(GL.GL_PIXEL_PACK_BUFFER, width * height * 4, None, GL.GL_STREAM_READ)
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+
+        self.size = (width, height)
+
+    def collect(self):
+        if self.fence is None:
+            return False
+        status = GL.glClientWaitSync(self.fence, 0, 0)
+        if status not in (GL.GL_ALREADY_SIGNALED, GL.GL_CONDITION_SATISFIED):
+            return False
+        GL.glDeleteSync(self.fence)
+        self.fence = None
+
+        width, height = self.size
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, self.pixel_buffer)
+        pointer = GL.glMapBufferRange(GL.GL_PIXEL_PACK_BUFFER, 0, width * height * 4, GL.GL_MAP_READ_BIT)
+        pixels = np.empty((height, width, 4), dtype=np.uint8)
+        ctypes.memmove(pixels.ctypes.data, pointer, pixels.nbytes)
+        GL.glUnmapBuffer(GL.GL_PIXEL_PACK_BUFFER)
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+
+        # Rows come back bottom up, mirrored() also copies the image off the array.
+        image = QImage(pixels.data, width, height, width * 4, QImage.Format_RGBA8888).mirrored()
+        self.previewReady.emit(image)
+        return True
+
+    def release_gl(self):
+        if self.fence is not None:
+            GL.glDeleteSync(self.fence)
+        if self.frame_buffer is not None:
+            GL.glDeleteFramebuffers(1, [self.frame_buffer])
+            GL.glDeleteRenderbuffers(1, [self.render_buffer])
+            GL.glDeleteBuffers(1, [self.pixel_buffer])
+        self.fence = None
+        self.frame_buffer = None
+        self.pixel_buffer = None
+        self.render_buffer = None
+        self.size = None
+
+    def request(self):
+        ratio = self.widget.devicePixelRatioF()
+        source_width = int(self.widget.width() * ratio)
+        source_height = int(self.widget.height() * ratio)
+        if source_width <= 0 or source_height <= 0:
+            return
+        width = min(self.width, source_width)
+        height = max(1, int(round(source_height * width / source_width)))
+        if self.size != (width, height):
+            self.allocate(width, height)
+
+        GL.glBindFramebuffer(GL.GL_READ_FRAMEBUFFER, self.widget.defaultFramebufferObject())
+        GL.glBindFramebuffer(GL.GL_DRAW_FRAMEBUFFER, self.frame_buffer)
+        GL.glBlitFramebuffer(0, 0, source_width, source_height, 0, 0, width, height, GL.GL_COLOR_BUFFER_BIT,
+                             GL.GL_LINEAR)
+
+        GL.glBindFramebuffer(GL.GL_READ_FRAMEBUFFER, self.frame_buffer)
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, self.pixel_buffer)
+        GL.glPixelStorei(GL.GL_PACK_ALIGNMENT, 4)
+        GL.glReadPixels(0, 0, width, height, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, self.widget.defaultFramebufferObject())
+
+        self.fence = GL.glFenceSync(GL.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        GL.glFlush()
+        self.poll_timer.start()
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self._last_request = 0.0
+        self.widget.frameSwapped.connect(self.on_widget_frameSwapped)
+        self.widget.update()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.poll_timer.stop()
+        self.request_timer.stop()
+        self.widget.frameSwapped.disconnect(self.on_widget_frameSwapped)
+        if self.widget.context() is not None:
+            self.widget.makeCurrent()
+            self.release_gl()
+            self.widget.doneCurrent()
+
+    @pyqtSlot()
+    def on_poll_timer_timeout(self):
+        if not self.running or self.fence is None:
+            return
+        self.widget.makeCurrent()
+        try:
+            if not self.collect():
+                self.poll_timer.start()
+        finally:
+            self.widget.doneCurrent()
+
+    @pyqtSlot()
+    def on_request_timer_timeout(self):
+        if self.running:
+            self.on_widget_frameSwapped()
+
+    @pyqtSlot()
+    def on_widget_frameSwapped(self):
+        # QOpenGLWidget keeps its framebuffer after the swap, so it can still be read here.
+        self.widget.makeCurrent()
+        try:
+            self.collect()
+            wait = self.interval - (time.perf_counter() - self._last_request)
+            if wait > 0 or self.fence is not None:
+                if not self.request_timer.isActive():
+                    self.request_timer.start(max(POLL_INTERVAL_MS, int(1000 * wait)))
+            else:
+                self._last_request = time.perf_counter()
+                self.request()
+        finally:
+            self.widget.doneCurrent()
@@ -0,0 +1,119 @@
+import logging
+
+import numpy as np
+from OpenGL import GL
+
+from optostim.exceptions import OptoStimException
+from optostim.graphics.streamingtexture import FORMATS
+
+log = logging.getLogger(__name__)
+
+# Vendor queries for free video memory, both report kilobytes.
+GPU_MEMORY_INFO_CURRENT_AVAILABLE_VIDMEM_NVX = 0x9049
+TEXTURE_FREE_MEMORY_ATI = 0x87FC
+# Fraction of the reported free memory a protocol may take.
+MEMORY_BUDGET_FRACTION = 0.5
+
+
+class TextureResidencyError(OptoStimException):
+    pass
+
+
+def available_texture_memory():
+    # Bytes of free video memory, or None if the driver does not say.
+    extensions = {GL.glGetStringi(GL.GL_EXTENSIONS, i).decode()
+                  for i in range(GL.glGetIntegerv(GL.GL_NUM_EXTENSIONS))}
+    if 'GL_NVX_gpu_memory_info' in extensions:
+        return int(GL.glGetIntegerv(GPU_MEMORY_INFO_CURRENT_AVAILABLE_VIDMEM_NVX)) * 1024
+    if 'GL_ATI_meminfo' in extensions:
+        return int(np.atleast_1d(GL.glGetIntegerv(TEXTURE_FREE_MEMORY_ATI))[0]) * 1024
+    return None
+
+
+def texture_budget():
+    # Bytes of frames a protocol may make resident, or None if the driver does not say.
+    available = available_texture_memory()
+    return None if available is None else int(MEMORY_BUDGET_FRACTION * available)
+
+
+class FrameTextureArray:
+    """Every frame of a protocol resident on the GPU as the layers of one GL_TEXTURE_2D_ARRAY.
+
+    After upload, showing a frame is only a change of the layer uniform. (height, width) frames make an R8 array,
+    (height, width, 3) packed bit plane frames an RGB8 one sampled with nearest filtering, as in StreamingTexture.
+    """
+
+    def __init__(self):
+        self.channels = 1
+        self.layers = 0
+        self.size = None
+        self.texture = None
+
+    def __len__(self):
+        return self.layers
+
+    def check_budget(self, width, height, layers, channels=1):
+        max_layers = int(GL.glGetIntegerv(GL.GL_MAX_ARRAY_TEXTURE_LAYERS))
+        if layers > max_layers:
+            raise TextureResidencyError('{} frames is more than the {} texture layers this GPU supports.'.format(
+                layers, max_layers))
+        required = width * height * layers * channels
+        budget = texture_budget()
+        if budget is None:
+            log.warning("GPU does not report free memory, uploading {:.1f} MB of frames unchecked.".format(
+                required / 1e6))
+        elif required > budget:
+            raise TextureResidencyError('{:.1f} MB of frames does not fit in the {:.1f} MB texture budget.'.format(
+                required / 1e6, budget / 1e6))
+
+    def release(self):
+        if self.texture is not None:
+            GL.glDeleteTextures([self.texture])
+        self.channels = 1
+        self.layers = 0
+        self.size = None
+        self.texture = None
+
+    def upload(self, frames):
+        self.release()
+        if not frames:
+            return
+        shape = frames[0].shape
+        height, width = shape[:2]
+        channels = shape[2] if len(shape) == 3 else 1
+        if channels not in FORMATS:
+            raise ValueError('Frames of shape {} can not be uploaded.'.format(shape))
+        for layer, frame in enumerate(frames):
+            if frame.shape != shape:
+                raise ValueError('Frame {} is {}, expected {}.'.format(layer, frame.shape, shape))
+        self.check_budget(width, height, len(frames), channels)
+
+        internal_format, pixel_format = FORMATS[channels]
+        texture_filter = GL.GL_LINEAR if channels == 1 else GL.GL_NEAREST
+        self.texture = GL.glGenTextures(1)
+        GL.glBindTexture(GL.GL_TEXTURE_2D_ARRAY, self.texture)
+        GL.glTexStorage3D(GL.GL_TEXTURE_2D_ARRAY, 1, internal_format, width, height, len(frames))
+        GL.glTexParameteri(GL.GL_TEXTURE_2D_ARRAY, GL.GL_TEXTURE_MAX_LEVEL, 0)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D_ARRAY, GL.GL_TEXTURE_MAG_FILTER, texture_filter)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D_ARRAY, GL.GL_TEXTURE_MIN_FILTER, texture_filter)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D_ARRAY, GL.GL_TEXTURE_WRAP_S, GL.GL_CLAMP_TO_BORDER)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D_ARRAY, GL.GL_TEXTURE_WRAP_T, GL.GL_CLAMP_TO_BORDER)
+        if channels == 1:
+            GL.glTexParameteriv(GL.GL_TEXTURE_2D_ARRAY, GL.GL_TEXTURE_SWIZZLE_RGBA,
+                                np.array([GL.GL_RED, GL.GL_RED, GL.GL_RED, GL.GL_ONE], dtype=np.int32))
+
+        GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)
+        try:
+            for layer, frame in enumerate(frames):
+                GL.glTexSubImage3D(GL.GL_TEXTURE_2D_ARRAY, 0, 0, 0, layer, width, height, 1, pixel_format,
+                                   GL.GL_UNSIGNED_BYTE, np.ascontiguousarray(frame, dtype=np.uint8))
+        except Exception:
+            self.release()
+            raise
+        finally:
+            GL.glBindTexture(GL.GL_TEXTURE_2D_ARRAY, 0)
+
+        self.channels = channels
+        self.layers = len(frames)
+        self.size = (width, height)
+        log.info("Uploaded {} frames of {}x{} to a texture array.".format(self.layers, width, height))
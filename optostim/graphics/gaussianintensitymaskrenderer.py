@@ -1,163 +1,137 @@
-import ctypes
-
 import numpy as np
 from OpenGL import GL
 from PyQt5.QtCore import QObject
-from PyQt5.QtGui import QOpenGLShaderProgram, QOpenGLShader
+from PyQt5.QtGui import QVector2D
+
+from pyjohnstonlab.gui.glresources import gl_resources
+
+# Shared by every shader that flattens the beam profile. The centre is rotated on the CPU when the fit or window
+# changes, in the same way as pyjohnstonlab.curves.gaussian, so the result matches IntensityMask.apply_to_image.
+GAUSSIAN_MASK = """
+        uniform bool intensity_mask;
+        uniform vec2 mask_centre;
+        uniform vec2 mask_widths;
+        uniform float mask_rotation;
+        uniform float mask_window_height;
+
+        float gaussianMask(vec2 fragment)
+        {
+            vec2 p = vec2(fragment.x - 0.5, mask_window_height - fragment.y - 0.5);
+            float c = cos(mask_rotation);
+            float s = sin(mask_rotation);
+            vec2 d = (mask_centre - vec2(p.x * c - p.y * s, p.x * s + p.y * c)) / mask_widths;
+            return 1.0 - exp(-0.5 * dot(d, d));
+        }
+"""
 
 VERTEX_INTENSITY = """#version 330
-        in vec3 vertexPosition;
-        in vec2 vertexTexCoords;
+        layout(location=0) in vec3 vertexPosition;
+        layout(location=1) in vec2 vertexTexCoords;
 
         out vec2 textureCoords;
 
         void main() {
-           gl_Position = vec4(vertexPosition, 0.0);
+            gl_Position = vec4(vertexPosition, 1.0);
             textureCoords = vertexTexCoords;
         }"""
 
 FRAGMENT_INTENSITY = """#version 330
         in vec2 textureCoords;
         uniform sampler2D texture_framebuffer;
+        uniform bool inverted;
         out vec4 colour;
-
-        uniform float centre_x = 678;
-        uniform float centre_y = 987;        
-        uniform float height = 213;
-        uniform float rotation = 26;
-        uniform float max_height;
-        uniform vec2 shape;
-        uniform float width_x = 231;
-        uniform float width_y = 254;
-
-        float gaussianMask(float x, float y)
-        {
-            float rotation_radians = radians(rotation);
-
-            float centre_x2 = centre_x * cos(rotation_radians) - centre_y * sin(rotation_radians);
-            float centre_y2 = centre_x * sin(rotation_radians) + centre_y * cos(rotation_radians);
-
-            float xp = x * cos(rotation_radians) - y * sin(rotation_radians);
-            float yp = x * sin(rotation_radians) + y * cos(rotation_radians);
-
-           float a = pow((centre_x2 - xp) / width_x, 2);
-           float b = pow((centre_y2 - yp) / width_y, 2);
-
-            float gaussian = height * exp(-0.5 * (a + b));
-
-            return (1.0 - gaussian / height);
-        }
-
+""" + GAUSSIAN_MASK + """
         void main() {
-             vec4 c = texture(texture_framebuffer, textureCoords) * gaussianMask(gl_FragCoord.x, gl_FragCoord.y);
-             //vec2 blah = textureCoords;
-             colour = vec4(1.0, 0.0, 0.0, 1.0);
-
-
-             /* if (intensity_mask)
-              {
-              vec3 transformed = homography_matrix * vec3(textureCoords.x, textureCoords.y, 1.0);
-
-                  float y = transformed.x;// * shape.y;
-                  float x = (1 - transformed.y);// * shape.x;
-
-                    colour.xyz = vec3(gaussianMask(x,  y));
-                    colour = colour * gaussianMask();
-               }*/
-
+            colour = texture(texture_framebuffer, textureCoords);
+            if (inverted)
+            {
+                colour = vec4(1.0) - colour;
+            }
+            if (intensity_mask)
+            {
+                colour.rgb = colour.rgb * gaussianMask(gl_FragCoord.xy);
+            }
+            colour.a = 1.0;
         }
 """
 
 
+class GaussianMaskUniforms:
+
+    def __init__(self):
+        self.centre = None
+        self.enabled = None
+        self.rotation = None
+        self.widths = None
+        self.window_height = None
+
+    def locate(self, shader_program):
+        self.centre = shader_program.uniformLocation("mask_centre")
+        self.enabled = shader_program.uniformLocation("intensity_mask")
+        self.rotation = shader_program.uniformLocation("mask_rotation")
+        self.widths = shader_program.uniformLocation("mask_widths")
+        self.window_height = shader_program.uniformLocation("mask_window_height")
+
+    def set(self, shader_program, gaussian, shape, width, height, enabled=True):
+        # shape is the (rows, columns) of the image the Gaussian was fitted to, it is stretched over the window.
+        enabled = enabled and gaussian is not None and shape[0] > 0 and shape[1] > 0
+        shader_program.setUniformValue(self.enabled, enabled)
+        if not enabled:
+            return
+        scale_x = width / shape[1]
+        scale_y = height / shape[0]
+        rotation = np.deg2rad(gaussian.rotation)
+        centre_x = scale_x * gaussian.x0 * np.cos(rotation) - scale_y * gaussian.y0 * np.sin(rotation)
+        centre_y = centre_x * np.sin(rotation) + scale_y * gaussian.y0 * np.cos(rotation)
+        shader_program.setUniformValue(self.centre, QVector2D(centre_x, centre_y))
+        shader_program.setUniformValue(self.widths, QVector2D(scale_x * gaussian.width_x, scale_y * gaussian.width_y))
+        shader_program.setUniformValue(self.rotation, float(rotation))
+        shader_program.setUniformValue(self.window_height, float(height))
+
+
 class GaussianIntensityMaskRenderer(QObject):
+    """Post-process pass that draws a rendered scene texture to the bound framebuffer with the mask applied.
+
+    The Gaussian comes from an IntensityMask fit and is only ever uniforms, so neither a new fit nor a new stimulus
+    costs any CPU work per pixel.
+    """
 
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.framebuffer = None
-        self.shader_program = QOpenGLShaderProgram()
-        self.texture = None
+        self.gaussian = None
+        self.mask_uniforms = GaussianMaskUniforms()
+        self.shader_program = None
+        self.shape = (0, 0)
         self.vertex_attribute_object = None
-
-        x0 = -1
-        y0 = -1
-        width = 2
-
-        self.vertex_data = np.array([
-            x0, y0, 0.0,                    0.0, 0.0,
-            x0 + width, y0, 0.0,            1.0, 0.0,
-            x0 + width, y0 + width, 0.0,    1.0, 1.0,
-
-            x0 + width, y0 + width, 0.0,    1.0, 1.0,
-            x0, y0 + width, 0.0,            0.0, 1.0,
-            x0, y0, 0.0,                    0.0, 0.0
-        ], dtype=np.float32)
-
         self.initialised = False
 
-    def draw(self):
-        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, self.framebuffer)
+    def draw(self, texture, width, height, inverted=False, masked=True):
+        if not self.initialised:
+            self.initialise_gl()
         self.shader_program.bind()
+        self.shader_program.setUniformValue(self.inverted_uniform, inverted)
+        self.mask_uniforms.set(self.shader_program, self.gaussian, self.shape, width, height, enabled=masked)
         GL.glBindVertexArray(self.vertex_attribute_object)
         GL.glActiveTexture(GL.GL_TEXTURE0)
-        GL.glBindTexture(GL.GL_TEXTURE_2D, self.texture)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, texture)
+        GL.glUniform1i(self.texture_framebuffer, 0)
         GL.glDrawArrays(GL.GL_TRIANGLES, 0, 6)
         GL.glBindVertexArray(0)
         self.shader_program.release()
 
     def initialise_gl(self):
         self.initialise_shader()
-        self.initialise_texture()
-        self.initialise_framebuffer()
         self.initialised = True
 
-    def initialise_framebuffer(self):
-        self.framebuffer = GL.glGenFramebuffers(1)
-        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, self.framebuffer)
-        GL.glFramebufferTexture(GL.GL_FRAMEBUFFER, GL.GL_COLOR_ATTACHMENT1, self.framebuffer, 0)
-
     def initialise_shader(self):
-        self.shader_program.addShaderFromSourceCode(QOpenGLShader.Vertex, VERTEX_INTENSITY)
-        self.shader_program.addShaderFromSourceCode(QOpenGLShader.Fragment, FRAGMENT_INTENSITY)
-
-        if not self.shader_program.link():
-            raise Exception("Could not link shaders - {}".format(self.shader_program.log()))
-
-        self.vertex_attribute_object = GL.glGenVertexArrays(1)
-        GL.glBindVertexArray(self.vertex_attribute_object)
-
-        vertex_buffer_object = GL.glGenBuffers(1)
-        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, vertex_buffer_object)
-        GL.glBufferData(GL.GL_ARRAY_BUFFER, self.vertex_data.nbytes, self.vertex_data,
-                        GL.GL_STATIC_DRAW)
-
-        self.vertex_position = self.shader_program.attributeLocation("vertexPosition")
-        self.texture_coords = self.shader_program.attributeLocation("vertexTexCoords")
-        self.texture_framebuffer = self.shader_program.uniformLocation("texture_framebuffer")
-
-        self.centre_x_uniform = self.shader_program.uniformLocation("centre_x")
-        self.centre_y_uniform = self.shader_program.uniformLocation("centre_y")
-        self.height_uniform = self.shader_program.uniformLocation("height")
-        self.rotation_uniform = self.shader_program.uniformLocation("rotation")
-        self.max_height_uniform = self.shader_program.uniformLocation("max_height")
-        self.shape_uniform = self.shader_program.uniformLocation("shape")
-        self.width_x_uniform = self.shader_program.uniformLocation("width_x")
-        self.width_y_uniform = self.shader_program.uniformLocation("width_y")
-
-        GL.glEnableVertexAttribArray(0)
-        GL.glEnableVertexAttribArray(1)
-        GL.glVertexAttribPointer(self.vertex_position, 3, GL.GL_FLOAT, GL.GL_FALSE, 20,
-                                 None)
-
-        GL.glVertexAttribPointer(self.texture_coords, 2, GL.GL_FLOAT, GL.GL_TRUE, 20,
-                                 ctypes.c_void_p(12))
-        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
-        GL.glBindVertexArray(0)
+        resources = gl_resources()
+        self.shader_program = resources.program(VERTEX_INTENSITY, FRAGMENT_INTENSITY)
+        self.vertex_attribute_object = resources.vertex_array('screen_quad')
 
-    def initialise_texture(self):
-        self.texture = GL.glGenTextures(1)
-        GL.glBindTexture(GL.GL_TEXTURE_2D, self.texture)
-        GL.glTexParameterf(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_LINEAR)
-        GL.glTexParameterf(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_LINEAR)
+        self.texture_framebuffer = resources.uniform_location(self.shader_program, "texture_framebuffer")
+        self.inverted_uniform = resources.uniform_location(self.shader_program, "inverted")
+        self.mask_uniforms.locate(self.shader_program)
 
-        GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGB, self.parent().width(), self.parent().height(), 0,
-                        GL.GL_RGB, GL.GL_UNSIGNED_BYTE, None)
\ No newline at end of file
+    def set_gaussian(self, gaussian, shape):
+        self.gaussian = gaussian
+        self.shape = tuple(shape)
@@ -0,0 +1,138 @@
+import numpy as np
+from OpenGL import GL
+from PyQt5.QtCore import QObject
+from PyQt5.QtGui import QOpenGLContext
+
+from pyjohnstonlab.gui.glresources import GEOMETRY, gl_resources
+
+VERTEX = '''
+    #version 330
+    layout(location=0) in vec2 vertexPosition;
+    layout(location=1) in vec4 instance;
+    layout(location=2) in float active;
+    uniform mat4 transformation;
+    out float intensity;
+
+    void main()
+    {
+        // instance is (x, y, size, intensity) in scene coordinates. Inactive instances collapse to a point
+        // outside the clip volume so they never reach the rasteriser.
+        intensity = instance.w;
+        if (active > 0.0)
+        {
+            gl_Position = transformation * vec4(instance.xy + instance.z * vertexPosition, 0.0, 1.0);
+        }
+        else
+        {
+            gl_Position = vec4(2.0, 2.0, 2.0, 1.0);
+        }
+    }
+'''
+
+FRAGMENT = '''
+    #version 330
+    in float intensity;
+    out vec4 colour;
+
+    void main()
+    {
+        colour = vec4(vec3(intensity), 1.0);
+    }
+'''
+
+INSTANCE_DTYPE = np.dtype([('x', np.float32), ('y', np.float32), ('size', np.float32), ('intensity', np.float32)])
+
+
+class InstancedStimulusPointRenderer(QObject):
+    """Every stimulus point in one instance buffer, any subset of them drawn with a single instanced draw call.
+
+    Switching the active subset only rewrites one float per point. The quad, vertex array and buffers belong to the
+    context's GLResources, so they are made once per context and deleted with it.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.active = np.zeros(0, dtype=np.float32)
+        self.active_buffer = None
+        self.context = None
+        self.instance_buffer = None
+        self.instances = np.zeros(0, dtype=INSTANCE_DTYPE)
+        self.shader_program = None
+        self.vertex_attribute_object = None
+        self._active_changed = False
+        self._instances_changed = False
+        self.initialised = False
+
+    def __len__(self):
+        return len(self.instances)
+
+    def draw(self, transformation):
+        if not len(self.instances) or not self.active.any():
+            return
+        # The scene can be shown by a view whose context has been recreated since the buffers were made.
+        if not self.initialised or QOpenGLContext.currentContext() != self.context:
+            self.initialise_gl()
+        self.upload()
+
+        self.shader_program.bind()
+        self.shader_program.setUniformValue(self.transformation_uniform, transformation)
+        GL.glBindVertexArray(self.vertex_attribute_object)
+        GL.glDrawArraysInstanced(GL.GL_TRIANGLES, 0, 6, len(self.instances))
+        GL.glBindVertexArray(0)
+        self.shader_program.release()
+
+    def initialise_gl(self):
+        resources = gl_resources()
+        self.context = resources.context
+        self.shader_program = resources.program(VERTEX, FRAGMENT)
+        self.transformation_uniform = resources.uniform_location(self.shader_program, "transformation")
+
+        # The instance attributes are added to the vertex array, so it is this renderer's own copy of the quad.
+        name = 'instanced_points_{}'.format(id(self))
+        self.vertex_attribute_object = resources.vertex_array(name, GEOMETRY['centred_quad'])
+        self.instance_buffer = resources.buffer(name + '_instances')
+        self.active_buffer = resources.buffer(name + '_active')
+
+        GL.glBindVertexArray(self.vertex_attribute_object)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.instance_buffer)
+        GL.glEnableVertexAttribArray(1)
+        GL.glVertexAttribPointer(1, 4, GL.GL_FLOAT, GL.GL_FALSE, INSTANCE_DTYPE.itemsize, None)
+        GL.glVertexAttribDivisor(1, 1)
+
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.active_buffer)
+        GL.glEnableVertexAttribArray(2)
+        GL.glVertexAttribPointer(2, 1, GL.GL_FLOAT, GL.GL_FALSE, 4, None)
+        GL.glVertexAttribDivisor(2, 1)
+
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        GL.glBindVertexArray(0)
+
+        self._instances_changed = True
+        self.initialised = True
+
+    def set_active(self, indices):
+        self.active[:] = 0.0
+        if indices is not None:
+            self.active[indices] = 1.0
+        self._active_changed = True
+
+    def set_points(self, points):
+        self.instances = np.zeros(len(points), dtype=INSTANCE_DTYPE)
+        for i, point in enumerate(points):
+            self.instances[i] = (point.pos().x(), point.pos().y(), point.rect().width(), point.intensity)
+        self.active = np.zeros(len(points), dtype=np.float32)
+        self._instances_changed = True
+
+    def upload(self):
+        if self._instances_changed:
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.instance_buffer)
+            GL.glBufferData(GL.GL_ARRAY_BUFFER, self.instances.nbytes, self.instances, GL.GL_STATIC_DRAW)
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.active_buffer)
+            GL.glBufferData(GL.GL_ARRAY_BUFFER, self.active.nbytes, self.active, GL.GL_DYNAMIC_DRAW)
+            self._instances_changed = False
+            self._active_changed = False
+        elif self._active_changed:
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.active_buffer)
+            GL.glBufferSubData(GL.GL_ARRAY_BUFFER, 0, self.active.nbytes, self.active)
+            self._active_changed = False
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
@@ -1,13 +1,11 @@
-import ctypes
-
-import numpy as np
 from OpenGL import GL
-from PyQt5.QtGui import QOpenGLShader, QOpenGLShaderProgram
+
+from pyjohnstonlab.gui.glresources import gl_resources
 
 VERTEX = '''
     #version 330
-    in vec3 vertexPosition;
-    in vec2 tex_coords;
+    layout(location=0) in vec3 vertexPosition;
+    layout(location=1) in vec2 tex_coords;
     out vec2 texture_coord;
 
     void main()
@@ -34,26 +32,12 @@ class InvertSceneColoursMixin:
 
     def __init__(self):
         self.initialised = False
-        self.shader_program = QOpenGLShaderProgram()
-        self.vertex_position = None
+        self.shader_program = None
+        self.vertex_attribute_object = None
         self.texture = 0
         self.frame_buffer = 0
         self.recreate_frame_buffer = True
 
-        x0 = -1
-        y0 = -1
-        width = 2
-
-        self.vertex_data = np.array([
-            x0, y0, 0.0,                    0.0, 0.0,
-            x0 + width, y0, 0.0,            1.0, 0.0,
-            x0 + width, y0 + width, 0.0,    1.0, 1.0,
-
-            x0 + width, y0 + width, 0.0,    1.0, 1.0,
-            x0, y0 + width, 0.0,            0.0, 1.0,
-            x0, y0, 0.0,                    0.0, 0.0
-        ], dtype=np.float32)
-
     def draw_texture_to_screen(self):
         self.shader_program.bind()
         GL.glBindVertexArray(self.vertex_attribute_object)
@@ -81,34 +65,10 @@ class InvertSceneColoursMixin:
         GL.glFramebufferTexture(GL.GL_FRAMEBUFFER, GL.GL_COLOR_ATTACHMENT0, self.texture, 0)
 
     def initialise_gl(self):
-        self.shader_program.addShaderFromSourceCode(QOpenGLShader.Vertex, VERTEX)
-        self.shader_program.addShaderFromSourceCode(QOpenGLShader.Fragment, FRAGMENT)
-
-        if not self.shader_program.link():
-            raise Exception("Could not link shaders - {}".format(self.shader_program.log()))
-
-        self.vertex_attribute_object = GL.glGenVertexArrays(1)
-        GL.glBindVertexArray(self.vertex_attribute_object)
-
-        vertex_buffer_object = GL.glGenBuffers(1)
-        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, vertex_buffer_object)
-        GL.glBufferData(GL.GL_ARRAY_BUFFER, self.vertex_data.nbytes, self.vertex_data,
-                        GL.GL_STATIC_DRAW)
-
-        self.vertex_position = self.shader_program.attributeLocation("vertexPosition")
-        self.texture_coords = self.shader_program.attributeLocation("tex_coords")
-        self.texture_framebuffer = self.shader_program.uniformLocation("texture_framebuffer")
-
-        GL.glEnableVertexAttribArray(0)
-        GL.glEnableVertexAttribArray(1)
-        GL.glVertexAttribPointer(self.vertex_position, 3, GL.GL_FLOAT, GL.GL_FALSE, 20,
-                                 None)
-
-        GL.glVertexAttribPointer(self.texture_coords, 2, GL.GL_FLOAT, GL.GL_TRUE, 20,
-                                 ctypes.c_void_p(12))
-
-        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
-        GL.glBindVertexArray(0)
+        resources = gl_resources()
+        self.shader_program = resources.program(VERTEX, FRAGMENT)
+        self.vertex_attribute_object = resources.vertex_array('screen_quad')
+        self.texture_framebuffer = resources.uniform_location(self.shader_program, "texture_framebuffer")
 
         self.create_framebuffer()
         self.initialised = True
@@ -0,0 +1,170 @@
+import atexit
+import contextlib
+import logging
+import os
+import shutil
+import subprocess
+import sys
+
+import numpy as np
+from OpenGL import GL
+from PyQt5.QtCore import QCoreApplication, Qt
+from PyQt5.QtGui import QOffscreenSurface, QOpenGLContext, QOpenGLFramebufferObject, \
+    QOpenGLFramebufferObjectFormat, QSurfaceFormat
+from PyQt5.QtWidgets import QApplication
+
+from optostim.exceptions import OptoStimException
+
+log = logging.getLogger(__name__)
+
+# Every shader in the stimulus pipeline is #version 330 core.
+GL_VERSION = (3, 3)
+XVFB_SCREEN = '1920x1080x24'
+
+
+class OffscreenRenderError(OptoStimException):
+    pass
+
+
+def use_software_opengl():
+    # Only takes effect before the first context is created. Mesa falls back to llvmpipe, Qt on Windows loads
+    # opengl32sw. Software rendering is also the only way to get the same pixels on every build box.
+    os.environ['LIBGL_ALWAYS_SOFTWARE'] = '1'
+    QCoreApplication.setAttribute(Qt.AA_UseSoftwareOpenGL)
+
+
+def start_virtual_display():
+    """Start a private Xvfb server for this process and point DISPLAY at it, it is stopped at exit."""
+    xvfb = shutil.which('Xvfb')
+    if xvfb is None:
+        raise OffscreenRenderError("Rendering without a display needs an X server for OpenGL, install Xvfb or run "
+                                   "under xvfb-run.")
+    read_fd, write_fd = os.pipe()
+    # Xvfb writes the display number it chose to displayfd once it accepts connections.
+    process = subprocess.Popen([xvfb, '-displayfd', str(write_fd), '-screen', '0', XVFB_SCREEN, '-nolisten', 'tcp'],
+                               pass_fds=(write_fd,), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as display_file:
+        display = display_file.readline().strip()
+    if not display:
+        process.terminate()
+        raise OffscreenRenderError("Xvfb exited without opening a display.")
+    os.environ['DISPLAY'] = ':' + display
+    atexit.register(process.terminate)
+    log.info("Started Xvfb on display :{}.".format(display))
+    return process
+
+
+def headless_application(argv=None, software=None):
+    """Create the QApplication for rendering without a display, before any other Qt object.
+
+    Qt 5 only makes OpenGL contexts through the window system, even its offscreen platform plugin gets them from
+    GLX on an X server. So on Linux without DISPLAY a private Xvfb is started, or OffscreenRenderError raised if
+    Xvfb is not installed. software defaults to True when there is no display to render on.
+    """
+    has_display = bool(os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'))
+    if not has_display:
+        if sys.platform.startswith('linux'):
+            start_virtual_display()
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    if software is None:
+        software = not has_display
+    if software:
+        use_software_opengl()
+    # StimulusWidget is a QWidget, so a QGuiApplication is not enough even with nothing on screen.
+    return QApplication(argv if argv is not None else [])
+
+
+def surface_format():
+    surface_format = QSurfaceFormat()
+    surface_format.setVersion(*GL_VERSION)
+    surface_format.setProfile(QSurfaceFormat.CoreProfile)
+    return surface_format
+
+
+class OffscreenRenderTarget:
+    """A core profile context on a QOffscreenSurface rendering into a framebuffer object, read back as NumPy arrays.
+
+    Anything that draws with the current context, such as StimulusWidget.paintGL or the paint_gl of Quad and
+    Crosshair, renders here unchanged, so output can be compared against golden images and timed without a screen.
+    """
+
+    def __init__(self, width, height):
+        self.context = QOpenGLContext()
+        self.context.setFormat(surface_format())
+        if not self.context.create():
+            raise OffscreenRenderError("Could not create an OpenGL {}.{} context.".format(*GL_VERSION))
+        if self.context.format().version() < GL_VERSION:
+            raise OffscreenRenderError("OpenGL {}.{} is required, the driver only gives {}.{}.".format(
+                *GL_VERSION, *self.context.format().version()))
+
+        self.surface = QOffscreenSurface()
+        self.surface.setFormat(self.context.format())
+        self.surface.create()
+        if not self.surface.isValid():
+            raise OffscreenRenderError("Could not create an offscreen surface.")
+
+        self.frame_buffer = None
+
+        with self.current():
+            log.info("Offscreen OpenGL Renderer: {}".format(GL.glGetString(GL.GL_RENDERER)))
+            self.resize(width, height)
+
+    @contextlib.contextmanager
+    def current(self):
+        if QOpenGLContext.currentContext() == self.context:
+            yield self
+            return
+        if not self.context.makeCurrent(self.surface):
+            raise OffscreenRenderError("Could not make the offscreen context current.")
+        try:
+            yield self
+        finally:
+            self.context.doneCurrent()
+
+    @property
+    def height(self):
+        return self.frame_buffer.height()
+
+    def read_pixels(self):
+        # (height, width, 3) uint8 with the top row first, the same layout as the stimulus images.
+        with self.current():
+            self.frame_buffer.bind()
+            GL.glPixelStorei(GL.GL_PACK_ALIGNMENT, 1)
+            data = GL.glReadPixels(0, 0, self.width, self.height, GL.GL_RGB, GL.GL_UNSIGNED_BYTE)
+            self.frame_buffer.release()
+        pixels = np.frombuffer(data, dtype=np.uint8).reshape(self.height, self.width, 3)
+        return np.flipud(pixels).copy()
+
+    def release(self):
+        with self.current():
+            self.frame_buffer = None
+        self.surface.destroy()
+
+    def render(self, paint, read_back=True):
+        """Call paint with the framebuffer bound and the viewport set, then return the frame."""
+        with self.current():
+            self.frame_buffer.bind()
+            GL.glViewport(0, 0, self.width, self.height)
+            paint()
+            GL.glFinish()
+            self.frame_buffer.release()
+            return self.read_pixels() if read_back else None
+
+    def render_stimulus(self, stimulus_widget):
+        # The widget is never shown. Its size drives the intensity mask and projection, so it matches the target.
+        if (stimulus_widget.width(), stimulus_widget.height()) != (self.width, self.height):
+            stimulus_widget.resize(self.width, self.height)
+        return self.render(stimulus_widget.paintGL)
+
+    def resize(self, width, height):
+        with self.current():
+            frame_buffer_format = QOpenGLFramebufferObjectFormat()
+            frame_buffer_format.setAttachment(QOpenGLFramebufferObject.CombinedDepthStencil)
+            self.frame_buffer = QOpenGLFramebufferObject(width, height, frame_buffer_format)
+            if not self.frame_buffer.isValid():
+                raise OffscreenRenderError("Could not create a {}x{} framebuffer.".format(width, height))
+
+    @property
+    def width(self):
+        return self.frame_buffer.width()
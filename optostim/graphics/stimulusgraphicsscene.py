@@ -1,9 +1,13 @@
 import logging
 
+import numpy as np
+
 from PyQt5.QtCore import Qt, QRectF
 from PyQt5.QtGui import QBrush
 from PyQt5.QtWidgets import QGraphicsScene, QGraphicsRectItem, QGraphicsItemGroup
 
+from optostim.graphics.instancedstimuluspoints import InstancedStimulusPointRenderer
+
 log = logging.getLogger(__name__)
 
 
@@ -26,6 +30,8 @@ class StimulusGraphicsScene(QGraphicsScene):
         self.addItem(self.background_image)
         self.visible_group = QGraphicsItemGroup()
         self.visible_stimuli = []
+        self.point_renderer = InstancedStimulusPointRenderer(parent=self)
+        self.point_sets = []
 
       #  self.sceneRectChanged.connect(self.on_sceneRectChanged)
 
@@ -41,10 +47,8 @@ class StimulusGraphicsScene(QGraphicsScene):
     def display_points(self, points):
         #log.debug("Adding {} to scene.".format(points))
 
-        for p in self.visible_stimuli:
-            self.removeItem(p)
-
-        self.visible_stimuli = []
+        self.display_point_set(None)
+        self.clear_visible_stimuli()
 
         for p in points:
             log.debug("Adding at {} of size {}".format(p.pos(), p.rect().width()))
@@ -53,6 +57,44 @@ class StimulusGraphicsScene(QGraphicsScene):
 
       #  self.update()
 
+    def clear_visible_stimuli(self):
+        for p in self.visible_stimuli:
+            self.removeItem(p)
+        self.visible_stimuli = []
+
+    def display_point_set(self, point_set_id):
+        # None or a negative id blanks the window.
+        if point_set_id is None or point_set_id < 0:
+            self.point_renderer.set_active(None)
+        else:
+            self.point_renderer.set_active(self.point_sets[point_set_id])
+        self.update()
+
+    def display_queued_point_set(self, queue):
+        # Only the newest id matters, older ones queued while the GUI thread was busy are skipped.
+        point_set_id = None
+        while True:
+            try:
+                point_set_id = queue.popleft()
+            except IndexError:
+                break
+        if point_set_id is not None:
+            self.display_point_set(point_set_id)
+
+    def prepare_point_sets(self, point_sets):
+        # Every point used by the program becomes one instance, each set is kept as the indices of its instances.
+        # Preview points from display_points would otherwise stay on the window for the whole run.
+        self.clear_visible_stimuli()
+        instances = {}
+        for points in point_sets:
+            for p in points:
+                instances.setdefault(p.index, (len(instances), p))
+        self.point_renderer.set_points([p for _, p in instances.values()])
+        self.point_sets = [np.array([instances[p.index][0] for p in points], dtype=np.intp) for points in point_sets]
+        self.display_point_set(None)
+        log.info("Prepared {} stimulus point sets over {} points.".format(len(self.point_sets),
+                                                                            len(self.point_renderer)))
+
     @property
     def invert(self):
         return self._invert
@@ -0,0 +1,98 @@
+import ctypes
+import logging
+
+import numpy as np
+from OpenGL import GL
+
+log = logging.getLogger(__name__)
+
+PIXEL_BUFFER_COUNT = 2
+# Internal and upload formats by channel count.
+FORMATS = {
+    1: (GL.GL_R8, GL.GL_RED),
+    3: (GL.GL_RGB8, GL.GL_RGB),
+}
+
+
+class StreamingTexture:
+    """Texture for a stream of same sized uint8 frames, single channel unless channels is 3.
+
+    Storage is allocated once per frame size and is immutable where the driver supports it. Frames are copied into
+    one of two pixel buffer objects in turn and transferred with glTexSubImage2D, so writing the next frame does not
+    wait on the transfer of the last one. Rows are uploaded as they are, top row first, so whoever samples the
+    texture flips it with the texture coordinates instead of a copy of the array.
+
+    RGB textures hold packed bit planes, so they are sampled with nearest filtering and never blend neighbouring
+    texels.
+    """
+
+    def __init__(self, channels=1):
+        self.channels = channels
+        self.pixel_buffers = []
+        self.size = None
+        self.texture = None
+        self._next_buffer = 0
+
+    def allocate(self, width, height):
+        self.release()
+        internal_format, pixel_format = FORMATS[self.channels]
+        texture_filter = GL.GL_LINEAR if self.channels == 1 else GL.GL_NEAREST
+        self.texture = GL.glGenTextures(1)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self.texture)
+        if bool(GL.glTexStorage2D):
+            GL.glTexStorage2D(GL.GL_TEXTURE_2D, 1, internal_format, width, height)
+        else:
+            GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, internal_format, width, height, 0, pixel_format,
+                            GL.GL_UNSIGNED_BYTE, None)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAX_LEVEL, 0)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, texture_filter)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, texture_filter)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_S, GL.GL_CLAMP_TO_BORDER)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_T, GL.GL_CLAMP_TO_BORDER)
+        if self.channels == 1:
+            # Sample the red channel as grey so shaders can treat it like the old luminance textures.
+            GL.glTexParameteriv(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_SWIZZLE_RGBA,
+                                np.array([GL.GL_RED, GL.GL_RED, GL.GL_RED, GL.GL_ONE], dtype=np.int32))
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+
+        self.pixel_buffers = list(np.atleast_1d(GL.glGenBuffers(PIXEL_BUFFER_COUNT)))
+        for pixel_buffer in self.pixel_buffers:
+            GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, pixel_buffer)
+            GL.glBufferData(GL.GL_PIXEL_UNPACK_BUFFER, width * height * self.channels, None, GL.GL_STREAM_DRAW)
+        GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, 0)
+
+        self.size = (width, height)
+        log.info("Allocated {}x{} {} channel stimulus texture.".format(width, height, self.channels))
+
+    def release(self):
+        if self.texture is not None:
+            GL.glDeleteTextures([self.texture])
+            GL.glDeleteBuffers(len(self.pixel_buffers), self.pixel_buffers)
+        self.pixel_buffers = []
+        self.size = None
+        self.texture = None
+
+    def upload(self, image):
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        # The pixel buffers are sized for self.channels, any other image would overrun them.
+        if image.shape[2:] != ((self.channels,) if self.channels > 1 else ()) or image.ndim < 2:
+            raise ValueError('Image of shape {} does not fit a {} channel texture.'.format(image.shape, self.channels))
+        height, width = image.shape[:2]
+        if self.size != (width, height):
+            self.allocate(width, height)
+
+        pixel_buffer = self.pixel_buffers[self._next_buffer]
+        self._next_buffer = (self._next_buffer + 1) % len(self.pixel_buffers)
+
+        GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, pixel_buffer)
+        pointer = GL.glMapBufferRange(GL.GL_PIXEL_UNPACK_BUFFER, 0, image.nbytes,
+                                      GL.GL_MAP_WRITE_BIT | GL.GL_MAP_INVALIDATE_BUFFER_BIT)
+        ctypes.memmove(pointer, image.ctypes.data, image.nbytes)
+        GL.glUnmapBuffer(GL.GL_PIXEL_UNPACK_BUFFER)
+
+        GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self.texture)
+        GL.glTexSubImage2D(GL.GL_TEXTURE_2D, 0, 0, 0, width, height, FORMATS[self.channels][1],
+                           GL.GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, 0)
@@ -19,7 +19,7 @@ from optostim.optostim_main_window import OptoStimMainWindow
 from pyjohnstonlab.devices.exceptions import DeviceException
 from pyjohnstonlab.excepthooks import ExceptHook
 
-REQUIRED_PYTHON_VERSION = (3, 6)
+REQUIRED_PYTHON_VERSION = (3, 7)
 
 # Turn off PyQt5 debug logging as spams the console.
 logging.getLogger("PIL").setLevel(logging.WARNING)
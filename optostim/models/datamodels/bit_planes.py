@@ -0,0 +1,120 @@
+import numpy as np
+
+from optostim.exceptions import OptoStimValueError
+
+BITS_PER_CHANNEL = 8
+PLANES_PER_FRAME = 3 * BITS_PER_CHANNEL
+# DMD controllers in pattern on the fly mode (TI DLPC350/DLPC900) number the bit planes of a 24 bit input frame
+# G0-G7, R0-R7, B0-B7, so the first eight patterns go in the green channel.
+CHANNEL_ORDER = (1, 0, 2)
+
+# One row per binary pattern in display order. exposure_us is how long the pattern is shown for, wait_for_trigger
+# makes the DMD hold the pattern until the next external trigger, as a wait element does for the LabJack.
+PATTERN_DTYPE = np.dtype([
+    ('frame', np.int32),
+    ('plane', np.int8),
+    ('loop', np.int32),
+    ('iteration', np.int32),
+    ('exposure_us', np.int64),
+    ('wait_for_trigger', np.bool_),
+    ('dark', np.bool_),
+])
+
+
+def pack_bit_planes(planes, threshold=0):
+    """Packs up to 24 binary frames into one (height, width, 3) uint8 RGB frame.
+
+    Pixels above threshold are on. Plane i goes in bit i % 8 of channel CHANNEL_ORDER[i // 8], unused planes are off.
+    """
+    planes = np.asarray(planes)
+    if planes.ndim != 3 or not 0 < len(planes) <= PLANES_PER_FRAME:
+        raise OptoStimValueError('Between 1 and {} frames can be packed, got an array of shape {}.'.format(
+            PLANES_PER_FRAME, planes.shape))
+    count, height, width = planes.shape
+    bits = np.zeros((PLANES_PER_FRAME, height, width), dtype=bool)
+    np.greater(planes, threshold, out=bits[:count])
+    packed = np.packbits(bits.reshape(3, BITS_PER_CHANNEL, height, width), axis=1, bitorder='little')[:, 0]
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    for index, channel in enumerate(CHANNEL_ORDER):
+        frame[..., channel] = packed[index]
+    return frame
+
+
+def unpack_bit_planes(frame, count=PLANES_PER_FRAME):
+    # Inverse of pack_bit_planes, (count, height, width) bool.
+    height, width = frame.shape[:2]
+    channels = np.stack([frame[..., channel] for channel in CHANNEL_ORDER])
+    bits = np.unpackbits(channels[:, np.newaxis], axis=1, bitorder='little')
+    return bits.reshape(PLANES_PER_FRAME, height, width)[:count].astype(bool)
+
+
+class BitPlaneSequence:
+    """Unique binary protocol frames packed 24 to an RGB frame, with the timing of every pattern for the DMD sequencer.
+
+    Plane 0 of frame 0 is always dark. patterns has one PATTERN_DTYPE row per bit plane shown, in order, each
+    referring to the frame and plane that hold it, so a frame shown many times is packed once. A frame switch on the
+    DMD costs no display refresh and the pattern rate is set by the exposures rather than the 60 Hz of the stimulus
+    window.
+    """
+
+    def __init__(self, frames, patterns):
+        self.frames = frames
+        self.patterns = patterns
+
+    def __len__(self):
+        return len(self.frames)
+
+    @staticmethod
+    def packed_bytes(count, shape):
+        # Size of the packed frames for count unique frames of shape (height, width) and the dark plane.
+        height, width = shape
+        return -(-(count + 1) // PLANES_PER_FRAME) * height * width * 3
+
+    @classmethod
+    def build(cls, frames, layer_table, exposures_us, waits, inter_loop_delay_us=0, threshold=0):
+        """Packs the unique frames and lays out the patterns of every loop.
+
+        layer_table gives the index into frames shown at each loop and iteration, -1 for a dark pattern. An inter
+        loop delay adds a dark pattern at the end of each loop with iteration -1.
+        """
+        shape = frames[0].shape if frames else (0, 0)
+        for index, frame in enumerate(frames):
+            if frame.shape != shape:
+                raise OptoStimValueError('Frame {} is {}, expected {}.'.format(index, frame.shape, shape))
+        planes = [np.zeros(shape, dtype=np.uint8)] + list(frames)
+        packed = [pack_bit_planes(planes[start:start + PLANES_PER_FRAME], threshold)
+                  for start in range(0, len(planes), PLANES_PER_FRAME)]
+
+        loops, iterations = layer_table.shape
+        exposures_us = list(exposures_us)
+        waits = list(waits)
+        iteration_numbers = list(range(iterations))
+        if inter_loop_delay_us > 0:
+            exposures_us.append(inter_loop_delay_us)
+            waits.append(False)
+            iteration_numbers.append(-1)
+        per_loop = len(iteration_numbers)
+        slots = np.zeros((loops, per_loop), dtype=np.int64)
+        slots[:, :iterations] = layer_table + 1
+        slots = slots.ravel()
+
+        patterns = np.empty(loops * per_loop, dtype=PATTERN_DTYPE)
+        patterns['frame'] = slots // PLANES_PER_FRAME
+        patterns['plane'] = slots % PLANES_PER_FRAME
+        patterns['loop'] = np.repeat(np.arange(loops), per_loop)
+        patterns['iteration'] = np.tile(iteration_numbers, loops)
+        patterns['exposure_us'] = np.tile(np.asarray(exposures_us, dtype=np.int64), loops)
+        patterns['wait_for_trigger'] = np.tile(np.asarray(waits, dtype=bool), loops)
+        patterns['dark'] = slots == 0
+        return cls(packed, patterns)
+
+    def frame_table(self, loops, iterations):
+        # Packed frame holding the pattern of each loop and iteration.
+        table = np.full((loops, iterations), -1, dtype=np.int32)
+        shown = self.patterns[self.patterns['iteration'] >= 0]
+        table[shown['loop'], shown['iteration']] = shown['frame']
+        return table
+
+    @property
+    def duration_us(self):
+        return int(self.patterns['exposure_us'].sum())
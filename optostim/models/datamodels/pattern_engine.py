@@ -0,0 +1,47 @@
+import numpy as np
+
+from optostim.exceptions import OptoStimValueError
+from optostim.models.datamodels.patterns.increment_by_one_pattern import IncrementByOnePattern
+from optostim.models.datamodels.patterns.random_pattern import RandomPattern
+
+
+class PatternEngine:
+    """Stimulus point indices for whole blocks of loops, computed as numpy index arrays.
+
+    Points with NormalPattern stay where they are. The other points of an element move through the points the
+    normal ones leave free: one free position per loop for IncrementByOnePattern, or a new draw without replacement
+    every loop for RandomPattern. Each block of loops has its own seeded generator so it can be recomputed alone.
+    """
+
+    def __init__(self, point_count, elements, pattern, seed=None):
+        # elements holds (normal indices, patterned indices) for each element of the initial sequence.
+        self.pattern = pattern
+        self.seed = seed if seed is not None else np.random.SeedSequence().entropy
+        self.free = []
+        self.starts = []
+        for normal, patterned in elements:
+            free = np.setdiff1d(np.arange(point_count), np.asarray(normal, dtype=np.intp))
+            if len(patterned) > len(free):
+                raise OptoStimValueError('Not enough free stimulus points for {} patterned points.'.format(
+                    len(patterned)))
+            self.free.append(free)
+            # Loop 1 moves each point to the next free index after it, every later loop moves one free index on.
+            self.starts.append(np.searchsorted(free, np.asarray(patterned, dtype=np.intp), side='right'))
+
+    def block(self, index, size):
+        """Point indices for loops index * size to (index + 1) * size - 1, one (size, patterned) array per element."""
+        loops = np.arange(index * size, (index + 1) * size)
+        generator = np.random.default_rng([self.seed, index])
+        assignments = []
+        for free, starts in zip(self.free, self.starts):
+            if not len(starts):
+                assignments.append(np.empty((size, 0), dtype=np.intp))
+            elif self.pattern == IncrementByOnePattern:
+                assignments.append(free[(starts[np.newaxis, :] + loops[:, np.newaxis] - 1) % len(free)])
+            elif self.pattern == RandomPattern:
+                keys = generator.random((size, len(free)))
+                chosen = np.argpartition(keys, len(starts) - 1, axis=1)[:, :len(starts)]
+                assignments.append(free[chosen])
+            else:
+                raise NotImplementedError('No pattern rules for this pattern exist')
+        return assignments
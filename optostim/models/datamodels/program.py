@@ -1,167 +1,240 @@
 import logging
-import random
+import threading
+from collections import OrderedDict
 
-import cv2
 import datetime
 import numpy as np
 from PyQt5.QtGui import QImage, qRgb
 
-from optostim.models.datamodels.patterns.increment_by_one_pattern import IncrementByOnePattern
+from optostim.exceptions import OptoStimValueError
+from optostim.models.datamodels.bit_planes import BitPlaneSequence
 from optostim.models.datamodels.patterns.normal_pattern import NormalPattern
-from optostim.models.datamodels.patterns.random_pattern import RandomPattern
+from optostim.models.datamodels.pattern_engine import PatternEngine
 from optostim.models.datamodels.protocol_element import ProtocolElement
+from optostim.models.datamodels.protocol_frames import FrameCache, frame_key, gaussian_parameters, point_rects, \
+    render_frame, stimulus_rects
 from optostim.models.datamodels.selected_stimulus_point import SelectedStimulusPoint
-from pyjohnstonlab.curves import Gaussian
+from pyjohnstonlab.threading.scheduler import Timeline
 
 log = logging.getLogger(__name__)
 
 grey_colour_table = [qRgb(i, i, i) for i in range(256)]
 
+# Loops are built on demand from blocks of BLOCK_SIZE loops of pattern engine output. The last WINDOW_SIZE built
+# loops are kept.
+BLOCK_SIZE = 256
+WINDOW_SIZE = 8
+
 
 class Program(object):
 
     def __init__(self, image_stack, initial_sequence, pattern, random_seed, stimulus_points, stimulus_widget, loop_count=1,
-                 inter_loop_delay=0.0):
-        self.images = []
+                 inter_loop_delay=0.0, frame_cache=None):
+        self.frame_cache = frame_cache if frame_cache is not None else FrameCache()
+        self.frame_keys = []
         self.stimulus_points = stimulus_points
         self.initial_sequence = initial_sequence
         self.ild = inter_loop_delay
         self.loop_count = loop_count
         self.image_stack = image_stack
-        self.program = None
         self.pattern = pattern
+        self.random_seed = random_seed
         self.stimulus_widget = stimulus_widget
-
-        random.seed(random_seed)
+        self.element_ids = None
+        self._point_sets = None
+        self._render_arguments = None
+        self._engine = None
+        self._blocks = OrderedDict()
+        self._window = OrderedDict()
+        self._lock = threading.Lock()
 
     def __iter__(self):
-        return iter(self.program)
+        for i in range(len(self)):
+            yield self[i]
 
     def __len__(self):
-        return len(self.program)
+        return self.loop_count if self._engine is not None else 0
 
     def __getitem__(self, item):
-        return self.program[item]
-
-    def create_new_protocol_sequence(self, previous_protocol_sequence):
-        new_protocol_sequence = []
-
-        for protocol_element in previous_protocol_sequence:
-            new_protocol_sequence.append(self.new_protocol_element_from_previous(protocol_element))
-
-        return new_protocol_sequence
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(len(self)))]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError('Program loop {} out of range.'.format(item))
+        with self._lock:
+            return self._loop(item)
+
+    def _loop(self, loop):
+        if loop == 0:
+            return self.initial_sequence
+        if loop not in self._window:
+            self._window[loop] = self._build(loop)
+            while len(self._window) > WINDOW_SIZE:
+                self._window.popitem(last=False)
+        self._window.move_to_end(loop)
+        return self._window[loop]
+
+    def _block(self, index):
+        if index not in self._blocks:
+            self._blocks[index] = self._engine.block(index, BLOCK_SIZE)
+            while len(self._blocks) > 2:
+                self._blocks.popitem(last=False)
+        return self._blocks[index]
+
+    def _build(self, loop):
+        assignments = self._block(loop // BLOCK_SIZE)
+        row = loop % BLOCK_SIZE
+        sequence = []
+        for protocol_element, indices in zip(self.initial_sequence, assignments):
+            normal_points = [point for point in protocol_element.stimulus_points if point.pattern == NormalPattern]
+            patterned_points = [point for point in protocol_element.stimulus_points if point.pattern != NormalPattern]
+
+            points_to_add = [SelectedStimulusPoint(stimulus_point=point.stimulus_point, pattern=point.pattern)
+                             for point in normal_points]
+            points_to_add.extend(SelectedStimulusPoint(stimulus_point=self.stimulus_points[index], pattern=point.pattern)
+                                 for point, index in zip(patterned_points, indices[row]))
+            points_to_add.sort(key=lambda p: p.stimulus_point.index)
+
+            new_element = ProtocolElement()
+            new_element.stimulus_points = points_to_add
+            new_element.laser = protocol_element.laser
+            new_element.pmt = protocol_element.pmt
+            new_element.sync = protocol_element.sync
+            new_element.wait = protocol_element.wait
+            new_element.duration = protocol_element.duration
+            sequence.append(new_element)
+        return sequence
+
+    def bit_plane_sequence(self, threshold=0, max_bytes=None):
+        """The program's unique frames as binary DMD patterns, 24 to an RGB frame, see BitPlaneSequence.
+
+        generate_images must have been run first, without an intensity mask as each pattern is a single bit. The
+        inter loop delay becomes a dark pattern at the end of each loop with iteration -1. Raises before packing if
+        the packed frames would take more than max_bytes.
+        """
+        if not self.frame_keys:
+            raise OptoStimValueError('Images must be generated before packing bit planes.')
+        if self._render_arguments.get('gaussian') is not None:
+            raise OptoStimValueError('Bit planes are binary, images must be generated without an intensity mask.')
+        frames, layer_table = self.resident_frames()
+        required = BitPlaneSequence.packed_bytes(len(frames), frames[0].shape)
+        if max_bytes is not None and required > max_bytes:
+            raise OptoStimValueError('{:.1f} MB of bit plane frames does not fit in the {:.1f} MB texture '
+                                     'budget.'.format(required / 1e6, max_bytes / 1e6))
+        exposures = np.rint(np.array([element.duration for element in self.initial_sequence]) * 1e6).astype(np.int64)
+        waits = [element.wait for element in self.initial_sequence]
+        return BitPlaneSequence.build(frames, layer_table, exposures, waits, int(round(self.ild * 1e6)), threshold)
+
+    def compile_timeline(self):
+        # Durations and waits are carried over unchanged from the initial sequence to every generated loop.
+        durations = [element.duration for element in self.initial_sequence]
+        waits = [element.wait for element in self.initial_sequence]
+        return Timeline(durations=durations, waits=waits, loop_count=len(self), inter_loop_delay=self.ild)
 
     def generate(self):
-        self.program = [self.initial_sequence]
-        for i in range(1, self.loop_count):
-            new_protocol_sequence = self.create_new_protocol_sequence(self.program[i - 1])
-            self.program.append(new_protocol_sequence)
-        # self.generate_images()
+        # Only sets up the pattern engine, loops are created as they are indexed or iterated.
+        elements = []
+        for protocol_element in self.initial_sequence:
+            elements.append(([point.index() for point in protocol_element.stimulus_points
+                              if point.pattern == NormalPattern],
+                             [point.index() for point in protocol_element.stimulus_points
+                              if point.pattern != NormalPattern]))
+        self.element_ids = None
+        self._point_sets = None
+        self._render_arguments = None
+        self.frame_keys = []
+        with self._lock:
+            self._blocks.clear()
+            self._window.clear()
+            self._engine = PatternEngine(point_count=len(self.stimulus_points), elements=elements, pattern=self.pattern,
+                                         seed=self.random_seed)
+
+    def point_sets(self):
+        """Numbers every unique set of stimulus points in the program.
+
+        Worked out from the pattern engine a block of loops at a time, without building the loops. Fills element_ids
+        with the number for each loop and iteration, -1 for elements without points, and returns the point sets in
+        order of their numbers.
+        """
+        ids = {}
+        self.element_ids = np.full((len(self), self.iterations), -1, dtype=np.int32)
+        normal = [np.array([point.index() for point in element.stimulus_points if point.pattern == NormalPattern],
+                           dtype=np.intp) for element in self.initial_sequence]
+        initial = [np.array([point.index() for point in element.stimulus_points], dtype=np.intp)
+                   for element in self.initial_sequence]
+        for start in range(0, len(self), BLOCK_SIZE):
+            stop = min(start + BLOCK_SIZE, len(self))
+            assignments = self._engine.block(start // BLOCK_SIZE, BLOCK_SIZE)
+            for iteration, (fixed, patterned) in enumerate(zip(normal, assignments)):
+                if not initial[iteration].size:
+                    continue
+                rows = np.hstack([np.broadcast_to(fixed, (BLOCK_SIZE, fixed.size)), patterned])[:stop - start]
+                if start == 0:
+                    # Loop 0 is the initial sequence itself, not the pattern engine's first row.
+                    rows[0] = initial[iteration]
+                rows.sort(axis=1)
+                unique, inverse = np.unique(rows, axis=0, return_inverse=True)
+                numbers = np.array([ids.setdefault(tuple(row), len(ids)) for row in unique.tolist()], dtype=np.int32)
+                self.element_ids[start:stop, iteration] = numbers[inverse.reshape(-1)]
+        self._point_sets = [[self.stimulus_points[index] for index in key] for key in ids]
+        return self._point_sets
+
+    def prefetch(self, loop):
+        if loop < len(self):
+            self[loop]
 
     def generate_image(self, loop, iteration, intensity_mask):
+        rects = stimulus_rects(self.program[loop][iteration].stimulus_points)
+        return render_frame(rects, **self.render_arguments(intensity_mask))
+
+    def generate_images(self, render_arguments, progress=None):
+        # One frame per point set, so the loops are never built here either.
+        if self._point_sets is None:
+            self.point_sets()
+        rect_sets = [point_rects(points) for points in self._point_sets]
+        self.frame_cache.render(rect_sets, render_arguments, progress=progress)
+        self._render_arguments = render_arguments
+        self.frame_keys = [frame_key(rects) for rects in rect_sets]
+
+    def resident_frames(self):
+        """Unique rendered frames and the layer each loop and iteration shows, -1 for elements without a frame.
+
+        For uploading everything to the GPU at once, generate_images must have been run first.
+        """
+        layers = {}
+        frames = []
+        set_layers = np.empty(len(self.frame_keys), dtype=np.int32)
+        for point_set_id, key in enumerate(self.frame_keys):
+            if key not in layers:
+                layers[key] = len(frames)
+                frames.append(self.frame_cache[key])
+            set_layers[point_set_id] = layers[key]
+        layer_table = np.full(self.element_ids.shape, -1, dtype=np.int32)
+        has_frame = self.element_ids >= 0
+        layer_table[has_frame] = set_layers[self.element_ids[has_frame]]
+        return frames, layer_table
 
-        selected_stimulus_points = self.program[loop][iteration].stimulus_points
-
-        if not selected_stimulus_points:
+    def get_image(self, loop, iteration):
+        if not self.frame_keys or self.element_ids[loop, iteration] < 0:
             return None
+        return self.frame_cache[self.frame_keys[self.element_ids[loop, iteration]]]
+
+    def render_arguments(self, intensity_mask, width=None, height=None):
+        # Widget geometry is read here, on the GUI thread, so rendering itself never touches the widget.
+        gaussian = gaussian_parameters(intensity_mask)
+        return {
+            'fov': self.image_stack.fov,
+            'width': width if width else self.stimulus_widget.width(),
+            'height': height if height else self.stimulus_widget.height(),
+            'gaussian': gaussian,
+            'mask_shape': tuple(intensity_mask.shape) if gaussian else None
+        }
 
-        img = np.zeros((int(self.image_stack.fov), int(self.image_stack.fov)))
-        default_stimulus_colour = 255
-        half_dimension_difference = 0.5 * abs(self.stimulus_widget.width() - self.stimulus_widget.height())
-        position_translation = [0.0, 0.0]
-        position_translation[
-            0 if self.stimulus_widget.width() > self.stimulus_widget.height() else 1] = half_dimension_difference
-
-        shortest_scale = min(self.stimulus_widget.width() / self.image_stack.fov,
-                             self.stimulus_widget.height() / self.image_stack.fov)
-
-        translation_matrix = np.float32([[1, 0, position_translation[0]],
-                                         [0, 1, position_translation[1]]])
-
-        # translation_matrix = np.float32([[shortest_scale, 0, position_translation[0]],
-        #                                  [0, shortest_scale, position_translation[1]]])
-        # todo - make sure they clip if off the edge? homography probably sorts all this.
-        #  Stimulus point positions are not in pixels!
-
-        for selected_stimulus_point in selected_stimulus_points:
-            stimulus_point = selected_stimulus_point.stimulus_point
-            top_left = (int(round(stimulus_point.top_left[0])),
-                        int(round((stimulus_point.top_left[1]))))
-            bottom_right = (int(round(stimulus_point.bottom_right[0])),
-                            int(round(stimulus_point.bottom_right[1])))
-            cv2.rectangle(img, top_left, bottom_right, default_stimulus_colour, cv2.FILLED)
-
-        img = cv2.resize(img, None, fx=shortest_scale, fy=shortest_scale, interpolation=cv2.INTER_NEAREST)
-
-        if intensity_mask.is_set:
-            gaussian = intensity_mask.gaussian_fit
-            gaussian_scale = min(self.stimulus_widget.width() / intensity_mask.shape[0],
-                                 self.stimulus_widget.height() / intensity_mask.shape[1])
-            transformed_gaussian = Gaussian(amplitude=gaussian.amplitude,
-                                            width_x=gaussian_scale*gaussian.width_x,
-                                            width_y=gaussian_scale*gaussian.width_y,
-                                            rotation=gaussian.rotation,
-                                            x0=gaussian_scale*gaussian.x0,
-                                            y0=gaussian_scale*gaussian.y0
-                                            )
-            meshgrid = np.meshgrid(np.arange(img.shape[0]), np.arange(img.shape[1]))
-            mask = transformed_gaussian.func()(meshgrid[1], meshgrid[0])
-            img = img * (1.0 - mask / mask.max())
-
-        img = cv2.warpAffine(img, translation_matrix,
-                                 (self.stimulus_widget.width(), self.stimulus_widget.height()))
-        img = cv2.flip(img, 0)
-        return img
-
-    def generated_sequences(self):
-        generated_length = len(self.program) - 1
-        return self.program[-generated_length:] if generated_length > 0 else []
-
-    def get_image(self, loop, iteration):
-        return self.images[loop][iteration] if self.images else None
+    @property
+    def program(self):
+        return self
 
     @property
     def iterations(self):
-        return len(self.program[0]) if self.program else 0
-
-    def new_protocol_element_from_previous(self, protocol_element):
-
-        points_to_add = []
-        used_stimulus_points = []
-        patterned_points = []
-
-        for point in protocol_element.stimulus_points:
-            if point.pattern == NormalPattern:
-                points_to_add.append(SelectedStimulusPoint(stimulus_point=point.stimulus_point, pattern=point.pattern))
-                used_stimulus_points.append(point.stimulus_point)
-            else:
-                patterned_points.append(point)
-
-        for point in patterned_points:
-            if self.pattern == IncrementByOnePattern:
-                found = False
-                for i in range(0, len(self.stimulus_points)):
-                    next_stimulus_point = self.stimulus_points[(point.index() + 1 + i) % len(self.stimulus_points)]
-                    if next_stimulus_point not in used_stimulus_points:
-                        found = True
-                        break
-                assert found, "No stimulus point could be found to increment to"
-            elif self.pattern == RandomPattern:
-                next_stimulus_point = random.choice([point for point in self.stimulus_points if point not in used_stimulus_points])
-                pass
-            else:
-                raise NotImplementedError('No pattern rules for this pattern exist')
-            points_to_add.append(SelectedStimulusPoint(stimulus_point=next_stimulus_point, pattern=point.pattern))
-            used_stimulus_points.append(next_stimulus_point)
-
-        points_to_add.sort(key=lambda p: p.stimulus_point.index)
-
-        new_element = ProtocolElement()
-        new_element.stimulus_points = points_to_add
-        new_element.laser = protocol_element.laser
-        new_element.pmt = protocol_element.pmt
-        new_element.sync = protocol_element.sync
-        new_element.wait = protocol_element.wait
-        new_element.duration = protocol_element.duration
-
-        return new_element
+        return len(self.initial_sequence) if len(self) else 0
@@ -0,0 +1,173 @@
+import functools
+import hashlib
+import logging
+import math
+import multiprocessing
+
+import numpy as np
+
+from pyjohnstonlab.curves import Gaussian
+
+log = logging.getLogger(__name__)
+
+DEFAULT_STIMULUS_COLOUR = 255
+RENDER_CHUNK_SIZE = 8
+# Fewer missing frames than this are rendered in the calling thread, a pool is not worth starting for them.
+IN_PROCESS_FRAMES = 64
+
+
+def stimulus_rects(selected_stimulus_points):
+    return point_rects(selected_stimulus_point.stimulus_point for selected_stimulus_point in selected_stimulus_points)
+
+
+def point_rects(stimulus_points):
+    rects = []
+    for stimulus_point in stimulus_points:
+        rects.append((int(round(stimulus_point.top_left[0])), int(round(stimulus_point.top_left[1])),
+                      int(round(stimulus_point.bottom_right[0])), int(round(stimulus_point.bottom_right[1]))))
+    return tuple(sorted(rects))
+
+
+def frame_key(rects):
+    return hashlib.sha1(np.asarray(rects, dtype=np.int32).tobytes()).hexdigest()
+
+
+def gaussian_parameters(intensity_mask):
+    if not intensity_mask or not intensity_mask.is_set:
+        return None
+    gaussian = intensity_mask.gaussian_fit
+    return gaussian.amplitude, gaussian.x0, gaussian.y0, gaussian.width_x, gaussian.width_y, gaussian.rotation
+
+
+def frame_transform(fov, width, height):
+    # Scale of the fov onto the window, the size of the scaled fov and where it is centred in the window.
+    scale = min(width / fov, height / fov)
+    size = int(round(fov * scale))
+    offset_x = int(0.5 * (width - height)) if width > height else 0
+    offset_y = int(0.5 * (height - width)) if height > width else 0
+    return scale, size, offset_x, offset_y
+
+
+@functools.lru_cache(maxsize=4)
+def intensity_tile(fov, width, height, gaussian=None, mask_shape=None):
+    """Window sized uint8 frame with every stimulated pixel at full brightness after the intensity mask.
+
+    Frames are rendered by copying rectangles out of this, so the mask is only evaluated once per geometry.
+    """
+    scale, size, offset_x, offset_y = frame_transform(fov, width, height)
+    rows = min(size, height - offset_y)
+    columns = min(size, width - offset_x)
+
+    if gaussian is not None:
+        amplitude, x0, y0, width_x, width_y, rotation = gaussian
+        gaussian_scale = min(width / mask_shape[0], height / mask_shape[1])
+        transformed_gaussian = Gaussian(amplitude=amplitude,
+                                        width_x=gaussian_scale * width_x,
+                                        width_y=gaussian_scale * width_y,
+                                        rotation=rotation,
+                                        x0=gaussian_scale * x0,
+                                        y0=gaussian_scale * y0
+                                        )
+        mask = transformed_gaussian.func()(np.arange(size)[:, np.newaxis], np.arange(size)[np.newaxis, :])
+        values = np.round(DEFAULT_STIMULUS_COLOUR * (1.0 - mask / mask.max())).astype(np.uint8)[:rows, :columns]
+    else:
+        values = DEFAULT_STIMULUS_COLOUR
+
+    tile = np.zeros((height, width), dtype=np.uint8)
+    tile[offset_y:offset_y + rows, offset_x:offset_x + columns] = values
+    tile = np.ascontiguousarray(tile[::-1])
+    tile.setflags(write=False)
+    return tile
+
+
+def render_frame(rects, fov, width, height, gaussian=None, mask_shape=None):
+    # Module level so it can be sent to a process pool, only takes plain data. gaussian is the tuple from
+    # gaussian_parameters so that render arguments compare by value.
+    # Rectangles are mapped straight to window pixels: fov pixel p covers scaled pixels [ceil(p * scale),
+    # ceil((p + 1) * scale)), which are then offset to centre the fov and flipped vertically.
+    if not rects:
+        return None
+
+    scale, size, offset_x, offset_y = frame_transform(fov, width, height)
+    tile = intensity_tile(fov, width, height, gaussian, mask_shape)
+    frame = np.zeros((height, width), dtype=np.uint8)
+    last = int(fov) - 1
+
+    for x0, y0, x1, y1 in rects:
+        x0, x1 = max(min(x0, x1), 0), min(max(x0, x1), last)
+        y0, y1 = max(min(y0, y1), 0), min(max(y0, y1), last)
+        if x0 > x1 or y0 > y1:
+            continue
+        column_start = max(math.ceil(x0 * scale) + offset_x, 0)
+        column_end = min(min(math.ceil((x1 + 1) * scale), size) + offset_x, width)
+        row_start = max(height - min(math.ceil((y1 + 1) * scale), size) - offset_y, 0)
+        row_end = min(height - math.ceil(y0 * scale) - offset_y, height)
+        frame[row_start:row_end, column_start:column_end] = tile[row_start:row_end, column_start:column_end]
+    return frame
+
+
+def _render_keyed(arguments):
+    key, rects, render_arguments = arguments
+    return key, render_frame(rects, **render_arguments)
+
+
+class FrameCache:
+    """Rendered protocol frames keyed by the hash of their stimulus rectangles.
+
+    Identical point sets, wherever they appear in the program, are rendered once and share one array. The cache
+    is dropped whenever the render geometry or intensity mask changes. Larger renders go to a process pool that is
+    started the first time it is needed and kept until close, as starting processes is slow on Windows.
+    """
+
+    def __init__(self, processes=None):
+        self.frames = {}
+        self.processes = processes
+        self._pool = None
+        self._render_arguments = None
+
+    def __contains__(self, key):
+        return key in self.frames
+
+    def __getitem__(self, key):
+        return self.frames[key]
+
+    def __len__(self):
+        return len(self.frames)
+
+    def clear(self):
+        self.frames = {}
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def render(self, rect_sets, render_arguments, progress=None):
+        if render_arguments != self._render_arguments:
+            self.clear()
+            self._render_arguments = render_arguments
+
+        missing = {}
+        for rects in rect_sets:
+            key = frame_key(rects)
+            if key not in self.frames and key not in missing:
+                missing[key] = rects
+
+        log.info("Rendering {} frames, {} cached.".format(len(missing), len(self.frames)))
+        if not missing:
+            if progress:
+                progress(1.0)
+            return
+
+        tasks = [(key, rects, render_arguments) for key, rects in missing.items()]
+        if len(tasks) < IN_PROCESS_FRAMES:
+            rendered = map(_render_keyed, tasks)
+        else:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(processes=self.processes)
+            rendered = self._pool.imap_unordered(_render_keyed, tasks, chunksize=RENDER_CHUNK_SIZE)
+        for i, (key, frame) in enumerate(rendered):
+            self.frames[key] = frame
+            if progress:
+                progress((i + 1) / len(tasks))
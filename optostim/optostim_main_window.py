@@ -94,7 +94,8 @@ class OptoStimMainWindow(QMainWindow):
                                             labjack_states=self.dependencies.labjack_states,
                                             parent=self)
         self.respiration_widget = RespirationRateWidget(take_ft_at_seconds=20.0)
-        self.protocol_design_widget = ProtocolDesignWidget(image_stack=self.dependencies.image_stack,
+        self.protocol_design_widget = ProtocolDesignWidget(camera=self.dependencies.camera,
+                                                           image_stack=self.dependencies.image_stack,
                                                            intensity_mask=self.dependencies.intensity_mask,
                                                            labjack=self.dependencies.labjack,
                                                            stimulus_points=self.dependencies.stimulus_points,
@@ -189,6 +190,7 @@ class OptoStimMainWindow(QMainWindow):
     def closeEvent(self, event):
         super().closeEvent(event)
         QApplication.closeAllWindows()
+        self.protocol_design_widget.frame_cache.close()
         # self.clean_up()
         QApplication.quit()
         event.accept()
@@ -0,0 +1,79 @@
+import logging
+import threading
+import time
+
+from PyQt5.QtCore import pyqtSignal, QThread
+
+from pyjohnstonlab.threading.scheduler import now_ns
+from pyjohnstonlab.threading.thread_worker import ThreadWorker
+from pyjohnstonlab.thirdparty.mmcorepy import MMCorePy
+
+log = logging.getLogger(__name__)
+
+# Seconds to sleep when the sequence buffer is empty, well under a frame at any exposure we use.
+POLL_INTERVAL = 0.001
+
+
+class CameraAcquisitionWorker(ThreadWorker):
+    """Drains the MMCore sequence buffer with popNextImage as fast as the camera fills it, into a FrameRingBuffer.
+
+    frameAcquired is emitted from the acquisition thread with every BufferedFrame, held until the slot returns, so
+    connect with Qt.DirectConnection and do as little as possible in it. The frame timestamp is perf_counter_ns when
+    it was popped. frameReady tells the GUI there is a new latest frame, it is only emitted again after acknowledge()
+    so a slow consumer never queues up events.
+    """
+
+    frameAcquired = pyqtSignal(object)
+    frameReady = pyqtSignal()
+    error = pyqtSignal(str)
+
+    def __init__(self, mmc, frame_buffer, poll_interval=POLL_INTERVAL):
+        super().__init__()
+        self._mmc = mmc
+        self.frame_buffer = frame_buffer
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.overflows = 0
+        self.running = True
+        self._pending = False
+
+    def do_work(self):
+        current_thread = QThread.currentThread()
+        while self.running and not current_thread.isInterruptionRequested():
+            try:
+                remaining = self._mmc.getRemainingImageCount()
+                if not remaining:
+                    if self._mmc.isBufferOverflowed():
+                        self.overflows += 1
+                        log.warning("Camera sequence buffer overflowed after frame {}.".format(
+                            self.frame_buffer.next_sequence))
+                        self._mmc.clearCircularBuffer()
+                    time.sleep(self.poll_interval)
+                    continue
+                for _ in range(remaining):
+                    self.publish(self._mmc.popNextImage(), now_ns())
+            except MMCorePy.CMMError as error:
+                log.warning(error)
+                self.error.emit(str(error))
+                return False
+        return True
+
+    def acknowledge(self):
+        with self.lock:
+            self._pending = False
+
+    def publish(self, image, timestamp):
+        frame = self.frame_buffer.write(image, timestamp)
+        if frame is None:
+            log.debug("Every frame buffer slot is held, frame dropped.")
+            return
+        with frame:
+            self.frameAcquired.emit(frame)
+        with self.lock:
+            notify = not self._pending
+            self._pending = True
+        if notify:
+            self.frameReady.emit()
+
+    def stop(self):
+        self.running = False
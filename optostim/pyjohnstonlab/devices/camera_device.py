@@ -1,12 +1,15 @@
 import logging
 
-import cv2
 import numpy as np
 import os
 import pandas as pd
-from PyQt5.QtCore import QObject, pyqtSignal, QTimer
+from PyQt5.QtCore import QObject, pyqtSignal, Qt, QThread
 
+from pyjohnstonlab.devices.camera_acquisition import CameraAcquisitionWorker
+from pyjohnstonlab.devices.camera_recorder import CameraRecordingWorker
 from pyjohnstonlab.devices.exceptions import DeviceException
+from pyjohnstonlab.devices.frame_ring_buffer import FrameRingBuffer
+from pyjohnstonlab.devices.homography_warp import DEFAULT_OUTPUT_SIZE, HomographyWarp
 from pyjohnstonlab.mixins import JSONPickleMixin
 from pyjohnstonlab.thirdparty.mmcorepy import MMCorePy
 
@@ -65,18 +68,28 @@ class CameraDevice(QObject):
     _mmc = None
 
     homographyMatrixChanged = pyqtSignal(np.ndarray)
+    # Newest frame for display, emitted on the GUI thread. The array is a ring slot, or the homography warp output
+    # buffer, and both are rewritten by later frames. Slots must copy anything they keep past the emit.
     newFrameReceived = pyqtSignal(np.ndarray)
+    # Every BufferedFrame, emitted from the acquisition thread. Use Qt.DirectConnection to keep up with the camera.
+    frameAcquired = pyqtSignal(object)
     initialised = pyqtSignal()
+    # path, frames recorded and frames missed.
+    recordingFinished = pyqtSignal(str, int, int)
     device_disconnected = pyqtSignal()
     exposure_changed = pyqtSignal(float)
     gainChanged = pyqtSignal(float)
 
-    def __init__(self, interval=250, parent=None):
+    # interval is the ms between frames asked of the camera, 0 runs it at its own rate.
+    def __init__(self, interval=0, warp_size=DEFAULT_OUTPUT_SIZE, parent=None):
         super().__init__(parent)
         self._homography_matrix = np.identity(3)
+        # Output (width, height) of homography_warp can be changed at any time, e.g. to keep up at full frame rate.
+        self.homography_warp = HomographyWarp(self._homography_matrix, output_size=warp_size)
+        self.homographyMatrixChanged.connect(self.homography_warp.set_matrix)
         self._initialised = False
         self.last_error = ""
-        self.last_image = None
+        self.frame_buffer = FrameRingBuffer()
         self.device_label = 'Camera'
         self._interval = interval
         self.properties = []
@@ -84,9 +97,10 @@ class CameraDevice(QObject):
         self.use_homography_matrix = False
 
         self._gain_name = ''
-        self._timer = QTimer()
-        self._timer.setInterval(self._interval)
-        self._timer.timeout.connect(self._query_frame)
+        self.acquisition_thread = None
+        self.acquisition_worker = None
+        self.recording_thread = None
+        self.recording_worker = None
 
         if not self._mmc:
             self._mmc = MMCorePy.CMMCore()
@@ -108,6 +122,15 @@ class CameraDevice(QObject):
             self._mmc.setExposure(new_exposure)
             self.exposure_changed.emit(self.exposure)
 
+    @property
+    def last_image(self):
+        # A copy, the ring slot is reused once it is released.
+        frame = self.frame_buffer.latest()
+        if frame is None:
+            return None
+        with frame:
+            return np.array(self._transformed(frame.image))
+
     @property
     def homography_matrix(self):
         return self._homography_matrix
@@ -173,21 +196,34 @@ class CameraDevice(QObject):
             raise DeviceException(error)
 
     def _query_frame(self):
-       # log.debug('query frame')
-        frame = None
-        try:
-            if self._mmc.getRemainingImageCount() > 0:
-                frame = self._mmc.getLastImage()
-        except Exception as error:
-            log.warning(error)
-            raise DeviceException(error)
-        else:
-            if frame is not None:
-                if self.use_homography_matrix:
-                    self.last_image = cv2.warpPerspective(frame, self.homography_matrix, (1024, 1024))
-                else:
-                    self.last_image = frame
-                self.newFrameReceived.emit(self.last_image)
+        # GUI thread, only ever sees the newest frame so display never falls behind acquisition.
+        if self.acquisition_worker is None:
+            return
+        self.acquisition_worker.acknowledge()
+        frame = self.frame_buffer.latest()
+        if frame is None:
+            return
+        with frame:
+            self.newFrameReceived.emit(self._transformed(frame.image))
+
+    def _transformed(self, image):
+        # The warp writes into the same output array every frame, see newFrameReceived.
+        if self.use_homography_matrix:
+            return self.homography_warp.warp(image)
+        return image
+
+    def _on_recording_finished(self):
+        worker = self.recording_worker
+        if worker is None:
+            return
+        self.recording_thread.wait()
+        self.recording_thread = None
+        self.recording_worker = None
+        self.recordingFinished.emit(worker.path, worker.count, worker.missed)
+
+    def _on_acquisition_finished(self):
+        if self.acquisition_thread is not None:
+            self.acquisition_thread.quit()
 
     def available_adapters(self):
         return self._mmc.getDeviceAdapterNames()
@@ -253,6 +289,11 @@ class CameraDevice(QObject):
         self._mmc.snapImage()
        # self._try_command('snapImage')
 
+    def set_protocol_element(self, element_id):
+        # Any thread, recorded frames are tagged with the element that was current when they were acquired.
+        if self.recording_worker is not None:
+            self.recording_worker.set_element(element_id)
+
     def set_property(self, name, value):
         self._try_command('setProperty', self.device_label, name, value)
         if name == EXPOSURE:
@@ -263,25 +304,72 @@ class CameraDevice(QObject):
     def set_roi(self, x, y, width, height):
         self._try_command('setROI', x, y, width, height)
 
+    @property
+    def is_recording(self):
+        return self.recording_worker is not None
+
+    @property
+    def is_acquiring(self):
+        return self.acquisition_thread is not None and self.acquisition_thread.isRunning()
+
     def start_acquisition(self):
+        if self.is_acquiring:
+            log.info("Camera is already acquiring.")
+            return
         try:
-            if not self._timer.isActive():
-                #self.stop_acquisition()
-                self._mmc.startContinuousSequenceAcquisition(self._interval)
-            else:
-                log.info("Camera is already acquiring.")
+            self._mmc.startContinuousSequenceAcquisition(self._interval)
         except MMCorePy.CMMError as error:
             raise DeviceException(error)
-        else:
-            self._timer.start()
-            log.debug("Camera on")
+
+        self.frame_buffer.reset()
+        self.acquisition_worker = CameraAcquisitionWorker(self._mmc, self.frame_buffer)
+        self.acquisition_thread = QThread()
+        self.acquisition_worker.moveToThread(self.acquisition_thread)
+        self.acquisition_worker.frameAcquired.connect(self.frameAcquired, Qt.DirectConnection)
+        self.acquisition_worker.frameReady.connect(self._query_frame)
+        self.acquisition_worker.finished.connect(self._on_acquisition_finished)
+        self.acquisition_worker.interrupted.connect(self._on_acquisition_finished)
+        self.acquisition_thread.started.connect(self.acquisition_worker.run)
+        self.acquisition_thread.start()
+        log.debug("Camera on")
+
+    def start_recording(self, path, max_frames):
+        if self.is_recording:
+            log.info("Camera is already recording.")
+            return
+        self.start_acquisition()
+        self.recording_worker = CameraRecordingWorker(self, path, max_frames)
+        self.recording_thread = QThread()
+        self.recording_worker.moveToThread(self.recording_thread)
+        # quit is thread safe, direct so stop_acquisition can wait on the thread from the GUI thread.
+        self.recording_worker.finished.connect(self.recording_thread.quit, Qt.DirectConnection)
+        self.recording_worker.finished.connect(self._on_recording_finished)
+        self.recording_thread.started.connect(self.recording_worker.run)
+        self.recording_thread.start(QThread.HighPriority)
+
+    def stop_recording(self):
+        # The writer drains the frames already acquired, recordingFinished follows once they are on disk.
+        if self.recording_worker is not None:
+            self.recording_worker.stop()
 
     def stop_acquisition(self):
         num_frame_subscribers = self.receivers(self.newFrameReceived)
         log.debug("Number of frame subscribers: {}".format(num_frame_subscribers))
 
         if num_frame_subscribers < 2:
-            self._timer.stop()
+            # Acquisition stops first so the writer only has the frames already in the ring left to drain.
+            if self.acquisition_thread is not None:
+                self.acquisition_worker.stop()
+                self.acquisition_thread.quit()
+                self.acquisition_thread.wait()
+                log.debug("Acquired {} frames, {} dropped with every slot held.".format(
+                    self.frame_buffer.next_sequence, self.frame_buffer.dropped))
+                self.acquisition_thread = None
+                self.acquisition_worker = None
+            if self.recording_worker is not None:
+                self.recording_worker.stop()
+                self.recording_thread.wait()
+                self._on_recording_finished()
             self._mmc.stopSequenceAcquisition()
             log.debug("Camera off")
         else:
@@ -0,0 +1,115 @@
+import logging
+import os
+import threading
+
+import numpy as np
+from numpy.lib.format import open_memmap
+from PyQt5.QtCore import Qt
+
+from pyjohnstonlab.threading.scheduler import now_ns
+from pyjohnstonlab.threading.thread_worker import ThreadWorker
+
+log = logging.getLogger(__name__)
+
+NO_ELEMENT = -1
+# Seconds the writer waits for a frame before checking whether it has been stopped.
+WAIT_TIMEOUT = 0.05
+
+# One row per recorded frame. sequence is the camera frame number, gaps in it are frames the writer missed.
+# timestamp is perf_counter_ns when the frame was popped, element the protocol element id shown at that moment.
+INDEX_DTYPE = np.dtype([
+    ('sequence', np.int64),
+    ('timestamp', np.int64),
+    ('element', np.int32),
+])
+
+
+def index_path(path):
+    return os.path.splitext(path)[0] + '_index.npy'
+
+
+class CameraRecordingWorker(ThreadWorker):
+    """Writes every camera frame at full bit depth into a preallocated, memory mapped .npy file.
+
+    The file is sized for max_frames frames of the first frame's shape and dtype when that frame arrives, and can
+    be opened with np.load(path, mmap_mode='r'). Rows past the recorded count stay zero. The sidecar index, written
+    at the end, has one INDEX_DTYPE row per recorded frame. Frames are read from the camera's FrameRingBuffer, so
+    the writer can fall up to a ring's worth of frames behind before any are missed. After stop() it only writes
+    the frames acquired before the call.
+    """
+
+    def __init__(self, camera, path, max_frames):
+        super().__init__()
+        self.camera = camera
+        self.condition = threading.Condition()
+        self.count = 0
+        self.max_frames = max_frames
+        self.missed = 0
+        self.path = path
+        self.running = True
+        self.stop_sequence = None
+        # Frames announced by the camera, so a frame acquired while the writer is busy still wakes it.
+        self._acquired = 0
+        # Element changes as (timestamp, element), matched to frame timestamps when the index is written.
+        self._elements = [(0, NO_ELEMENT)]
+
+    def do_work(self):
+        reader = self.camera.frame_buffer.reader()
+        self.camera.frameAcquired.connect(self.on_camera_frameAcquired, Qt.DirectConnection)
+        data = None
+        index = np.zeros(self.max_frames, dtype=INDEX_DTYPE)
+        try:
+            while self.count < self.max_frames:
+                with self.condition:
+                    acquired = self._acquired
+                    stop_sequence = self.stop_sequence
+                if stop_sequence is not None and reader.sequence >= stop_sequence:
+                    break
+                frame = reader.next()
+                if frame is None:
+                    with self.condition:
+                        if not self.running:
+                            break
+                        if self._acquired == acquired:
+                            self.condition.wait(WAIT_TIMEOUT)
+                    continue
+                with frame:
+                    if stop_sequence is not None and frame.sequence >= stop_sequence:
+                        break
+                    if data is None:
+                        data = open_memmap(self.path, mode='w+', dtype=frame.image.dtype,
+                                           shape=(self.max_frames,) + frame.image.shape)
+                    elif frame.image.shape != data.shape[1:] or frame.image.dtype != data.dtype:
+                        log.warning("Camera frame size or bit depth changed, recording stopped.")
+                        break
+                    data[self.count] = frame.image
+                    index[self.count] = (frame.sequence, frame.timestamp, NO_ELEMENT)
+                self.count += 1
+        finally:
+            self.camera.frameAcquired.disconnect(self.on_camera_frameAcquired)
+            self.missed = reader.missed
+            if data is not None:
+                data.flush()
+                del data
+            index = index[:self.count]
+            changes = np.array(self._elements, dtype=np.int64)
+            index['element'] = changes[np.searchsorted(changes[:, 0], index['timestamp'], side='right') - 1, 1]
+            np.save(index_path(self.path), index)
+            log.info("Recorded {} frames to {}, {} missed.".format(self.count, self.path, self.missed))
+        return True
+
+    def on_camera_frameAcquired(self, frame):
+        # Acquisition thread, only wakes the writer.
+        with self.condition:
+            self._acquired += 1
+            self.condition.notify()
+
+    def set_element(self, element_id):
+        self._elements.append((now_ns(), element_id))
+
+    def stop(self):
+        with self.condition:
+            if self.running:
+                self.stop_sequence = self.camera.frame_buffer.next_sequence
+            self.running = False
+            self.condition.notify()
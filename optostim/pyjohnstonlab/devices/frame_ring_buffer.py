@@ -0,0 +1,141 @@
+import threading
+
+import numpy as np
+
+DEFAULT_SLOTS = 16
+
+
+class BufferedFrame:
+    """A frame held in a FrameRingBuffer slot, the slot is not written again until release() is called.
+
+    image is a read-only view of the slot, copy it to keep it past release().
+    """
+
+    def __init__(self, ring, slot, image, sequence, timestamp, generation):
+        self.generation = generation
+        self.image = image
+        self.ring = ring
+        self.sequence = sequence
+        self.slot = slot
+        self.timestamp = timestamp
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def release(self):
+        if self.ring is not None:
+            self.ring.release(self.slot, self.generation)
+            self.ring = None
+
+
+class FrameReader:
+    """Cursor over a FrameRingBuffer for consumers that want every frame in order.
+
+    missed counts frames that were overwritten before this reader got to them.
+    """
+
+    def __init__(self, ring, sequence):
+        self.missed = 0
+        self.ring = ring
+        self.sequence = sequence
+
+    def next(self):
+        frame = self.ring.acquire_from(self.sequence)
+        if frame is not None:
+            self.missed += frame.sequence - self.sequence
+            self.sequence = frame.sequence + 1
+        return frame
+
+
+class FrameRingBuffer:
+    """Fixed number of preallocated frame slots, written by one producer and read by any number of consumers.
+
+    Each frame is copied in once, readers get views of the slot with a reference held so the producer skips over it
+    until it is released. Slots are reallocated only when the frame shape or dtype changes, views taken before that
+    keep the old allocation alive.
+    """
+
+    def __init__(self, slots=DEFAULT_SLOTS):
+        self.slots = slots
+        self.dropped = 0
+        self.frames = None
+        self.generation = 0
+        self.head = -1
+        self.lock = threading.Lock()
+        self.next_sequence = 0
+        self.references = np.zeros(slots, dtype=np.int32)
+        self.sequences = np.full(slots, -1, dtype=np.int64)
+        self.timestamps = np.zeros(slots, dtype=np.int64)
+
+    def _acquire(self, slot):
+        # Called with the lock held.
+        self.references[slot] += 1
+        image = self.frames[slot]
+        image.flags.writeable = False
+        return BufferedFrame(self, slot, image, int(self.sequences[slot]), int(self.timestamps[slot]),
+                             self.generation)
+
+    def acquire_from(self, sequence):
+        # Oldest frame at or after sequence, None if there is nothing newer yet.
+        with self.lock:
+            candidates = np.flatnonzero(self.sequences >= sequence)
+            if not len(candidates):
+                return None
+            return self._acquire(candidates[np.argmin(self.sequences[candidates])])
+
+    def latest(self):
+        with self.lock:
+            if self.head < 0:
+                return None
+            return self._acquire(self.head)
+
+    def reader(self, from_latest=True):
+        with self.lock:
+            return FrameReader(self, self.next_sequence if from_latest else 0)
+
+    def release(self, slot, generation):
+        with self.lock:
+            if generation == self.generation:
+                self.references[slot] -= 1
+
+    def reset(self):
+        with self.lock:
+            self.head = -1
+            self.sequences[:] = -1
+
+    def write(self, image, timestamp):
+        """Copies image into the slot after the newest frame that nobody holds.
+
+        Returns the frame, held for the caller, or None if every slot is held and the frame was dropped.
+        """
+        with self.lock:
+            if self.frames is None or self.frames.shape[1:] != image.shape or self.frames.dtype != image.dtype:
+                self.frames = np.empty((self.slots,) + image.shape, dtype=image.dtype)
+                self.generation += 1
+                self.references[:] = 0
+                self.sequences[:] = -1
+                self.head = -1
+            for offset in range(1, self.slots + 1):
+                slot = (self.head + offset) % self.slots
+                if not self.references[slot]:
+                    break
+            else:
+                self.dropped += 1
+                return None
+            # Invalid while it is written, so readers cannot pick it up half copied.
+            self.sequences[slot] = -1
+            self.references[slot] = 1
+            frames = self.frames
+
+        np.copyto(frames[slot], image)
+
+        with self.lock:
+            self.references[slot] -= 1
+            self.sequences[slot] = self.next_sequence
+            self.timestamps[slot] = timestamp
+            self.next_sequence += 1
+            self.head = slot
+            return self._acquire(slot)
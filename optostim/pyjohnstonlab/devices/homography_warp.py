@@ -0,0 +1,71 @@
+import cv2
+import numpy as np
+
+DEFAULT_OUTPUT_SIZE = (1024, 1024)
+
+
+class HomographyWarp:
+    """cv2.warpPerspective with the per pixel mapping worked out once.
+
+    The fixed point remap tables are built the first time a frame of a given shape is warped and reused until the
+    matrix, the input shape or output_size (width, height) change. The result is written into the same output
+    array each time, copy it to keep it.
+    """
+
+    def __init__(self, matrix=None, output_size=DEFAULT_OUTPUT_SIZE, interpolation=cv2.INTER_LINEAR):
+        self._matrix = np.identity(3) if matrix is None else np.asarray(matrix, dtype=np.float64)
+        self._output_size = tuple(output_size)
+        self.interpolation = interpolation
+        self._key = None
+        self._maps = None
+        self._output = None
+
+    @property
+    def matrix(self):
+        return self._matrix
+
+    @matrix.setter
+    def matrix(self, new_matrix):
+        self._matrix = np.asarray(new_matrix, dtype=np.float64)
+        self.invalidate()
+
+    @property
+    def output_size(self):
+        return self._output_size
+
+    @output_size.setter
+    def output_size(self, new_size):
+        self._output_size = tuple(int(value) for value in new_size)
+        self.invalidate()
+
+    def build_maps(self, input_shape):
+        # warpPerspective maps the output back through the inverse, so do the same for every output pixel.
+        width, height = self._output_size
+        inverse = np.linalg.inv(self._matrix)
+        x = np.arange(width, dtype=np.float64)[np.newaxis, :]
+        y = np.arange(height, dtype=np.float64)[:, np.newaxis]
+        w = inverse[2, 0] * x + inverse[2, 1] * y + inverse[2, 2]
+        w = np.where(w == 0, np.inf, w)
+        map_x = ((inverse[0, 0] * x + inverse[0, 1] * y + inverse[0, 2]) / w).astype(np.float32)
+        map_y = ((inverse[1, 0] * x + inverse[1, 1] * y + inverse[1, 2]) / w).astype(np.float32)
+        self._maps = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+        self._key = (tuple(input_shape[:2]), self._output_size)
+
+    def invalidate(self):
+        self._key = None
+        self._maps = None
+
+    def set_matrix(self, new_matrix):
+        # Slot for homographyMatrixChanged.
+        self.matrix = new_matrix
+
+    def warp(self, image):
+        if self._key != (image.shape[:2], self._output_size):
+            self.build_maps(image.shape)
+        width, height = self._output_size
+        if self._output is None or self._output.shape != (height, width) + image.shape[2:] \
+                or self._output.dtype != image.dtype:
+            self._output = np.empty((height, width) + image.shape[2:], dtype=image.dtype)
+        map_1, map_2 = self._maps
+        return cv2.remap(image, map_1, map_2, self.interpolation, dst=self._output,
+                         borderMode=cv2.BORDER_CONSTANT, borderValue=0)
@@ -1,11 +1,12 @@
 import logging
-from time import sleep
 
 import LabJackPython
+import numpy as np
 from PyQt5.QtCore import QObject, pyqtSignal, QTimer
 import u3
 
 from pyjohnstonlab.devices.exceptions import DeviceException
+from pyjohnstonlab.devices.trigger import TriggerCondition, wait_for_trigger
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.WARNING)
@@ -25,7 +26,57 @@ DAC1_REGISTER = 5002
 LOW = 0
 HIGH = 1
 
-WAIT_FOR_SIGNAL_SLEEP = 0.1
+TIMER_MODE_PWM16 = 0
+TIMER_MODE_PWM8 = 1
+TIMER_MODE_BITS = {TIMER_MODE_PWM16: 16, TIMER_MODE_PWM8: 8}
+# PWM cannot hold the pin low, the largest value leaves one clock tick high per period while the pulse train is off.
+TIMER_VALUE_OFF = 65535
+
+# Timer clock bases that accept a divisor (U3 hardware >= 1.21), id: frequency in Hz. A divisor of 0 means 256.
+TIMER_CLOCK_BASES = {3: 1e6, 4: 4e6, 5: 12e6, 6: 48e6}
+TIMER_DIVISORS = np.arange(1, 257)
+
+
+class PulseTrain:
+
+    def __init__(self, frequency, pulse_width):
+        self.frequency = frequency
+        self.pulse_width = pulse_width
+        self.clock_base, self.divisor, self.mode, self.value = self._timer_settings()
+
+    def __repr__(self):
+        return "Pulse train at {:.3f} Hz, {:.3f} ms (requested {} Hz, {} ms)".format(
+            self.actual_frequency, 1000.0 * self.actual_pulse_width, self.frequency, 1000.0 * self.pulse_width)
+
+    def _timer_settings(self):
+        if self.frequency <= 0.0 or not (0.0 < self.pulse_width * self.frequency <= 1.0):
+            raise ValueError('Pulse width must be greater than zero and no longer than the pulse period.')
+
+        best = None
+        # 16 bit PWM first so it wins ties, it has the finer duty cycle resolution.
+        for mode in (TIMER_MODE_PWM16, TIMER_MODE_PWM8):
+            for clock_base, clock in TIMER_CLOCK_BASES.items():
+                frequencies = clock / (TIMER_DIVISORS * 2 ** TIMER_MODE_BITS[mode])
+                errors = np.abs(frequencies - self.frequency) / self.frequency
+                i = int(np.argmin(errors))
+                if best is None or errors[i] < best[0]:
+                    best = (errors[i], clock_base, int(TIMER_DIVISORS[i]), mode)
+
+        _, clock_base, divisor, mode = best
+        step = 2 ** (16 - TIMER_MODE_BITS[mode])
+        duty_cycle = self.pulse_width * self.frequency
+        # Value sets the low portion of the period out of 65536.
+        value = int(round(65536 * (1.0 - duty_cycle) / step)) * step
+        return clock_base, divisor % 256, mode, min(max(value, 0), 65535)
+
+    @property
+    def actual_frequency(self):
+        divisor = self.divisor if self.divisor else 256
+        return TIMER_CLOCK_BASES[self.clock_base] / (divisor * 2 ** TIMER_MODE_BITS[self.mode])
+
+    @property
+    def actual_pulse_width(self):
+        return (65536 - self.value) / 65536 / self.actual_frequency
 
 
 class LabJackControl:
@@ -72,8 +123,10 @@ class LabJackDevice(QObject):
     fio_numbers = [4, 5, 6, 7]
     status_changed = pyqtSignal(str)
 
-    def __init__(self, parent=None, **kwargs):
+    def __init__(self, parent=None, backend=None, **kwargs):
         super().__init__(parent)
+        # backend is a callable returning an open device, u3.U3 or a stand-in such as VirtualU3.
+        self._backend = backend if backend else u3.U3
         self._device = None
         self._status = ""
         self._is_connected = False
@@ -123,7 +176,7 @@ class LabJackDevice(QObject):
     def _get_device(self):
         device = None
         try:
-            device = u3.U3()
+            device = self._backend()
         except LabJackPython.LabJackException as e:
             self.status = e.errorString
         else:
@@ -161,6 +214,7 @@ class LabJackDevice(QObject):
     def clear(self):
         if not self._device:
             raise DeviceException(self.status)
+        self._device.configIO(NumberOfTimersEnabled=0)
         [self._device.setFIOState(number, LOW) for number in self.fio_numbers]
 
         self.set_DAC0(0.0)
@@ -171,10 +225,23 @@ class LabJackDevice(QObject):
             log.info("Closing LabJack device.")
             self._device.close()
 
+    def configure_pulse_train(self, pulse_train, fio):
+        # The fio belongs to timer 0 until release_pulse_train, the command lists only switch its PWM value.
+        log.info("Configuring timer 0 on fio{} for {}".format(fio, pulse_train))
+        self._device.configTimerClock(TimerClockBase=pulse_train.clock_base, TimerClockDivisor=pulse_train.divisor)
+        self._device.configIO(TimerCounterPinOffset=fio, NumberOfTimersEnabled=1)
+        self._device.getFeedback(u3.Timer0Config(TimerMode=pulse_train.mode, Value=TIMER_VALUE_OFF))
+
+    def release_pulse_train(self, fio):
+        self._device.configIO(NumberOfTimersEnabled=0)
+        self._device.getFeedback([u3.BitDirWrite(fio, 1), u3.BitStateWrite(fio, LOW)])
+
     def execute_command_list(self, command):
         self._device.getFeedback(command)
 
-    def generate_command_lists(self, states):
+    def generate_command_lists(self, states, pulse_train=None, pulse_train_fio=None):
+        # With a pulse train the pulse_train_fio is driven by timer 0 (hardware PWM), which pulses while its state is
+        # high. configure_pulse_train must have been called before executing these.
         command_lists = []
         previous_state = self.default
         for state in states:
@@ -182,7 +249,11 @@ class LabJackDevice(QObject):
             #  FIOs
             for i in range(4, 8):
                 if previous_state[i - 4] != state[i - 4]:
-                    command_list.append(u3.BitStateWrite(i, state[i - 4]))
+                    if pulse_train and i == pulse_train_fio:
+                        value = pulse_train.value if state[i - 4] else TIMER_VALUE_OFF
+                        command_list.append(u3.Timer0Config(TimerMode=pulse_train.mode, Value=value))
+                    else:
+                        command_list.append(u3.BitStateWrite(i, state[i - 4]))
 
             # DACs
             if previous_state[4] != state[4]:
@@ -235,9 +306,9 @@ class LabJackDevice(QObject):
         self._status = new_status
         self.status_changed.emit(self._status)
 
-    def wait_for_signal(self, io_number):
-        # or getAIN(channel) ?
-        while self._device.getDIState(io_number) == HIGH:
-            sleep(WAIT_FOR_SIGNAL_SLEEP)
+    def wait_for_signal(self, io_number, condition=TriggerCondition.LOW, strategy=None, timeout=None,
+                        cancellation_token=None):
+        return wait_for_trigger(self._device, io_number, condition=condition, strategy=strategy, timeout=timeout,
+                                cancellation_token=cancellation_token)
 
 
@@ -0,0 +1,124 @@
+import logging
+import threading
+from enum import Enum
+from time import perf_counter_ns, sleep
+
+import u3
+
+from pyjohnstonlab.devices.exceptions import DeviceException
+
+log = logging.getLogger(__name__)
+
+HIGH = 1
+LOW = 0
+
+
+class TriggerCondition(Enum):
+    LOW = 0
+    HIGH = 1
+    FALLING = 2
+    RISING = 3
+
+
+class TriggerTimeout(DeviceException):
+    pass
+
+
+class CancellationToken:
+
+    def __init__(self, is_requested=None):
+        self._event = threading.Event()
+        self._is_requested = is_requested
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def is_cancelled(self):
+        return self._event.is_set() or bool(self._is_requested and self._is_requested())
+
+
+class PollingStrategy:
+    # Reads the line state every poll. Each read is already a ~1 ms USB round trip, so the default is to poll
+    # back to back; a non-zero interval trades latency for USB/CPU load.
+
+    def __init__(self, interval=0.0):
+        self.interval = interval
+        self._read_command = None
+        self._previous = None
+
+    def arm(self, device, io_number):
+        device.getFeedback(u3.BitDirWrite(io_number, 0))
+        self._read_command = u3.BitStateRead(io_number)
+        self._previous = self.read(device)
+
+    def disarm(self, device):
+        self._read_command = None
+
+    def read(self, device):
+        return device.getFeedback(self._read_command)[0]
+
+    def poll(self, device, condition):
+        state = self.read(device)
+        previous, self._previous = self._previous, state
+        if condition == TriggerCondition.LOW:
+            return state == LOW
+        if condition == TriggerCondition.HIGH:
+            return state == HIGH
+        if condition == TriggerCondition.FALLING:
+            return previous == HIGH and state == LOW
+        return previous == LOW and state == HIGH
+
+    def wait(self):
+        if self.interval:
+            sleep(self.interval)
+
+
+class CounterLatchStrategy(PollingStrategy):
+    # Counter 0 is routed to the trigger pin and latches falling edges in hardware, so pulses shorter than the
+    # polling period are never missed. The U3 counters only count falling edges. Counter 0 shares the pin
+    # offset with the timers, it can not be used while a pulse train timer is enabled.
+
+    supported_conditions = (TriggerCondition.FALLING,)
+
+    def __init__(self, interval=0.0):
+        super().__init__(interval)
+        self._counter_read = u3.Counter0(Reset=False)
+
+    def arm(self, device, io_number):
+        device.configIO(TimerCounterPinOffset=io_number, NumberOfTimersEnabled=0, EnableCounter0=True)
+        device.getFeedback(u3.Counter0(Reset=True))
+
+    def disarm(self, device):
+        device.configIO(EnableCounter0=False)
+
+    def poll(self, device, condition):
+        return device.getFeedback(self._counter_read)[0] > 0
+
+
+def wait_for_trigger(device, io_number, condition=TriggerCondition.LOW, strategy=None, timeout=None,
+                     cancellation_token=None):
+    """Blocks until the condition is seen on io_number and returns the perf_counter_ns it was detected at.
+
+    Returns None if the cancellation token was cancelled first, raises TriggerTimeout after timeout seconds.
+    """
+    strategy = strategy if strategy else PollingStrategy()
+    supported = getattr(strategy, 'supported_conditions', None)
+    if supported and condition not in supported:
+        raise ValueError('{} does not support {}.'.format(type(strategy).__name__, condition))
+
+    deadline = perf_counter_ns() + int(timeout * 1e9) if timeout is not None else None
+
+    strategy.arm(device, io_number)
+    try:
+        while True:
+            if strategy.poll(device, condition):
+                return perf_counter_ns()
+            if cancellation_token and cancellation_token.is_cancelled:
+                log.info("Wait for trigger on IO {} cancelled.".format(io_number))
+                return None
+            if deadline is not None and perf_counter_ns() > deadline:
+                raise TriggerTimeout('No trigger on IO {} within {} s.'.format(io_number, timeout))
+            strategy.wait()
+    finally:
+        strategy.disarm(device)
@@ -0,0 +1,221 @@
+import bisect
+import logging
+from time import perf_counter_ns
+
+import numpy as np
+
+from pyjohnstonlab.threading.scheduler import NANOSECONDS, sleep_until
+
+log = logging.getLogger(__name__)
+
+# Feedback IOTypes (first command byte), see section 5.2.5 of the U3 user's guide.
+BIT_STATE_READ = 10
+BIT_STATE_WRITE = 11
+BIT_DIR_READ = 12
+BIT_DIR_WRITE = 13
+DAC0_8 = 34
+DAC1_8 = 35
+TIMER0 = 42
+TIMER0_CONFIG = 43
+TIMER1 = 44
+TIMER1_CONFIG = 45
+COUNTER0 = 54
+COUNTER1 = 55
+
+IO_TYPE_NAMES = {
+    BIT_STATE_READ: 'BitStateRead',
+    BIT_STATE_WRITE: 'BitStateWrite',
+    BIT_DIR_READ: 'BitDirRead',
+    BIT_DIR_WRITE: 'BitDirWrite',
+    DAC0_8: 'DAC0_8',
+    DAC1_8: 'DAC1_8',
+    TIMER0: 'Timer0',
+    TIMER0_CONFIG: 'Timer0Config',
+    TIMER1: 'Timer1',
+    TIMER1_CONFIG: 'Timer1Config',
+    COUNTER0: 'Counter0',
+    COUNTER1: 'Counter1',
+}
+
+DAC_BITS_PER_VOLT = 51.717
+NUMBER_OF_IO = 20
+
+
+class LatencyModel:
+    # Per USB transaction latency, normally distributed and clipped at zero.
+
+    def __init__(self, latency=0.001, jitter=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self._random = np.random.default_rng(seed)
+
+    def delay_ns(self):
+        delay = self._random.normal(self.latency, self.jitter) if self.jitter else self.latency
+        return int(max(delay, 0.0) * NANOSECONDS)
+
+
+class ScriptedInput:
+    # Digital input driven by (seconds, state) transitions measured from when the device was opened.
+
+    def __init__(self, transitions, initial_state=1):
+        self.times = [int(t * NANOSECONDS) for t, _ in transitions]
+        self.states = [state for _, state in transitions]
+        self.initial_state = initial_state
+
+    def state(self, elapsed_ns):
+        i = bisect.bisect_right(self.times, elapsed_ns)
+        return self.states[i - 1] if i else self.initial_state
+
+    def falling_edges(self, start_ns, end_ns):
+        previous = self.state(start_ns)
+        count = 0
+        for t, state in zip(self.times, self.states):
+            if start_ns < t <= end_ns:
+                if previous and not state:
+                    count += 1
+                previous = state
+        return count
+
+
+class VirtualU3:
+    """Stand-in for u3.U3 that records every command with a timestamp and emulates USB latency.
+
+    Pass it (or a functools.partial of it) as the backend of LabJackDevice to run timing code without hardware.
+    """
+
+    def __init__(self, latency_model=None, inputs=None):
+        self.latency_model = latency_model if latency_model else LatencyModel(latency=0.0)
+        self.inputs = {io: ScriptedInput(transitions) if not isinstance(transitions, ScriptedInput) else transitions
+                       for io, transitions in (inputs or {}).items()}
+        self.opened = perf_counter_ns()
+        self.commands = []
+        self.transactions = 0
+        self.directions = [0] * NUMBER_OF_IO
+        self.states = [0] * NUMBER_OF_IO
+        self.dacs = [0, 0]
+        self.io_config = {'TimerCounterPinOffset': 4, 'NumberOfTimersEnabled': 0, 'EnableCounter0': False,
+                          'EnableCounter1': False}
+        self.timer_clock = {'TimerClockBase': 2, 'TimerClockDivisor': 256}
+        self.timer_configs = [None, None]
+        self._counter_reset = [self.opened, self.opened]
+
+    def _elapsed(self, timestamp):
+        return timestamp - self.opened
+
+    def _record(self, timestamp, name, io_number, value):
+        self.commands.append((timestamp, name, io_number, value))
+
+    def _read_state(self, io_number, timestamp):
+        scripted = self.inputs.get(io_number)
+        if scripted:
+            return scripted.state(self._elapsed(timestamp))
+        return self.states[io_number]
+
+    def _execute(self, command, timestamp):
+        io_type = command.cmdBytes[0]
+        name = IO_TYPE_NAMES.get(io_type, str(io_type))
+
+        if io_type in (BIT_STATE_READ, BIT_DIR_READ, BIT_STATE_WRITE, BIT_DIR_WRITE):
+            io_number = command.cmdBytes[1] & 0x7F
+            value = command.cmdBytes[1] >> 7
+            if io_type == BIT_STATE_READ:
+                return self._read_state(io_number, timestamp)
+            if io_type == BIT_DIR_READ:
+                return self.directions[io_number]
+            if io_type == BIT_STATE_WRITE:
+                self.states[io_number] = value
+            else:
+                self.directions[io_number] = value
+            self._record(timestamp, name, io_number, value)
+            return None
+
+        if io_type in (DAC0_8, DAC1_8):
+            self.dacs[io_type - DAC0_8] = command.cmdBytes[1]
+            self._record(timestamp, name, io_type - DAC0_8, command.cmdBytes[1])
+            return None
+
+        if io_type in (TIMER0_CONFIG, TIMER1_CONFIG):
+            timer = (io_type - TIMER0_CONFIG) // 2
+            mode, value = command.cmdBytes[1], command.cmdBytes[2] + (command.cmdBytes[3] << 8)
+            self.timer_configs[timer] = (mode, value)
+            self._record(timestamp, name, timer, (mode, value))
+            return None
+
+        if io_type in (COUNTER0, COUNTER1):
+            counter = io_type - COUNTER0
+            count = self._count(counter, timestamp)
+            if command.cmdBytes[1]:
+                self._counter_reset[counter] = timestamp
+            return count
+
+        if io_type in (TIMER0, TIMER1):
+            return 0
+
+        raise NotImplementedError('Virtual U3 does not emulate IOType {}.'.format(io_type))
+
+    def _count(self, counter, timestamp):
+        if not self.io_config['EnableCounter{}'.format(counter)]:
+            return 0
+        io_number = self.io_config['TimerCounterPinOffset'] + self.io_config['NumberOfTimersEnabled'] + counter
+        scripted = self.inputs.get(io_number)
+        if not scripted:
+            return 0
+        return scripted.falling_edges(self._elapsed(self._counter_reset[counter]), self._elapsed(timestamp))
+
+    def _transaction(self, function):
+        # Outputs are applied half way through the round trip, as the command reaches the device.
+        start = perf_counter_ns()
+        delay = self.latency_model.delay_ns()
+        sleep_until(start + delay // 2)
+        result = function(perf_counter_ns())
+        sleep_until(start + delay)
+        self.transactions += 1
+        return result
+
+    def close(self):
+        log.info("Closing virtual U3 after {} transactions.".format(self.transactions))
+
+    def configIO(self, **kwargs):
+        def apply(timestamp):
+            for key, value in kwargs.items():
+                if value is not None:
+                    self.io_config[key] = value
+            self._record(timestamp, 'configIO', None, dict(kwargs))
+            return dict(self.io_config)
+        return self._transaction(apply)
+
+    def configTimerClock(self, TimerClockBase=None, TimerClockDivisor=None):
+        def apply(timestamp):
+            if TimerClockBase is not None:
+                self.timer_clock = {'TimerClockBase': TimerClockBase, 'TimerClockDivisor': TimerClockDivisor}
+            self._record(timestamp, 'configTimerClock', None, dict(self.timer_clock))
+            return dict(self.timer_clock)
+        return self._transaction(apply)
+
+    def getDIState(self, ioNum):
+        def apply(timestamp):
+            self.directions[ioNum] = 0
+            return self._read_state(ioNum, timestamp)
+        return self._transaction(apply)
+
+    def getFeedback(self, *commands):
+        if len(commands) == 1 and isinstance(commands[0], list):
+            commands = commands[0]
+        return self._transaction(lambda timestamp: [self._execute(command, timestamp) for command in commands])
+
+    def setFIOState(self, fioNum, state=1):
+        def apply(timestamp):
+            self.directions[fioNum] = 1
+            self.states[fioNum] = int(bool(state))
+            self._record(timestamp, 'BitStateWrite', fioNum, int(bool(state)))
+        return self._transaction(apply)
+
+    def voltageToDACBits(self, volts, dacNumber=0, is16Bits=False):
+        bits = volts * DAC_BITS_PER_VOLT
+        bits = min(bits * 256, 0xFFFF) if is16Bits else min(bits, 0xFF)
+        return int(max(bits, 0))
+
+    def writes(self, io_number, name='BitStateWrite', start=0):
+        # (timestamp_ns, value) for every write of the given type to io_number, for timing analysis.
+        return [(timestamp, value) for timestamp, command_name, io, value in self.commands[start:]
+                if command_name == name and io == io_number]
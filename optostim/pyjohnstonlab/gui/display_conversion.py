@@ -0,0 +1,74 @@
+import cv2
+import numpy as np
+
+# Frames between auto-contrast updates, the LUT is only rebuilt when the window actually moves.
+CONTRAST_INTERVAL = 10
+# Every nth row and column goes into the histogram.
+HISTOGRAM_SUBSAMPLE = 4
+# Fraction of pixels clipped at each end of the auto-contrast window.
+SATURATION = 0.001
+
+LEVELS = {np.dtype(np.uint8): 256, np.dtype(np.uint16): 65536}
+
+
+def contrast_window(image, subsample=HISTOGRAM_SUBSAMPLE, saturation=SATURATION):
+    """(low, high) levels that leave saturation of the subsampled pixels below low and the same above high."""
+    sample = image[::subsample, ::subsample].ravel()
+    cumulative = np.cumsum(np.bincount(sample, minlength=LEVELS[image.dtype]))
+    total = cumulative[-1]
+    low = int(np.searchsorted(cumulative, saturation * total, side='right'))
+    high = int(np.searchsorted(cumulative, (1.0 - saturation) * total, side='left'))
+    return low, max(high, low + 1)
+
+
+def display_lut(low, high, levels):
+    ramp = (np.arange(levels, dtype=np.float32) - low) * (255.0 / (high - low))
+    return np.clip(ramp, 0, 255).astype(np.uint8)
+
+
+class DisplayConverter:
+    """Converts uint8 or uint16 camera frames to uint8 for display through a cached lookup table.
+
+    With auto_contrast the window is refitted from a subsampled histogram every interval frames, otherwise the full
+    range of the type is shown. convert() writes into the same array each call, copy it to keep it.
+    """
+
+    def __init__(self, auto_contrast=True, interval=CONTRAST_INTERVAL, subsample=HISTOGRAM_SUBSAMPLE,
+                 saturation=SATURATION):
+        self.auto_contrast = auto_contrast
+        self.interval = interval
+        self.saturation = saturation
+        self.subsample = subsample
+        self.window = None
+        self._count = 0
+        self._lut = None
+        self._lut_key = None
+        self._output = None
+
+    def convert(self, image):
+        if image.dtype not in LEVELS:
+            raise ValueError("Can only convert uint8 or uint16 images for display, got {}.".format(image.dtype))
+        levels = LEVELS[image.dtype]
+
+        if not self.auto_contrast:
+            self.window = (0, levels - 1)
+        elif self.window is None or self._count % self.interval == 0 or self._lut_key[2] != levels:
+            self.window = contrast_window(image, self.subsample, self.saturation)
+        self._count += 1
+
+        key = self.window + (levels,)
+        if key != self._lut_key:
+            self._lut = display_lut(*key)
+            self._lut_key = key
+
+        if self._output is None or self._output.shape != image.shape:
+            self._output = np.empty(image.shape, dtype=np.uint8)
+        if levels == 256:
+            return cv2.LUT(image, self._lut, dst=self._output)
+        # uint16 values always index the 65536 entry table. With the default mode='raise' np.take checks them into a
+        # temporary array first and only then copies into out.
+        return np.take(self._lut, image, out=self._output, mode='clip')
+
+    def reset(self):
+        self.window = None
+        self._count = 0
@@ -0,0 +1,194 @@
+import ctypes
+import logging
+
+import numpy as np
+from OpenGL import GL
+from PyQt5.QtCore import QObject, pyqtSlot
+from PyQt5.QtGui import QOffscreenSurface, QOpenGLContext, QOpenGLShader, QOpenGLShaderProgram
+
+log = logging.getLogger(__name__)
+
+# Attribute locations of every shader drawing registry geometry.
+POSITION = 0
+TEXTURE_COORDS = 1
+
+# Rows are x, y, z or x, y, z, u, v.
+GEOMETRY = {
+    # Full screen, v = 0 at the bottom for textures rendered by OpenGL such as framebuffers.
+    'screen_quad': np.array([
+        [-1.0, -1.0, 0.0, 0.0, 0.0],
+        [1.0, -1.0, 0.0, 1.0, 0.0],
+        [1.0, 1.0, 0.0, 1.0, 1.0],
+
+        [1.0, 1.0, 0.0, 1.0, 1.0],
+        [-1.0, 1.0, 0.0, 0.0, 1.0],
+        [-1.0, -1.0, 0.0, 0.0, 0.0],
+    ], dtype=np.float32),
+    # Full screen, v = 0 at the top for images uploaded top row first.
+    'image_quad': np.array([
+        [-1.0, 1.0, 0.0, 0.0, 0.0],
+        [1.0, 1.0, 0.0, 1.0, 0.0],
+        [1.0, -1.0, 0.0, 1.0, 1.0],
+
+        [1.0, -1.0, 0.0, 1.0, 1.0],
+        [-1.0, -1.0, 0.0, 0.0, 1.0],
+        [-1.0, 1.0, 0.0, 0.0, 0.0],
+    ], dtype=np.float32),
+    'unit_quad': np.array([
+        [0.0, 1.0, 0.0],
+        [1.0, 1.0, 0.0],
+        [1.0, 0.0, 0.0],
+
+        [1.0, 0.0, 0.0],
+        [0.0, 0.0, 0.0],
+        [0.0, 1.0, 0.0],
+    ], dtype=np.float32),
+    'centred_quad': np.array([
+        [-0.5, -0.5, 0.0],
+        [0.5, -0.5, 0.0],
+        [0.5, 0.5, 0.0],
+
+        [0.5, 0.5, 0.0],
+        [-0.5, 0.5, 0.0],
+        [-0.5, -0.5, 0.0],
+    ], dtype=np.float32),
+}
+
+_registry = {}
+
+
+def gl_resources(context=None):
+    """The GLResources of context, the current context by default, created on first use."""
+    context = context if context is not None else QOpenGLContext.currentContext()
+    if context is None:
+        raise RuntimeError("No current OpenGL context.")
+    resources = _registry.get(context)
+    if resources is None:
+        resources = GLResources(context)
+        _registry[context] = resources
+    return resources
+
+
+def release_gl_resources(context):
+    """Delete everything registered for context and forget it, with context current.
+
+    For contexts their owner destroys itself, so the registry does not keep the context alive after it is done.
+    """
+    resources = _registry.pop(context, None)
+    if resources is not None:
+        context.aboutToBeDestroyed.disconnect(resources.on_context_aboutToBeDestroyed)
+        resources.release()
+
+
+class GLResources(QObject):
+    """Shader programs, uniform locations and vertex arrays shared by everything drawing in one context.
+
+    Each program and piece of geometry is created once per context, so reinitialising a drawable or swapping the
+    drawables of a widget only looks them up. Named buffers hold per drawable data the same way. Everything is
+    deleted when the context is destroyed.
+    """
+
+    def __init__(self, context):
+        super().__init__()
+        self.buffers = {}
+        self.context = context
+        self.programs = {}
+        self.uniforms = {}
+        self.vertex_arrays = {}
+        context.aboutToBeDestroyed.connect(self.on_context_aboutToBeDestroyed)
+
+    def __len__(self):
+        return len(self.buffers) + len(self.programs) + len(self.vertex_arrays)
+
+    def buffer(self, name):
+        buffer_object = self.buffers.get(name)
+        if buffer_object is None:
+            buffer_object = GL.glGenBuffers(1)
+            self.buffers[name] = buffer_object
+        return buffer_object
+
+    def program(self, vertex, fragment):
+        key = (vertex, fragment)
+        shader_program = self.programs.get(key)
+        if shader_program is None:
+            shader_program = QOpenGLShaderProgram(self)
+            shader_program.addShaderFromSourceCode(QOpenGLShader.Vertex, vertex)
+            shader_program.addShaderFromSourceCode(QOpenGLShader.Fragment, fragment)
+            if not shader_program.link():
+                raise Exception("Could not link shaders - {}".format(shader_program.log()))
+            self.programs[key] = shader_program
+        return shader_program
+
+    def uniform_location(self, shader_program, name, required=False):
+        key = (shader_program.programId(), name)
+        location = self.uniforms.get(key)
+        if location is None:
+            location = shader_program.uniformLocation(name)
+            self.uniforms[key] = location
+        if required and location == -1:
+            raise ValueError("Uniform {} has no location.".format(name))
+        return location
+
+    def vertex_array(self, name, vertex_data=None):
+        """Vertex array of the named geometry, from GEOMETRY unless vertex_data is given the first time."""
+        vertex_array_object = self.vertex_arrays.get(name)
+        if vertex_array_object is not None:
+            return vertex_array_object[0]
+
+        vertex_data = np.ascontiguousarray(GEOMETRY[name] if vertex_data is None else vertex_data,
+                                           dtype=np.float32)
+        stride = vertex_data.shape[1] * vertex_data.itemsize
+
+        vertex_array_object = GL.glGenVertexArrays(1)
+        GL.glBindVertexArray(vertex_array_object)
+        vertex_buffer_object = GL.glGenBuffers(1)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, vertex_buffer_object)
+        GL.glBufferData(GL.GL_ARRAY_BUFFER, vertex_data.nbytes, vertex_data, GL.GL_STATIC_DRAW)
+        GL.glEnableVertexAttribArray(POSITION)
+        GL.glVertexAttribPointer(POSITION, 3, GL.GL_FLOAT, GL.GL_FALSE, stride, None)
+        if vertex_data.shape[1] == 5:
+            GL.glEnableVertexAttribArray(TEXTURE_COORDS)
+            GL.glVertexAttribPointer(TEXTURE_COORDS, 2, GL.GL_FLOAT, GL.GL_FALSE, stride, ctypes.c_void_p(12))
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        GL.glBindVertexArray(0)
+
+        self.vertex_arrays[name] = (vertex_array_object, vertex_buffer_object)
+        return vertex_array_object
+
+    def release(self):
+        for buffer_object in self.buffers.values():
+            GL.glDeleteBuffers(1, [buffer_object])
+        for vertex_array_object, vertex_buffer_object in self.vertex_arrays.values():
+            GL.glDeleteVertexArrays(1, [vertex_array_object])
+            GL.glDeleteBuffers(1, [vertex_buffer_object])
+        for shader_program in self.programs.values():
+            shader_program.removeAllShaders()
+            shader_program.deleteLater()
+        self.buffers.clear()
+        self.programs.clear()
+        self.uniforms.clear()
+        self.vertex_arrays.clear()
+
+    @pyqtSlot()
+    def on_context_aboutToBeDestroyed(self):
+        _registry.pop(self.context, None)
+        previous = QOpenGLContext.currentContext()
+        if previous == self.context:
+            self.release()
+            self.deleteLater()
+            return
+
+        # The context is not necessarily current while it is being destroyed, borrow a surface to clean up on.
+        surface = QOffscreenSurface()
+        surface.setFormat(self.context.format())
+        surface.create()
+        previous_surface = previous.surface() if previous is not None else None
+        if self.context.makeCurrent(surface):
+            self.release()
+            self.context.doneCurrent()
+        else:
+            log.warning("Could not make a context current to release its resources.")
+        if previous is not None:
+            previous.makeCurrent(previous_surface)
+        surface.destroy()
+        self.deleteLater()
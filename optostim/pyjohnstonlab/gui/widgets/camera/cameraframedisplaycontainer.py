@@ -1,5 +1,6 @@
 import os
 
+import numpy as np
 from PyQt5 import uic
 from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import QWidget
@@ -36,8 +37,12 @@ class CameraFrameDisplayContainer(QWidget):
 
     @image.setter
     def image(self, new_image):
-        self._ndarray = new_image
-        self.frameDisplayWidget.image = new_image
+        # Camera frames are views of a reused buffer, so keep a copy of our own. It is rewritten by the next frame,
+        # copy ndarray again to hold on to it.
+        if self._ndarray is None or self._ndarray.shape != new_image.shape or self._ndarray.dtype != new_image.dtype:
+            self._ndarray = np.empty_like(new_image)
+        np.copyto(self._ndarray, new_image)
+        self.frameDisplayWidget.image = self._ndarray
 
     @property
     def ndarray(self):
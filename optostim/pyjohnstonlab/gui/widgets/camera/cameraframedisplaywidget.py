@@ -1,18 +1,24 @@
 import logging
 
-import numpy as np
 from PyQt5.QtCore import QTimer
-from PyQt5.QtGui import QImage, QPainter
-from PyQt5.QtWidgets import QOpenGLWidget
+from PyQt5.QtGui import QImage
+
+from pyjohnstonlab.gui.display_conversion import DisplayConverter
+from pyjohnstonlab.gui.image import ndarray_to_qimage
+from pyjohnstonlab.gui.widgets.imageopenglwidget import ImageOpenGLWidget
 
 log = logging.getLogger(__name__)
 
 
-class CameraFrameDisplayWidget(QOpenGLWidget):
+class CameraFrameDisplayWidget(ImageOpenGLWidget):
+    """Camera frames converted to 8 bit by a DisplayConverter and drawn from a texture.
+
+    image is still a QImage, a copy of what is on screen, for saving snapshots.
+    """
 
     def __init__(self, parent=None):
         super().__init__(parent)
-        self._image = QImage()
+        self.display_converter = DisplayConverter()
         self._frame_count = 0
         self._timer = QTimer()
         self._previous_time = 0
@@ -21,26 +27,22 @@ class CameraFrameDisplayWidget(QOpenGLWidget):
 
     @property
     def aspect_ratio(self):
-        if self._image.width() == 0:
+        if self._image is None:
             return 1.0
         else:
-            return self._image.height() / self._image.width()
-
-    def paintEvent(self, paint_event):
-        painter = QPainter(self)
-        painter.drawImage(self.rect(), self.image)
+            height, width = self._image.shape
+            return height / width
 
     @property
     def image(self):
-        return self._image
+        if self._image is None:
+            return QImage()
+        return ndarray_to_qimage(self._image, QImage.Format_Grayscale8).copy()
 
     @image.setter
     def image(self, new_image):
-        height, width = new_image.shape
-        # Note this is for uint16, might have problems for other camera bits
-        img_8bit = (new_image / 256.0).astype(np.uint8) if not new_image.dtype == np.uint8 else new_image
-        self._image = QImage(img_8bit.data, width, height, QImage.Format_Grayscale8)
-        self.update()
+        # The converter reuses its output, so the texture always gets the newest frame whatever the paint rate.
+        ImageOpenGLWidget.image.fset(self, self.display_converter.convert(new_image))
 
     def on_timer_timeout(self):
         min_width = int(self.height() * self.aspect_ratio)
@@ -0,0 +1,92 @@
+import logging
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# All times are perf_counter_ns values. 'released' is when the element stopped blocking the thread, i.e. the
+# wait signal arrived, or the command returned for timed elements (their sleep shows up as the next 'started').
+EVENT_DTYPE = np.dtype([
+    ('loop', np.int32),
+    ('iteration', np.int32),
+    ('scheduled', np.int64),
+    ('started', np.int64),
+    ('emitted', np.int64),
+    ('commanded', np.int64),
+    ('released', np.int64),
+])
+
+# 'release' is the wait for the trigger on wait elements, close to 0 for timed ones.
+LATENCIES = [
+    ('start lateness', 'scheduled', 'started'),
+    ('emit', 'started', 'emitted'),
+    ('command', 'emitted', 'commanded'),
+    ('release', 'commanded', 'released'),
+]
+
+# For workers that emit nothing per element and have no waits, their 'emitted' and 'released' are left 0.
+COMMAND_LATENCIES = [
+    ('start lateness', 'scheduled', 'started'),
+    ('command', 'started', 'commanded'),
+]
+
+HISTOGRAM_BINS_US = [0, 10, 50, 100, 250, 500, 1000, 2000, 5000, 10000, np.inf]
+
+
+class EventRecorder:
+
+    def __init__(self, size, latencies=LATENCIES):
+        self.latency_stages = latencies
+        self.events = np.zeros(size, dtype=EVENT_DTYPE)
+        # Swap times from a render thread, by timeline index as they arrive out of step with record. 0 if the
+        # element was never presented.
+        self.presented = np.zeros(size, dtype=np.int64)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def record(self, loop, iteration, scheduled, started, emitted, commanded, released):
+        if self.count < len(self.events):
+            self.events[self.count] = (loop, iteration, scheduled, started, emitted, commanded, released)
+            self.count += 1
+
+    def record_presented(self, index, timestamp):
+        if 0 <= index < len(self.presented):
+            self.presented[index] = timestamp
+
+    def recorded(self):
+        return self.events[:self.count]
+
+    def latencies(self, start_field, end_field):
+        events = self.recorded()
+        return (events[end_field] - events[start_field]) / 1000.0
+
+    def report(self):
+        if not self.count:
+            return "No events recorded."
+
+        lines = ["Timing report for {} events (us):".format(self.count)]
+        for name, start_field, end_field in self.latency_stages:
+            values = self.latencies(start_field, end_field)
+            lines.append("  {:<15} mean={:.1f} std={:.1f} p50={:.1f} p99={:.1f} max={:.1f}".format(
+                name, values.mean(), values.std(), np.percentile(values, 50), np.percentile(values, 99), values.max()))
+
+        presented = self.presented[:self.count]
+        shown = presented > 0
+        if shown.any():
+            values = (presented[shown] - self.recorded()['emitted'][shown]) / 1000.0
+            lines.append("  {:<15} mean={:.1f} std={:.1f} p50={:.1f} p99={:.1f} max={:.1f} ({} presented)".format(
+                'present', values.mean(), values.std(), np.percentile(values, 50), np.percentile(values, 99),
+                values.max(), shown.sum()))
+
+        lateness = self.latencies('scheduled', 'started')
+        counts, edges = np.histogram(np.abs(lateness), bins=HISTOGRAM_BINS_US)
+        lines.append("  start lateness histogram:")
+        for count, low, high in zip(counts, edges[:-1], edges[1:]):
+            lines.append("    {:>6.0f} - {:<6} {}".format(low, '' if np.isinf(high) else '{:.0f}'.format(high), count))
+        return "\n".join(lines)
+
+    def save(self, path):
+        # An .npz of the recorded events and their presented times, for comparing runs offline.
+        np.savez(path, events=self.recorded(), presented=self.presented[:self.count])
@@ -1,8 +1,9 @@
 import logging
-from time import sleep
 
 from PyQt5.QtCore import QThread
 
+from pyjohnstonlab.threading.event_recorder import COMMAND_LATENCIES, EventRecorder
+from pyjohnstonlab.threading.scheduler import Timeline, now_ns, sleep_until
 from pyjohnstonlab.threading.thread_worker import ThreadWorker
 
 log = logging.getLogger(__name__)
@@ -16,6 +17,7 @@ class ExecuteStatesWorker(ThreadWorker):
         self.delay = delay
         self.device = device
         self.states = states
+        self.recorder = None
 
     def can_run(self):
         return (self.number_of_times > 0) and self.device
@@ -28,15 +30,26 @@ class ExecuteStatesWorker(ThreadWorker):
         # Note checking if thread has interruption could be expensive and add time. Test in future to know
         # potential issues
 
-        for loop_iter in range(self.number_of_times):
-            for i in range(len(command_lists)):
-                self.device.execute_command_list(command_lists[i])
-                sleep(self.states[i][6])
-
-            sleep(self.delay)
-            self.loop_progress.emit((loop_iter + 1) / self.number_of_times)
-            if current_thread.isInterruptionRequested():
-                return False
+        timeline = Timeline(durations=[state[6] for state in self.states], loop_count=self.number_of_times,
+                            inter_loop_delay=self.delay)
+        self.recorder = EventRecorder(size=len(timeline), latencies=COMMAND_LATENCIES)
+
+        try:
+            anchor = now_ns()
+            for loop_iter in range(self.number_of_times):
+                for i in range(len(command_lists)):
+                    scheduled = anchor + timeline.offset(loop_iter, i)
+                    started = sleep_until(scheduled)
+                    self.device.execute_command_list(command_lists[i])
+                    commanded = now_ns()
+                    self.recorder.record(loop_iter, i, scheduled, started, 0, commanded, 0)
+
+                sleep_until(anchor + timeline.loop_end(loop_iter) + timeline.inter_loop_delay_ns)
+                self.loop_progress.emit((loop_iter + 1) / self.number_of_times)
+                if current_thread.isInterruptionRequested():
+                    return False
+        finally:
+            log.info(self.recorder.report())
 
         return True
 
@@ -0,0 +1,75 @@
+import sys
+from time import perf_counter_ns, sleep
+
+import numpy as np
+
+NANOSECONDS = 1000000000
+
+# The OS sleep is only trusted up to this margin before the deadline, the remainder is spun. Windows timer
+# resolution is ~15.6 ms unless raised so the margin has to be much larger there.
+COARSE_SLEEP_MARGIN_NS = 16000000 if sys.platform == 'win32' else 2000000
+
+
+def now_ns():
+    return perf_counter_ns()
+
+
+def seconds_to_ns(seconds):
+    return int(round(seconds * NANOSECONDS))
+
+
+def sleep_until(deadline_ns, margin_ns=COARSE_SLEEP_MARGIN_NS):
+    remaining = deadline_ns - perf_counter_ns()
+    if remaining > margin_ns:
+        sleep((remaining - margin_ns) / NANOSECONDS)
+    while perf_counter_ns() < deadline_ns:
+        pass
+    return perf_counter_ns()
+
+
+class Timeline:
+    """Flat schedule of element start offsets (ns) for every (loop, iteration) of a looped sequence.
+
+    Offsets are measured from an anchor taken when the run starts. A wait element ends the current segment, the
+    anchor is then re-taken when the wait is released and following offsets are relative to it, so timing error
+    never accumulates across elements or loops.
+    """
+
+    def __init__(self, durations, waits=None, loop_count=1, inter_loop_delay=0.0):
+        durations_ns = np.rint(np.asarray(durations, dtype=np.float64) * NANOSECONDS).astype(np.int64)
+        waits = np.zeros(len(durations_ns), dtype=bool) if waits is None else np.asarray(waits, dtype=bool)
+
+        self.elements = len(durations_ns)
+        self.loop_count = loop_count
+        self.inter_loop_delay_ns = seconds_to_ns(inter_loop_delay)
+
+        total = self.elements * loop_count
+        self.loops = np.repeat(np.arange(loop_count), self.elements)
+        self.iterations = np.tile(np.arange(self.elements), loop_count)
+        self.waits = np.tile(waits, loop_count)
+
+        durations_ns = np.tile(np.where(waits, 0, durations_ns), loop_count)
+        last_in_loop = self.iterations == self.elements - 1
+        steps = durations_ns + np.where(last_in_loop, self.inter_loop_delay_ns, 0)
+
+        raw_starts = np.cumsum(steps) - steps
+        segments = np.concatenate(([0], np.cumsum(self.waits)[:-1])) if total else np.zeros(0, dtype=np.int64)
+        segment_bases = np.concatenate(([0], raw_starts[self.waits]))
+
+        self.segments = segments
+        self.offsets = raw_starts - segment_bases[segments]
+
+        loop_ends = np.where(self.waits, 0, self.offsets + durations_ns)
+        self.loop_ends = loop_ends[last_in_loop]
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def index(self, loop, iteration):
+        return loop * self.elements + iteration
+
+    def offset(self, loop, iteration):
+        return int(self.offsets[self.index(loop, iteration)])
+
+    def loop_end(self, loop):
+        return int(self.loop_ends[loop])
@@ -1,42 +1,101 @@
 import logging
-from time import sleep
+import os
+from collections import deque
+from concurrent.futures import CancelledError, TimeoutError
 
-from PyQt5.QtCore import pyqtSignal, QThread
+from PyQt5.QtCore import pyqtSignal, Qt, QThread
 
+from optostim.exceptions import OptoStimValueError
 from optostim.models.datamodels.labjack_state_model import LabJackStateModel
+from pyjohnstonlab.devices.trigger import CancellationToken, TriggerCondition, TriggerTimeout
+from pyjohnstonlab.threading.event_recorder import EventRecorder
+from pyjohnstonlab.threading.scheduler import now_ns, sleep_until
 from pyjohnstonlab.threading.thread_worker import ThreadWorker
 
 log = logging.getLogger(__name__)
 
+BLANK_ELEMENT = -1
+ELEMENT_QUEUE_LENGTH = 64
+# Seconds between checks for an abort while the render window uploads the frames.
+UPLOAD_POLL_INTERVAL = 0.1
+
 
 class ExecuteProtocolSequenceWorker(ThreadWorker):
 
-    # todo - create stimulus window on thread to avoid signals perhaps - better performance if latency important?
+    active_stimuli_points_changed = pyqtSignal(list, float)
 
-    # todo - concurrency for sleeps to allow thread event loop to process, can abort then almost instantly
+    # Element ids are pushed onto element_queue and this only wakes the GUI thread, nothing is allocated per element.
+    elementQueued = pyqtSignal()
 
-    active_stimuli_points_changed = pyqtSignal(list, float)
+    renderProgress = pyqtSignal(float)
+
+    # A Wait element saw no trigger within trigger_timeout, the run is interrupted.
+    triggerTimedOut = pyqtSignal(str)
+
+    # The frames could not be packed or made resident in the render window, the run did not start.
+    framesNotLoaded = pyqtSignal(str)
 
-    elementChanged = pyqtSignal(list)
+    # Element id as each element starts, emitted from this thread. For Qt.DirectConnection listeners such as
+    # CameraDevice.set_protocol_element that tag data with the current element.
+    elementStarted = pyqtSignal(int)
 
-    def __init__(self, labjack, program):
+    def __init__(self, labjack, program, pulse_train=None, trigger_condition=TriggerCondition.LOW,
+                 trigger_strategy=None, trigger_timeout=None, render_arguments=None, stimulus_renderer=None,
+                 bit_planes=False, timing_path=None):
         super().__init__()
         self.labjack = labjack
         #  todo do not use string here for wait. Enum! Just quick fix :(
         self.wait_fio_number = next((fio.number for fio in self.labjack.fios if fio.label == 'Wait'))
+        self.laser_fio_number = next((fio.number for fio in self.labjack.fios if fio.label == 'Laser'), None)
         self.program = program
-
-    def _do_protocol_sequence(self, i, command_lists):
+        self.pulse_train = pulse_train
+        self.element_queue = deque(maxlen=ELEMENT_QUEUE_LENGTH)
+        self.recorder = None
+        self.render_arguments = render_arguments
+        # A StimulusRenderWindow, frames then go straight to its render thread instead of through elementQueued.
+        self.stimulus_renderer = stimulus_renderer
+        # Show the frames packed into DMD bit planes instead, the patterns and their timing are in bit_plane_sequence.
+        self.bit_planes = bit_planes
+        self.bit_plane_sequence = None
+        self.layer_table = None
+        self.cancellation_token = None
+        self.trigger_condition = trigger_condition
+        self.trigger_strategy = trigger_strategy
+        self.trigger_timeout = trigger_timeout
+        self.timeline = None
+        # Where the EventRecorder is saved at the end of the run, not saved if None.
+        self.timing_path = timing_path
+
+    def _do_protocol_sequence(self, i, command_lists, anchor):
+        # Every element starts at an absolute deadline from the anchor, so emit/USB overhead is absorbed rather
+        # than added on top of the element duration. Waits re-anchor the timeline when the signal arrives.
+        element_ids = self.program.element_ids[i]
         for ii, sequence_element in enumerate(self.program[i]):
-            #self.program.stimulus_widget.scene().display_points([p.stimulus_point for p in sequence_element.stimulus_points])
-           # self.elementChanged.emit(i, ii)
-            self.elementChanged.emit([p.stimulus_point for p in sequence_element.stimulus_points])
+            scheduled = anchor + self.timeline.offset(i, ii)
+            started = sleep_until(scheduled)
+            self.elementStarted.emit(int(element_ids[ii]))
+            if self.layer_table is not None:
+                self.stimulus_renderer.show_frame(int(self.layer_table[i, ii]), i, ii)
+            else:
+                self.element_queue.append(element_ids[ii])
+                self.elementQueued.emit()
+            emitted = now_ns()
             if command_lists[ii]:
                 self.labjack.execute_command_list(command_lists[ii])
+            commanded = now_ns()
             if sequence_element.wait:
-                self.labjack.wait_for_signal(io_number=self.wait_fio_number)
-            else:
-                sleep(sequence_element.duration)
+                anchor = self.labjack.wait_for_signal(io_number=self.wait_fio_number,
+                                                      condition=self.trigger_condition,
+                                                      strategy=self.trigger_strategy,
+                                                      timeout=self.trigger_timeout,
+                                                      cancellation_token=self.cancellation_token)
+                if anchor is None:
+                    return None
+            self.recorder.record(i, ii, scheduled, started, emitted, commanded, now_ns())
+        # Generate the next loop in the slack before this one ends rather than at the start of the next.
+        self.program.prefetch(i + 1)
+        sleep_until(anchor + self.timeline.loop_end(i))
+        return anchor
 
     def do_work(self):
 
@@ -44,6 +103,7 @@ class ExecuteProtocolSequenceWorker(ThreadWorker):
         labels = ['Laser', 'PMT', 'Sync', 'Wait', 'Duration']
 
         current_thread = QThread.currentThread()
+        self.cancellation_token = CancellationToken(is_requested=current_thread.isInterruptionRequested)
         labjack_states = []
         for seq in self.program.initial_sequence:
             # todo ugly temp fix related to above
@@ -53,20 +113,105 @@ class ExecuteProtocolSequenceWorker(ThreadWorker):
             fio7 = seq[1 + labels.index(list(filter(lambda x: x.number == 7, self.labjack.fios))[0].label)]
             labjack_states.append(LabJackStateModel(fio4state=fio4, fio5state=fio5, fio6state=fio6, fio7state=fio7,
                                                     duration=seq.duration))
+        pulse_train = self.labjack.is_connected and self.pulse_train and self.laser_fio_number is not None
         if self.labjack.is_connected:
-            command_lists = self.labjack.generate_command_lists(states=labjack_states)
+            if pulse_train:
+                command_lists = self.labjack.generate_command_lists(states=labjack_states,
+                                                                    pulse_train=self.pulse_train,
+                                                                    pulse_train_fio=self.laser_fio_number)
+            else:
+                command_lists = self.labjack.generate_command_lists(states=labjack_states)
         else:
             command_lists = len(labjack_states) * [[]]
-        program_loops = len(self.program)
-
-        for i in range(program_loops):
-            self._do_protocol_sequence(i, command_lists)
+        # Frames are rendered before the timeline is anchored so no rendering happens during the protocol.
+        if self.render_arguments:
+            self.program.generate_images(self.render_arguments, progress=self.renderProgress.emit)
             if current_thread.isInterruptionRequested():
                 return False
-            else:
-                sleep(self.program.ild)
-                self.loop_progress.emit((i + 1) / program_loops)
-        self.program.stimulus_widget.scene().display_points([])
+            if self.stimulus_renderer is not None and self.bit_planes:
+                try:
+                    self.bit_plane_sequence = self.program.bit_plane_sequence(
+                        max_bytes=self.stimulus_renderer.texture_budget())
+                except OptoStimValueError as error:
+                    log.error(error)
+                    self.framesNotLoaded.emit(str(error))
+                    return False
+                log.info("Packed {} patterns into {} bit plane frames.".format(len(self.bit_plane_sequence.patterns),
+                                                                            len(self.bit_plane_sequence)))
+                frames = self.bit_plane_sequence.frames
+                self.layer_table = self.bit_plane_sequence.frame_table(len(self.program), self.program.iterations)
+            elif self.stimulus_renderer is not None:
+                frames, self.layer_table = self.program.resident_frames()
+            if self.stimulus_renderer is not None and not self.wait_for_frames(frames, current_thread):
+                return False
+        elif self.stimulus_renderer is not None:
+            log.warning("No frames were rendered, the stimulus render window will not be used.")
+
+        program_loops = len(self.program)
+        self.timeline = self.program.compile_timeline()
+        self.recorder = EventRecorder(size=len(self.timeline))
+        if self.layer_table is not None:
+            # Direct, so the swap time is recorded from the render thread as soon as it is known.
+            self.stimulus_renderer.frameSwapped.connect(self.on_stimulusRenderer_frameSwapped, Qt.DirectConnection)
+        if pulse_train:
+            self.labjack.configure_pulse_train(self.pulse_train, self.laser_fio_number)
+
+        try:
+            anchor = now_ns()
+            for i in range(program_loops):
+                anchor = self._do_protocol_sequence(i, command_lists, anchor)
+                if anchor is None or current_thread.isInterruptionRequested():
+                    return False
+                else:
+                    self.loop_progress.emit((i + 1) / program_loops)
+        except TriggerTimeout as error:
+            log.warning(error)
+            self.triggerTimedOut.emit(str(error))
+            return False
+        finally:
+            if pulse_train:
+                self.labjack.release_pulse_train(self.laser_fio_number)
+            if self.layer_table is not None:
+                self.stimulus_renderer.show_frame(BLANK_ELEMENT)
+                self.stimulus_renderer.frameSwapped.disconnect(self.on_stimulusRenderer_frameSwapped)
+            log.info(self.recorder.report())
+            if self.timing_path:
+                self.save_timing()
+        self.element_queue.append(BLANK_ELEMENT)
+        self.elementQueued.emit()
+        self.elementStarted.emit(BLANK_ELEMENT)
         return True
 
+    def wait_for_frames(self, frames, current_thread):
+        # The timeline is only anchored once every frame is resident, so the first elements are not drawn blank.
+        upload = self.stimulus_renderer.load_frames(frames)
+        while True:
+            try:
+                upload.result(timeout=UPLOAD_POLL_INTERVAL)
+                return True
+            except TimeoutError:
+                if current_thread.isInterruptionRequested():
+                    upload.cancel()
+                    return False
+                continue
+            except CancelledError:
+                message = "The stimulus render window closed before the frames were loaded."
+            except Exception as error:
+                message = str(error)
+            log.error(message)
+            self.framesNotLoaded.emit(message)
+            return False
+
+    def save_timing(self):
+        try:
+            os.makedirs(os.path.dirname(self.timing_path), exist_ok=True)
+            self.recorder.save(self.timing_path)
+        except OSError as error:
+            log.error("Could not save the protocol timing to {}: {}".format(self.timing_path, error))
+        else:
+            log.info("Saved the protocol timing to {}.".format(self.timing_path))
+
+    def on_stimulusRenderer_frameSwapped(self, loop, iteration, timestamp):
+        self.recorder.record_presented(self.timeline.index(loop, iteration), timestamp)
+
 
@@ -26,11 +26,24 @@ class CameraWindow(QWidget):
         path = os.path.join(current_directory, relative_location)
         uic.loadUi(path,  self)
 
+        self.camera.recordingFinished.connect(self.on_camera_recordingFinished)
+
     def closeEvent(self, close_event):
         log.debug("Trying to stop acquisition")
         self.camera.newFrameReceived.disconnect(self.on_camera_newFrameReceived)
         self.camera.stop_acquisition()
 
+    def location(self, directory):
+        location = Paths.join(self.workspace.working_directory, directory)
+
+        location_directory = QDir(location)
+
+        if not location_directory.exists():
+            if not location_directory.mkdir(location):
+                raise Exception("Could not create path {}.".format(location))
+
+        return location
+
     @pyqtSlot(np.ndarray)
     def on_camera_newFrameReceived(self, image):
         self.cameraFrameDisplay.image = image
@@ -40,13 +53,7 @@ class CameraWindow(QWidget):
         extension = "PNG"
         filename = "image-{:%Y-%m-%d_%H-%M-%S}.{}".format(datetime.datetime.now(), extension)
 
-        location = Paths.join(self.workspace.working_directory, Paths.camera_images)
-
-        location_directory = QDir(location)
-
-        if not location_directory.exists():
-            if not location_directory.mkdir(location):
-                raise Exception("Could not create path {} to save image.".format(location))
+        location = self.location(Paths.camera_images)
 
         full_path = Paths.join(location, filename)
 
@@ -55,6 +62,23 @@ class CameraWindow(QWidget):
 
         self.statusLabel.setText("Image snapped {}".format(full_path))
 
+    @pyqtSlot(str, int, int)
+    def on_camera_recordingFinished(self, path, frames, missed):
+        self.recordButton.setChecked(False)
+        self.statusLabel.setText("Recorded {} frames to {}, {} missed".format(frames, path, missed))
+
+    @pyqtSlot(bool)
+    def on_recordButton_toggled(self, checked):
+        if not checked:
+            self.camera.stop_recording()
+            return
+        if self.camera.is_recording:
+            return
+        filename = "recording-{:%Y-%m-%d_%H-%M-%S}.npy".format(datetime.datetime.now())
+        full_path = Paths.join(self.location(Paths.camera_recordings), filename)
+        self.camera.start_recording(full_path, self.recordingFramesSpinBox.value())
+        self.statusLabel.setText("Recording to {}".format(full_path))
+
     def showEvent(self, show_event):
         self.camera.newFrameReceived.connect(self.on_camera_newFrameReceived)
         self.cameraControlsWidget.controls_widget.update_controls(camera_device=self.camera)
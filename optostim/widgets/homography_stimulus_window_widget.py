@@ -6,14 +6,15 @@ import numpy as np
 from OpenGL import GL
 from PyQt5 import uic
 from PyQt5.QtCore import pyqtSlot, QObject, QEvent, Qt, QRectF, pyqtSignal
-from PyQt5.QtGui import QBrush, QPixmap, QOpenGLShaderProgram, QOpenGLShader, QMatrix4x4
+from PyQt5.QtGui import QBrush, QImage, QPixmap, QOpenGLShaderProgram, QOpenGLShader, QMatrix4x4
 from PyQt5.QtWidgets import QWidget, QGraphicsRectItem, QGraphicsScene, QOpenGLWidget, QGraphicsPixmapItem, \
     QGraphicsItem
-from qimage2ndarray import gray2qimage
 
 # from optostim.graphics.quad import GLGraphicsRectItem
 from pyjohnstonlab.decorators import mock_image
 from pyjohnstonlab.devices.camera_device import EXPOSURE, GAIN
+from pyjohnstonlab.gui.display_conversion import DisplayConverter
+from pyjohnstonlab.gui.image import ndarray_to_qimage
 
 log = logging.getLogger(__name__)
 
@@ -257,6 +258,7 @@ class HomographyStimulusWindowWidget(QWidget):
         self.camera_scene = self.cameraFrameGraphicsView.scene()
 
         self.camera_display = QGraphicsPixmapItem()
+        self.display_converter = DisplayConverter()
         self.camera_scene.addItem(self.camera_display)
         self.camera_display.setPos(0, 0)
         self.camera_scene.installEventFilter(ClickCapture(self))
@@ -298,8 +300,8 @@ class HomographyStimulusWindowWidget(QWidget):
    # @mock_image('development/homography_fix_cam.PNG')
     @pyqtSlot(np.ndarray)
     def on_camera_newFrameReceived(self, frame):
-        frame = (frame / 256.0).astype(np.uint8)  # Note this is for uint16, might have problems for other camera bits
-        self.camera_display.setPixmap(QPixmap.fromImage(gray2qimage(frame)))
+        frame = self.display_converter.convert(frame)
+        self.camera_display.setPixmap(QPixmap.fromImage(ndarray_to_qimage(frame, QImage.Format_Grayscale8)))
         self.update()
 
     @pyqtSlot()
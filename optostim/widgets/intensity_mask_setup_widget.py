@@ -70,7 +70,10 @@ class IntensityMaskSetupWidget(QWidget):
 
     @pyqtSlot()
     def on_acquireMaskButton_pressed(self):
+        # The fit keeps the image as its source, and the display's copy is rewritten by the next frame.
         image = self.cameraFrameDisplayWidget.ndarray
+        if image is not None:
+            image = np.array(image)
         self._intensity_mask.fit(image=image)
 
     @mock_image('development/image-2018-01-12_15-03-49.PNG')
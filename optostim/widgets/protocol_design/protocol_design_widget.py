@@ -1,6 +1,10 @@
+import datetime
 import logging
+from enum import Enum
 
 from pyjohnstonlab.devices.exceptions import DeviceException
+from pyjohnstonlab.devices.labjack_device import PulseTrain
+from pyjohnstonlab.devices.trigger import CounterLatchStrategy, TriggerCondition
 from pyjohnstonlab.gui.widgets.execute_loop_widget import ExecuteLoopWidget
 from pyjohnstonlab.gui import message_boxes
 from PyQt5 import uic
@@ -8,19 +12,30 @@ from PyQt5.QtCore import Qt, pyqtSlot, QThread, pyqtSignal
 from PyQt5.QtWidgets import QWidget
 
 from optostim.common import views
+from optostim.common.paths import Paths
 from pyjohnstonlab.mixins import LoadUIFileMixin
 from optostim.models.datamodels.patterns.increment_by_one_pattern import IncrementByOnePattern
 from optostim.models.datamodels.patterns.normal_pattern import NormalPattern
 from optostim.models.datamodels.patterns.random_pattern import RandomPattern
 from optostim.models.datamodels.program import Program
+from optostim.models.datamodels.protocol_frames import FrameCache
 from optostim.models.datamodels.selected_stimulus_point import SelectedStimulusPoint
 from optostim.models.itemmodels.protocol_sequence import ProtocolSequence
 from optostim.threads.execute_protocol_sequence_worker import ExecuteProtocolSequenceWorker
 from optostim.widgets.program_scroll_area_widget import ProgramScrollAreaWidget
 from optostim.widgets.protocol_design.stimulus_points_dialog import StimulusPointsDialog
+from optostim.widgets.stimulus_render_window import StimulusRenderWindow
 
 log = logging.getLogger(__name__)
 
+MAX_DISPLAYED_LOOPS = 50
+
+
+class StimulusOutput(Enum):
+    POINTS = 'Stimulus points'
+    FRAMES = 'Rendered frames'
+    BIT_PLANES = 'DMD bit planes'
+
 
 class ProtocolDesignWidget(QWidget, LoadUIFileMixin):
 
@@ -29,16 +44,19 @@ class ProtocolDesignWidget(QWidget, LoadUIFileMixin):
     programStarted = pyqtSignal()
 
     def __init__(self, image_stack, intensity_mask, labjack,
-                 stimulus_points, selected_stimulus_points, stimulus_widget, workspace, parent=None):
+                 stimulus_points, selected_stimulus_points, stimulus_widget, workspace, camera=None, parent=None):
         super().__init__(parent)
+        self.camera = camera
         # self.fio_mappings = fio_mappings
         self.image_stack = image_stack
         self._intensity_mask = intensity_mask
         self.labjack = labjack
+        self.frame_cache = FrameCache()
         self.program = None
         self.protocol_sequence = selected_stimulus_points
         self.stimulus_points = stimulus_points
         self.stimulus_points_dialog = None
+        self.stimulus_render_window = None
         self.stimulus_sequence_thread = None
         self.stimulus_sequence_worker = None
         self.stimulus_widget = stimulus_widget
@@ -65,6 +83,12 @@ class ProtocolDesignWidget(QWidget, LoadUIFileMixin):
         for pattern in self.patterns:
             self.patternComboBox.insertItem(self.patternComboBox.count(), pattern.icon(), pattern.name, pattern)
 
+        for output in StimulusOutput:
+            self.stimulusOutputComboBox.addItem(output.value, output)
+
+        for condition in TriggerCondition:
+            self.triggerConditionComboBox.addItem(condition.name.title(), condition)
+
         self.fio4Mapping.setText(self.labjack.fio4.label)
         self.fio5Mapping.setText(self.labjack.fio5.label)
         self.fio6Mapping.setText(self.labjack.fio6.label)
@@ -145,9 +169,28 @@ class ProtocolDesignWidget(QWidget, LoadUIFileMixin):
                 self.execute_loop_widget.execute.setText('Aborting')
             return
 
+        try:
+            pulse_train = self.pulse_train()
+        except ValueError as error:
+            message_boxes.warning(self, title="Invalid Pulse Train", text=str(error))
+            return
+
+        try:
+            trigger_condition, trigger_strategy, trigger_timeout = self.trigger_settings(pulse_train)
+        except ValueError as error:
+            message_boxes.warning(self, title="Invalid Wait Trigger", text=str(error))
+            return
+
+        output = self.stimulusOutputComboBox.currentData()
+
+        if output == StimulusOutput.BIT_PLANES and self.stimulus_widget.apply_intensity_mask:
+            message_boxes.warning(self, title="Intensity Mask On",
+                                  text="DMD bit planes are binary, turn the intensity mask off to use them.")
+            return
+
         problems = []
 
-        if not self.stimulus_widget.isVisible():
+        if output == StimulusOutput.POINTS and not self.stimulus_widget.isVisible():
             problems.append("Stimulus window is not visible.")
 
         if not self.labjack.is_connected:
@@ -167,16 +210,45 @@ class ProtocolDesignWidget(QWidget, LoadUIFileMixin):
         self.stimulus_sequence_thread = QThread()
         self.stimulus_sequence_thread.setObjectName('Program Thread')
 
-        # if self.stimulus_widget.isVisible():
-        #     self.program.generate_image_set()
-
-        self.stimulus_sequence_worker = ExecuteProtocolSequenceWorker(program=self.program, labjack=self.labjack)
+        # Frames are only pre-rendered for a frame based output, stimulus points are drawn from the point sets.
+        point_sets = self.program.point_sets()
+        render_arguments = None
+        stimulus_renderer = None
+        if output in (StimulusOutput.FRAMES, StimulusOutput.BIT_PLANES):
+            stimulus_renderer = self.open_stimulus_render_window()
+            # Bit planes are rendered without the mask, the check above keeps it off on the stimulus window too.
+            intensity_mask = None if output == StimulusOutput.BIT_PLANES else self._intensity_mask
+            render_arguments = self.program.render_arguments(intensity_mask, *stimulus_renderer.state['size'])
+        else:
+            self.stimulus_widget.scene().prepare_point_sets(point_sets)
+
+        timing_path = Paths.join(Paths.join(self.workspace.working_directory, Paths.protocol_timings),
+                                 "timing-{:%Y-%m-%d_%H-%M-%S}.npz".format(datetime.datetime.now()))
+
+        self.stimulus_sequence_worker = ExecuteProtocolSequenceWorker(program=self.program, labjack=self.labjack,
+                                                                      pulse_train=pulse_train,
+                                                                      trigger_condition=trigger_condition,
+                                                                      trigger_strategy=trigger_strategy,
+                                                                      trigger_timeout=trigger_timeout,
+                                                                      render_arguments=render_arguments,
+                                                                      stimulus_renderer=stimulus_renderer,
+                                                                      bit_planes=output == StimulusOutput.BIT_PLANES,
+                                                                      timing_path=timing_path)
         self.stimulus_sequence_worker.moveToThread(self.stimulus_sequence_thread)
 
+        element_queue = self.stimulus_sequence_worker.element_queue
         self.stimulus_sequence_worker. \
-            elementChanged.connect(lambda points: self.stimulus_widget.scene().display_points(points))
+            elementQueued.connect(lambda: self.stimulus_widget.scene().display_queued_point_set(element_queue))
+        if self.camera is not None:
+            self.stimulus_sequence_worker.elementStarted.connect(self.camera.set_protocol_element,
+                                                                 Qt.DirectConnection)
         self.stimulus_sequence_worker.loop_progress.connect(self.execute_loop_widget.update_progress_bar)
+        self.stimulus_sequence_worker.renderProgress.connect(self.execute_loop_widget.update_progress_bar)
 
+        self.stimulus_sequence_worker.triggerTimedOut.connect(
+            lambda text: message_boxes.warning(self, title="Wait Trigger Timed Out", text=text))
+        self.stimulus_sequence_worker.framesNotLoaded.connect(
+            lambda text: message_boxes.warning(self, title="Stimulus Frames Not Loaded", text=text))
         self.stimulus_sequence_worker.interrupted.connect(self.stimulus_sequence_thread.quit)
 
         self.stimulus_sequence_worker.finished.connect(self.on_stimulus_sequence_finished)
@@ -212,6 +284,8 @@ class ProtocolDesignWidget(QWidget, LoadUIFileMixin):
             pass
 
         self.stimulus_widget.image = None
+        if self.stimulus_render_window is not None:
+            self.stimulus_render_window.close()
         self.execute_loop_widget.execute.setText('Execute')
 
     @pyqtSlot(int)
@@ -286,9 +360,39 @@ class ProtocolDesignWidget(QWidget, LoadUIFileMixin):
         self.update_generated_sequence_views(loop_count=0)
         self.stimulus_widget.scene().display_points([])
 
+    def open_stimulus_render_window(self):
+        if self.stimulus_render_window is None:
+            self.stimulus_render_window = StimulusRenderWindow(self.stimulus_widget.homography_transform)
+        # Frames are rendered with the intensity mask already applied and in window coordinates.
+        self.stimulus_render_window.set_state(inverted=self.stimulus_widget.invert, use_homography=True,
+                                              use_intensity_mask=False)
+        self.stimulus_render_window.start()
+        ratio = self.stimulus_render_window.devicePixelRatio()
+        self.stimulus_render_window.set_state(size=(int(self.stimulus_render_window.width() * ratio),
+                                                    int(self.stimulus_render_window.height() * ratio)))
+        return self.stimulus_render_window
+
     def pattern(self):
         return self.patternComboBox.currentData()
 
+    def pulse_train(self):
+        if not self.pulseTrainGroupBox.isChecked():
+            return None
+        return PulseTrain(frequency=self.pulseTrainFrequencySpinBox.value(),
+                          pulse_width=self.pulseTrainWidthSpinBox.value() / 1000.0)
+
+    def trigger_settings(self, pulse_train=None):
+        condition = self.triggerConditionComboBox.currentData()
+        strategy = None
+        if self.counterLatchCheckBox.isChecked():
+            if condition not in CounterLatchStrategy.supported_conditions:
+                raise ValueError("The counter can only latch falling edges.")
+            if pulse_train is not None:
+                raise ValueError("The counter can not latch edges while the laser pulse train is enabled.")
+            strategy = CounterLatchStrategy()
+        timeout = self.triggerTimeoutSpinBox.value() or None
+        return condition, strategy, timeout
+
     @pyqtSlot()
     def on_sendPreviewButton_pressed(self):
         iteration = self.iterationPreviewSpinBox.value()
@@ -322,7 +426,10 @@ class ProtocolDesignWidget(QWidget, LoadUIFileMixin):
                                    stimulus_points=self.stimulus_points,
                                    stimulus_widget=self.stimulus_widget,
                                    pattern=self.protocol_sequence.pattern,
-                                   loop_count=loop_count)
+                                   loop_count=loop_count,
+                                   frame_cache=self.frame_cache)
             self.program.generate()
-            models = [ProtocolSequence(sequence=sequence) for sequence in self.program.program]
-            self.program_scroll_area_widget.set_number_of_widgets(models=models, number=loop_count)
+            # Only the first loops get a table, later ones are still generated on demand for preview and execution.
+            displayed_loops = min(loop_count, MAX_DISPLAYED_LOOPS)
+            models = [ProtocolSequence(sequence=sequence) for sequence in self.program[:displayed_loops]]
+            self.program_scroll_area_widget.set_number_of_widgets(models=models, number=displayed_loops)
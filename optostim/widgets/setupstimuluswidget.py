@@ -3,10 +3,11 @@ import logging
 import os
 
 from PyQt5.QtCore import pyqtSlot, Qt, QDir
-from PyQt5.QtGui import QBrush, QResizeEvent, QImage, QGuiApplication, QTransform
+from PyQt5.QtGui import QBrush, QResizeEvent, QImage, QTransform
 from PyQt5.QtWidgets import QWidget, QFileDialog, QHeaderView, QGraphicsScene
 
 from optostim.development.widget_abstraction import loadUI
+from optostim.graphics.framebufferpreview import FramebufferPreview
 from optostim.graphics.stimulusgraphicsscene import StimulusGraphicsScene
 from optostim.widgets.camera_homograph_setup_widget import CameraHomographySetupWidget
 from optostim.widgets.camera_window import CameraWindow
@@ -48,6 +49,7 @@ class SetupStimulusWidget(QWidget):
         self.stimulus_points = stimulus_points
         self.stimulus_widget = stimulus_widget
         self.stimulus_widget.setScene(self.experiment_scene)
+        self.stimulus_preview = FramebufferPreview(widget=self.stimulus_widget.viewport(), parent=self)
         self.transform = camera_transform
         self.workspace = workspace
 
@@ -99,6 +101,8 @@ class SetupStimulusWidget(QWidget):
 
         self.stimulus_points.sizeChanged.connect(lambda value: self.stimulusSquareSize.setText('%.2f μm' % value))
 
+        self.stimulus_preview.previewReady.connect(self.on_stimulusPreview_previewReady)
+
         # self.transform.dxChanged.connect(lambda value: self.xTranslateDoubleSpinBox_control.set_value(value))
         # self.transform.dxChanged.connect(lambda value: self.stimulus_widget.set_translation(self.transform.dx, -self.transform.dy))
         #
@@ -123,6 +127,7 @@ class SetupStimulusWidget(QWidget):
     def closeEvent(self, event):
         log.info("Closing setup stimulus widget")
         self.settings.setValue('deviceAdapters', self.deviceAdaptersComboBox.currentText())
+        self.stimulus_preview.stop()
         self.stimulus_widget.close()
         event.accept()
 
@@ -274,20 +279,13 @@ class SetupStimulusWidget(QWidget):
         self.xTranslateDoubleSpinBox.setRange(-half_width, half_width)
         self.yTranslateDoubleSpinBox.setRange(-half_height, half_height)
 
-    @pyqtSlot()
-    def on_stimulusWindow_framesSwapped(self):
-        screens = QGuiApplication.screens()
-        pixmap = screens[1].grabWindow(0)
-        self.stimulusWindowPreview.image = QImage(pixmap)
+    @pyqtSlot(QImage)
+    def on_stimulusPreview_previewReady(self, image):
+        self.stimulusWindowPreview.image = image
 
     @pyqtSlot(int)
     def on_stimulusWindowPreviewCheckBox_stateChanged(self, state):
-        pass
-        # if state:
-        #     self.stimulus_widget.frameSwapped.connect(self.on_stimulusWindow_framesSwapped)
-        #     self.on_stimulusWindow_framesSwapped()
-        # else:
-        #     self.stimulus_widget.frameSwapped.disconnect(self.on_stimulusWindow_framesSwapped)
+        self.stimulus_preview.start() if state else self.stimulus_preview.stop()
 
     @pyqtSlot()
     def on_stimulusWindowHomographyButton_pressed(self):
@@ -0,0 +1,324 @@
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+from OpenGL import GL
+from PyQt5.QtCore import pyqtSignal, Qt, QThread
+from PyQt5.QtGui import QGuiApplication, QMatrix4x4, QOpenGLContext, QSurfaceFormat, QVector2D, QWindow
+
+from optostim.graphics.frametexturearray import FrameTextureArray, TextureResidencyError, texture_budget
+from optostim.graphics.gaussianintensitymaskrenderer import GaussianMaskUniforms
+from optostim.widgets.stimulus_widget import FRAGMENT, VERTEX
+from pyjohnstonlab.gui.glresources import gl_resources, release_gl_resources
+from pyjohnstonlab.threading.scheduler import now_ns
+from pyjohnstonlab.threading.thread_worker import ThreadWorker
+
+log = logging.getLogger(__name__)
+
+COMMAND_QUEUE_LENGTH = 64
+
+# Settings a StimulusRenderer draws with, see StimulusRenderWindow.set_state.
+DEFAULT_STATE = {
+    'background_colour': 0,
+    'gaussian': None,
+    'gaussian_shape': (0, 0),
+    'inverse_homography': np.identity(3, dtype=np.float32),
+    'inverted': False,
+    'size': (0, 0),
+    'use_homography': False,
+    'use_intensity_mask': False,
+}
+
+
+def render_window_format():
+    surface_format = QSurfaceFormat()
+    surface_format.setVersion(3, 3)
+    surface_format.setProfile(QSurfaceFormat.CoreProfile)
+    surface_format.setSwapBehavior(QSurfaceFormat.DoubleBuffer)
+    surface_format.setSwapInterval(1)
+    return surface_format
+
+
+class StimulusRenderer(ThreadWorker):
+    """Draws stimulus frames into a StimulusRenderWindow from its own thread with its own context.
+
+    show_frame can be called from any thread, the execution worker calls it directly so nothing goes through the
+    GUI event loop. Commands queue up behind the swap, when more than one is waiting only the newest is drawn.
+    frameSwapped(loop, iteration, timestamp) is emitted from the render thread once a frame is on its way to the
+    screen, timestamp being perf_counter nanoseconds after the swap has completed. load_frames returns a Future that
+    is done once the frames are resident and drawable, or has the upload error. It is cancelled if the renderer stops
+    first.
+    """
+
+    frameSwapped = pyqtSignal(int, int, object)
+
+    def __init__(self, window, state):
+        super().__init__()
+        self.window = window
+        self.commands = deque(maxlen=COMMAND_QUEUE_LENGTH)
+        self.condition = threading.Condition()
+        self.context = None
+        self.dropped = 0
+        self.frame_array = FrameTextureArray()
+        self.mask_uniforms = GaussianMaskUniforms()
+        self.running = True
+        self.shader_program = None
+        self.state = dict(state)
+        # Bytes of frames that may be made resident, None until the context exists or if the driver does not say.
+        self.texture_budget = None
+        self._frames_to_upload = None
+        self._layer = -1
+        self._redraw = True
+
+    def do_work(self):
+        self.context = QOpenGLContext()
+        self.context.setFormat(self.window.requestedFormat())
+        if not self.context.create() or not self.context.makeCurrent(self.window):
+            log.error("Could not create the stimulus render context.")
+            self.stop()
+            self._cancel_upload()
+            self.context = None
+            return False
+        self.initialise_gl()
+        log.info("Stimulus render thread started, {}.".format(GL.glGetString(GL.GL_RENDERER)))
+
+        while True:
+            with self.condition:
+                # Nothing is taken while the window is hidden, exposeEvent wakes the thread again through redraw.
+                while self.running and not (self.window.isExposed() and (
+                        self.commands or self._redraw or self._frames_to_upload is not None)):
+                    self.condition.wait()
+                if not self.running:
+                    break
+                command = self.commands.pop() if self.commands else None
+                self.dropped += len(self.commands)
+                self.commands.clear()
+                frames, self._frames_to_upload = self._frames_to_upload, None
+                state = dict(self.state)
+                self._redraw = False
+
+            upload = None
+            if frames is not None and frames[1].set_running_or_notify_cancel():
+                frames, upload = frames
+                try:
+                    self.frame_array.upload(frames)
+                except (TextureResidencyError, ValueError) as error:
+                    log.error(error)
+                    upload.set_exception(error)
+                    upload = None
+            if command is not None:
+                self._layer = command[0]
+
+            self.paint(state, self._layer)
+            self.context.swapBuffers(self.window)
+            GL.glFinish()
+            swapped = now_ns()
+            if upload is not None:
+                upload.set_result(len(self.frame_array))
+            if command is not None and command[1] >= 0:
+                self.frameSwapped.emit(command[1], command[2], swapped)
+
+        self._cancel_upload()
+        self.frame_array.release()
+        release_gl_resources(self.context)
+        self.context.doneCurrent()
+        # Each start() makes a new context, this one goes with its renderer.
+        self.context = None
+        return True
+
+    def initialise_gl(self):
+        resources = gl_resources()
+        self.shader_program = resources.program(VERTEX, FRAGMENT)
+        self.vertex_attribute_object = resources.vertex_array('image_quad')
+        self.uniforms = {name: resources.uniform_location(self.shader_program, name) for name in [
+            'textureSampler', 'frameLayers', 'bit_planes', 'layer', 'inverted', 'use_homography',
+            'homography_matrix', 'image_size', 'projection_matrix', 'view_matrix']}
+        self.mask_uniforms.locate(self.shader_program)
+        self.texture_budget = texture_budget()
+
+    def _cancel_upload(self):
+        with self.condition:
+            if self._frames_to_upload is not None:
+                self._frames_to_upload[1].cancel()
+                self._frames_to_upload = None
+
+    def load_frames(self, frames):
+        # Uploaded by the render thread before it draws again, see FrameTextureArray.
+        upload = Future()
+        with self.condition:
+            if not self.running:
+                upload.cancel()
+                return upload
+            if self._frames_to_upload is not None:
+                self._frames_to_upload[1].cancel()
+            self._frames_to_upload = (frames, upload)
+            self.condition.notify()
+        return upload
+
+    def paint(self, state, layer):
+        # Draws layer of the frame array into the current framebuffer, the render loop passes the last shown frame.
+        width, height = state['size']
+        GL.glViewport(0, 0, width, height)
+        value = state['background_colour'] / 255.0
+        GL.glClearColor(value, value, value, 1.0)
+        GL.glClear(GL.GL_COLOR_BUFFER_BIT)
+
+        if not 0 <= layer < len(self.frame_array):
+            return
+        image_width, image_height = self.frame_array.size
+
+        uniforms = self.uniforms
+        self.shader_program.bind()
+        GL.glActiveTexture(GL.GL_TEXTURE0)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        GL.glUniform1i(uniforms['textureSampler'], 0)
+        GL.glActiveTexture(GL.GL_TEXTURE1)
+        GL.glBindTexture(GL.GL_TEXTURE_2D_ARRAY, self.frame_array.texture if self.frame_array.texture else 0)
+        GL.glUniform1i(uniforms['frameLayers'], 1)
+        GL.glUniform1i(uniforms['layer'], layer)
+        # Layers of packed RGB frames are DMD bit planes, see FrameTextureArray.
+        self.shader_program.setUniformValue(uniforms['bit_planes'], self.frame_array.channels == 3)
+        self.shader_program.setUniformValue(uniforms['inverted'], state['inverted'])
+        self.shader_program.setUniformValue(uniforms['use_homography'], state['use_homography'])
+        GL.glUniformMatrix3fv(uniforms['homography_matrix'], 1, GL.GL_TRUE, state['inverse_homography'])
+        self.shader_program.setUniformValue(uniforms['image_size'], QVector2D(image_width, image_height))
+        self.shader_program.setUniformValue(uniforms['projection_matrix'], QMatrix4x4())
+        self.shader_program.setUniformValue(uniforms['view_matrix'], QMatrix4x4())
+        self.mask_uniforms.set(self.shader_program, state['gaussian'], state['gaussian_shape'], width, height,
+                               enabled=state['use_intensity_mask'])
+
+        GL.glBindVertexArray(self.vertex_attribute_object)
+        GL.glDrawArrays(GL.GL_TRIANGLES, 0, 6)
+        GL.glBindVertexArray(0)
+        self.shader_program.release()
+
+    def redraw(self):
+        with self.condition:
+            self._redraw = True
+            self.condition.notify()
+
+    def set_state(self, **values):
+        with self.condition:
+            self.state.update(values)
+            self._redraw = True
+            self.condition.notify()
+
+    def show_frame(self, layer, loop=-1, iteration=-1):
+        # layer is a resident frame from load_frames, -1 blanks the window.
+        with self.condition:
+            self.commands.append((layer, loop, iteration))
+            self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+
+class StimulusRenderWindow(QWindow):
+    """Stimulus window drawn by a StimulusRenderer on its own thread, so GUI thread load cannot delay a frame.
+
+    Takes the same shaders and settings as StimulusWidget but only shows resident frames, either protocol frames or
+    packed bit plane frames from a BitPlaneSequence. start() opens the window and its render thread, call it from the
+    GUI thread before handing the window to another thread.
+    """
+
+    closed = pyqtSignal()
+    # Forwarded from the renderer in the render thread, connect with Qt.DirectConnection to stay there.
+    frameSwapped = pyqtSignal(int, int, object)
+
+    def __init__(self, homography_transform, parent=None):
+        super().__init__(parent)
+        self.setSurfaceType(QWindow.OpenGLSurface)
+        self.setFormat(render_window_format())
+        self.setTitle('Stimulus Window')
+        self.homography_transform = homography_transform
+        self.renderer = None
+        self.render_thread = None
+        self.state = dict(DEFAULT_STATE)
+        self.homography_transform.matrixChanged.connect(self.on_homography_matrixChanged)
+        self.on_homography_matrixChanged()
+
+    def event(self, event):
+        if event.type() == event.Close:
+            self.stop()
+            self.closed.emit()
+        return super().event(event)
+
+    def exposeEvent(self, event):
+        if self.isExposed():
+            self.start()
+            self.renderer.redraw()
+
+    def load_frames(self, frames):
+        # A Future for the upload, see StimulusRenderer.
+        if self.renderer is None:
+            log.warning("The stimulus render window is not open, frames not loaded.")
+            upload = Future()
+            upload.cancel()
+            return upload
+        return self.renderer.load_frames(frames)
+
+    def texture_budget(self):
+        return self.renderer.texture_budget if self.renderer is not None else None
+
+    def on_homography_matrixChanged(self):
+        self.set_state(inverse_homography=np.linalg.inv(self.homography_transform.matrix).astype(np.float32))
+
+    def open(self):
+        screens = QGuiApplication.screens()
+        if len(screens) > 1:
+            primary = QGuiApplication.primaryScreen()
+            screen = next(screen for screen in screens if screen != primary)
+            self.setScreen(screen)
+            self.setGeometry(screen.geometry())
+            self.showFullScreen()
+        else:
+            self.resize(1024, 1024)
+            self.show()
+
+    def resizeEvent(self, event):
+        ratio = self.devicePixelRatio()
+        self.set_state(size=(int(self.width() * ratio), int(self.height() * ratio)))
+
+    def set_state(self, **values):
+        # background_colour, gaussian, gaussian_shape, inverted, use_homography or use_intensity_mask.
+        self.state.update(values)
+        if self.renderer is not None:
+            self.renderer.set_state(**values)
+
+    def set_gaussian(self, gaussian, shape):
+        self.set_state(gaussian=gaussian, gaussian_shape=tuple(shape))
+
+    def show_frame(self, layer, loop=-1, iteration=-1):
+        if self.renderer is not None:
+            self.renderer.show_frame(layer, loop, iteration)
+
+    def start(self):
+        if self.renderer is not None:
+            return
+        self.create()
+        self.renderer = StimulusRenderer(self, self.state)
+        self.renderer.frameSwapped.connect(self.frameSwapped, Qt.DirectConnection)
+        self.render_thread = QThread(self)
+        self.render_thread.setObjectName('Stimulus Render Thread')
+        self.renderer.moveToThread(self.render_thread)
+        self.render_thread.started.connect(self.renderer.run)
+        self.renderer.finished.connect(self.render_thread.quit)
+        self.renderer.interrupted.connect(self.render_thread.quit)
+        # The renderer lives in the render thread, its deferred delete must be posted while that thread still runs.
+        self.render_thread.finished.connect(self.renderer.deleteLater)
+        self.render_thread.finished.connect(self.render_thread.deleteLater)
+        self.render_thread.start(QThread.TimeCriticalPriority)
+        if not self.isVisible():
+            self.open()
+
+    def stop(self):
+        if self.renderer is None:
+            return
+        self.renderer.stop()
+        self.render_thread.wait()
+        self.renderer = None
+        self.render_thread = None
@@ -1,20 +1,21 @@
-import ctypes
 import logging
 
-import cv2
 import numpy as np
 # OpenGL.FULL_LOGGING = True
 import qimage2ndarray
 from OpenGL import GL
 from PyQt5.QtCore import pyqtSignal, QPointF, Qt
-from PyQt5.QtGui import QPen, QTransform, QResizeEvent, QOpenGLShader, QMatrix4x4, QOpenGLShaderProgram, \
+from PyQt5.QtGui import QPen, QTransform, QResizeEvent, QMatrix4x4, QOpenGLContext, QOpenGLShaderProgram, \
     QVector3D, QVector2D, QBrush
 from PyQt5.QtWidgets import QApplication, QOpenGLWidget, QGraphicsView, QGraphicsLineItem
 
 from optostim.graphics.crosshair import Crosshair
-from optostim.graphics.gaussianintensitymaskrenderer import GaussianIntensityMaskRenderer
+from optostim.graphics.gaussianintensitymaskrenderer import GAUSSIAN_MASK, GaussianIntensityMaskRenderer, \
+    GaussianMaskUniforms
 from optostim.graphics.invertscenecoloursmixin import InvertSceneColoursMixin
+from optostim.graphics.streamingtexture import StreamingTexture
 from pyjohnstonlab.curves import Gaussian
+from pyjohnstonlab.gui.glresources import gl_resources
 
 log = logging.getLogger(__name__)
 
@@ -35,61 +36,48 @@ VERTEX = """#version 330
 FRAGMENT = """#version 330
         in vec2 textureCoords;
         uniform sampler2D textureSampler;
+        uniform sampler2DArray frameLayers;
+        uniform bool bit_planes;
+        uniform int layer;
         uniform bool inverted;
-        out vec4 colour;
-
-/*
-
-        uniform bool intensity_mask;
+        uniform bool use_homography;
         uniform mat3 homography_matrix;
-        uniform mat4 projection_matrix;
-        uniform mat4 view_matrix;
+        uniform vec2 image_size;
+        out vec4 colour;
 
-        uniform float centre_x;
-        uniform float centre_y;        
-        uniform float height;
-        uniform float rotation;
-        uniform float max_height;
-        uniform vec2 shape;
-        uniform float width_x;
-        uniform float width_y;
-        
-        float gaussianMask(float x, float y)
+        // homography_matrix is the inverse homography, it maps window pixels back to image pixels. Both have rows
+        // running top down, as does v.
+        vec2 homographyLookup(vec2 coords)
         {
-            float rotation_radians = radians(rotation);
-            
-            float centre_x2 = centre_x * cos(rotation_radians) - centre_y * sin(rotation_radians);
-            float centre_y2 = centre_x * sin(rotation_radians) + centre_y * cos(rotation_radians);
-            
-            float xp = x * cos(rotation_radians) - y * sin(rotation_radians);
-            float yp = x * sin(rotation_radians) + y * cos(rotation_radians);
-            
-           float a = pow((centre_x2 - xp) / width_x, 2);
-           float b = pow((centre_y2 - yp) / width_y, 2);
-            
-            float gaussian = height * exp(-0.5 * (a + b));
-            
-            return (1.0 - gaussian / height);
-        }*/
-        
+            vec3 source = homography_matrix * vec3(coords * image_size, 1.0);
+            return source.xy / (source.z * image_size);
+        }
+
+""" + GAUSSIAN_MASK + """
         void main() {
-              colour = texture(textureSampler, textureCoords);
-              
-             /* if (intensity_mask)
+              vec2 coords = use_homography ? homographyLookup(textureCoords) : textureCoords;
+              if (bit_planes)
               {
-              vec3 transformed = homography_matrix * vec3(textureCoords.x, textureCoords.y, 1.0);
-              
-                  float y = transformed.x;// * shape.y;
-                  float x = (1 - transformed.y);// * shape.x;
-                  
-                    colour.xyz = vec3(gaussianMask(x,  y));
-                     // colour = colour * gaussianMask();
-               }*/
-              
+                  // Every bit of a packed frame layer is a DMD pattern, texels go out exactly as they are,
+                  // unfiltered, uninverted and unmasked.
+                  ivec2 size = textureSize(frameLayers, 0).xy;
+                  bool inside = all(greaterThanEqual(coords, vec2(0.0))) && all(lessThan(coords, vec2(1.0)));
+                  colour = inside ? vec4(texelFetch(frameLayers, ivec3(ivec2(coords * vec2(size)), layer), 0).rgb, 1.0)
+                                  : vec4(0.0, 0.0, 0.0, 1.0);
+                  return;
+              }
+              // A layer >= 0 selects a resident protocol frame instead of the streamed image.
+              colour = layer >= 0 ? texture(frameLayers, vec3(coords, layer)) : texture(textureSampler, coords);
+
            if (inverted)
            {
                 colour = vec4(1.0 - colour.r, 1.0 - colour.g, 1.0 - colour.b, 1.0);
             }
+
+              if (intensity_mask)
+              {
+                  colour.rgb = colour.rgb * gaussianMask(gl_FragCoord.xy);
+              }
         }"""
 
 
@@ -104,27 +92,26 @@ class StimulusWidget(QOpenGLWidget):
     def __init__(self, homography_transform, parent=None):
         super().__init__(parent)
         self._background_colour = None
+        self._context = None
         self._drawables = []
+        self._drawables_initialised = False
         self._image = None
         self._intensity_mask = None
-        self.centre_x_uniform = None
-        self.centre_y_uniform = None
         self.crosshair = Crosshair(self)
-        self.height_uniform = None
         self.image_to_upload = None
         self.gl_initialised = False
-        self.shape_uniform = None
-        self.max_height_uniform = None
-        self.rotation_uniform = None
-        self.texture = -1
+        self.mask_uniforms = GaussianMaskUniforms()
+        self.frame_texture = StreamingTexture()
         self.texture_uploaded = False
-        self.width_x_uniform = None
-        self.width_y_uniform = None
         self.homography_transform = homography_transform
+        self.homography_matrix_uniform = None
+        self.image_size_uniform = None
+        self.inverse_homography = np.identity(3, dtype=np.float32)
+        self.use_homography_uniform = None
         self.projection_matrix = QMatrix4x4()
         self.view_matrix = QMatrix4x4()
         self.set_background_colour(0)
-        self.shader_program = QOpenGLShaderProgram()
+        self.shader_program = None
         self._show_crosshair = False
         self._show_scale_bar = False
         self._crosshair_thickness = 1
@@ -146,7 +133,8 @@ class StimulusWidget(QOpenGLWidget):
 
         self.setWindowTitle('Stimulus Window')
 
-        self.homography_transform.matrixChanged.connect(self.update_image)
+        self.homography_transform.matrixChanged.connect(self.on_homography_matrixChanged)
+        self.on_homography_matrixChanged()
 
     def compute_transformation_matrix(self):
         self.view_matrix.setToIdentity()
@@ -188,33 +176,15 @@ class StimulusWidget(QOpenGLWidget):
 
     @drawables.setter
     def drawables(self, new_drawables):
+        # Drawables only look up the shared programs and geometry of the context, nothing is compiled again.
         self._drawables = new_drawables
-        self.gl_initialised = False
+        self._drawables_initialised = False
         self.update()
 
     def upload_texture(self):
-        self.create_texture(self.image_to_upload)
+        self.frame_texture.upload(self.image_to_upload)
         self.texture_uploaded = True
 
-    def create_texture(self, image):
-        log.info("Creating texture")
-        img_data = np.flipud(image)
-        height, width = img_data.shape
-
-        GL.glActiveTexture(GL.GL_TEXTURE0)
-        GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)
-        GL.glBindTexture(GL.GL_TEXTURE_2D, self.texture)
-        GL.glTexParameterf(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_LINEAR)
-        GL.glTexParameterf(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_LINEAR_MIPMAP_LINEAR)
-
-        GL.glTexParameterf(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_S, GL.GL_CLAMP_TO_BORDER)
-        GL.glTexParameterf(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_T, GL.GL_CLAMP_TO_BORDER)
-
-        GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA8, width, height, 0,
-                        GL.GL_LUMINANCE, GL.GL_UNSIGNED_BYTE, img_data)
-        GL.glGenerateMipmap(GL.GL_TEXTURE_2D)
-        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
-
     @property
     def homography(self):
         return self._homography
@@ -240,73 +210,40 @@ class StimulusWidget(QOpenGLWidget):
         log.info("OpenGL Renderer: {}".format(GL.glGetString(GL.GL_RENDERER)))
         log.info("OpenGL Version: {}".format(GL.glGetString(GL.GL_VERSION)))
 
-        for drawable in self.drawables:
-            drawable.initialise_gl()
-
-        return
-
-        self.texture = GL.glGenTextures(1)
+        context = QOpenGLContext.currentContext()
+        if context != self._context:
+            # A reopened window can come with a new context, textures of the old one went with it.
+            self._context = context
+            self.frame_texture = StreamingTexture()
+            self.texture_uploaded = False
 
-        self.shader_program.addShaderFromSourceCode(QOpenGLShader.Vertex, VERTEX)
-        self.shader_program.addShaderFromSourceCode(QOpenGLShader.Fragment, FRAGMENT)
-
-        if not self.shader_program.link():
-            raise Exception("Could not link shaders - {}".format(self.shader_program.log()))
-
-        LOC = 1.0
-
-        vertexData = np.array([
-            # X,    Y,   Z     U,   V
-            -LOC, LOC, 0.0, 0.0, 1.0,
-            LOC, LOC, 0.0, 1.0, 1.0,
-            LOC, -LOC, 0.0, 1.0, 0.0,
-
-            LOC, -LOC, 0.0, 1.0, 0.0,
-            -LOC, -LOC, 0.0, 0.0, 0.0,
-            -LOC, LOC, 0.0, 0.0, 1.0,
-        ], dtype=np.float32)
-
-        self.VAO = GL.glGenVertexArrays(1)
-        GL.glBindVertexArray(self.VAO)
-
-        VBO = GL.glGenBuffers(1)
-        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, VBO)
-        GL.glBufferData(GL.GL_ARRAY_BUFFER, vertexData.nbytes, vertexData,
-                        GL.GL_STATIC_DRAW)
-
-        vertex_position = self.shader_program.attributeLocation("vertexPosition")
-
-        self.homography_matrix_uniform = self.shader_program.uniformLocation("homography_matrix")
-        self.intensity_mask_uniform = self.shader_program.uniformLocation("intensity_mask")
-        self.inverted_uniform = self.shader_program.uniformLocation("inverted")
-        self.projection_matrix_uniform = self.shader_program.uniformLocation("projection_matrix")
-        self.view_matrix_uniform = self.shader_program.uniformLocation("view_matrix")
-
-        self.centre_x_uniform = self.shader_program.uniformLocation("centre_x")
-        self.centre_y_uniform = self.shader_program.uniformLocation("centre_y")
-        self.height_uniform = self.shader_program.uniformLocation("height")
-        self.shape_uniform = self.shader_program.uniformLocation("shape")
-        self.width_x_uniform = self.shader_program.uniformLocation("width_x")
-        self.width_y_uniform = self.shader_program.uniformLocation("width_y")
-        self.rotation_uniform = self.shader_program.uniformLocation("rotation")
+        self.initialise_image_gl()
+        self._drawables_initialised = False
+        self.gl_initialised = True
 
-        GL.glEnableVertexAttribArray(0)
-        GL.glEnableVertexAttribArray(1)
-        GL.glVertexAttribPointer(vertex_position, 3, GL.GL_FLOAT, GL.GL_FALSE, 20,
-                                 None)
+    def initialise_image_gl(self):
+        resources = gl_resources()
+        self.shader_program = resources.program(VERTEX, FRAGMENT)
+        self.VAO = resources.vertex_array('image_quad')
 
-        GL.glVertexAttribPointer(texture_coords, 2, GL.GL_FLOAT, GL.GL_TRUE, 20,
-                                 ctypes.c_void_p(12))
+        def uniform(name):
+            return resources.uniform_location(self.shader_program, name)
 
-        self.texture_sampler = self.shader_program.uniformLocation("textureSampler")
+        self.homography_matrix_uniform = uniform("homography_matrix")
+        self.image_size_uniform = uniform("image_size")
+        self.use_homography_uniform = uniform("use_homography")
+        self.inverted_uniform = uniform("inverted")
+        self.projection_matrix_uniform = uniform("projection_matrix")
+        self.view_matrix_uniform = uniform("view_matrix")
+        self.texture_sampler = uniform("textureSampler")
+        self.frame_layers_sampler = uniform("frameLayers")
+        self.bit_planes_uniform = uniform("bit_planes")
+        self.layer_uniform = uniform("layer")
 
-        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
-        GL.glBindVertexArray(0)
+        self.mask_uniforms.locate(self.shader_program)
 
         self.crosshair.initialise_gl()
 
-        self.gl_initialised = True
-
     @property
     def intensity_mask(self):
         return self._intensity_mask
@@ -349,32 +286,30 @@ class StimulusWidget(QOpenGLWidget):
         if not self.texture_uploaded:
             self.upload_texture()
 
-        log.debug("paint gl image: texture: {}, sampler: {}".format(self.texture, self.texture_sampler))
+        log.debug("paint gl image: texture: {}, sampler: {}".format(self.frame_texture.texture, self.texture_sampler))
         self.shader_program.bind()
 
         GL.glActiveTexture(GL.GL_TEXTURE0)
-        GL.glBindTexture(GL.GL_TEXTURE_2D, self.texture)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self.frame_texture.texture)
         GL.glUniform1i(self.texture_sampler, 0)
+        # Resident frame layers and bit planes are only drawn by StimulusRenderWindow.
+        GL.glUniform1i(self.frame_layers_sampler, 1)
+        GL.glUniform1i(self.layer_uniform, -1)
+        self.shader_program.setUniformValue(self.bit_planes_uniform, False)
 
-    #    homography = self.homography_matrix if self.use_homography else np.identity(3, dtype=np.float32)
-        #mat = QMatrix3x3()
-        #self.shader_program.setUniformValue(self.homography_matrix_uniform, mat)
-     #   GL.glUniformMatrix3fv(self.homography_matrix_uniform, 1, GL.GL_FALSE, homography)
-       # self.shader_program.setUniformValue(self.homography_matrix_uniform, homography)
+        height, width = self.image_to_upload.shape
+        GL.glUniformMatrix3fv(self.homography_matrix_uniform, 1, GL.GL_TRUE, self.inverse_homography)
+        self.shader_program.setUniformValue(self.use_homography_uniform, self._use_homography)
+        self.shader_program.setUniformValue(self.image_size_uniform, QVector2D(width, height))
 
         self.shader_program.setUniformValue(self.inverted_uniform, self.inverted)
-     #   self.shader_program.setUniformValue(self.intensity_mask_uniform, self._intensity_mask)
-        self.shader_program.setUniformValue(self.projection_matrix_uniform, self.projection_matrix)
+        self.mask_uniforms.set(self.shader_program, self.gaussian,
+                               (self._gaussian_shape.x(), self._gaussian_shape.y()),
+                               self.width(), self.height(), enabled=self._use_intensity_mask)
+        # The image quad is in normalised device coordinates, not the pixel projection used by the drawables.
+        self.shader_program.setUniformValue(self.projection_matrix_uniform, QMatrix4x4())
         self.shader_program.setUniformValue(self.view_matrix_uniform, self.view_matrix)
 
-        # self.shader_program.setUniformValue(self.height_uniform, self.gaussian.amplitude)
-        # self.shader_program.setUniformValue(self.centre_x_uniform, self.gaussian.x0)
-        # self.shader_program.setUniformValue(self.centre_y_uniform, self.gaussian.y0)
-        # self.shader_program.setUniformValue(self.width_x_uniform, self.gaussian.width_x)
-        # self.shader_program.setUniformValue(self.width_y_uniform, self.gaussian.width_y)
-        # self.shader_program.setUniformValue(self.rotation_uniform, self.gaussian.rotation)
-        # self.shader_program.setUniformValue(self.shape_uniform, self._gaussian_shape)
-
         GL.glBindVertexArray(self.VAO)
         GL.glDrawArrays(GL.GL_TRIANGLES, 0, 6)
 
@@ -405,6 +340,11 @@ class StimulusWidget(QOpenGLWidget):
         self.projection_matrix.setToIdentity()
         self.projection_matrix.ortho(0, self.width(), self.height(), 0, -1, 1)
 
+        if not self._drawables_initialised:
+            for drawable in self.drawables:
+                drawable.initialise_gl()
+            self._drawables_initialised = True
+
         for drawable in self.drawables:
             drawable.paint_gl()
        # ar = self.width() / self.height()
@@ -425,9 +365,9 @@ class StimulusWidget(QOpenGLWidget):
         #                             width=self.width())
         # elif self._show_scale_bar:
         #     self.paint_scale_bar(painter=painter, half_width=half_x, half_height=half_y)
-        # else:
-        #     if self.image is not None and self.texture:
-        #         self.paint_gl_image()
+
+        if self.image_to_upload is not None:
+            self.paint_gl_image()
 
     def reset_background(self):
         self.set_background_colour(255.0 if self.inverted else 0.0)
@@ -535,7 +475,12 @@ class StimulusWidget(QOpenGLWidget):
     @use_homography.setter
     def use_homography(self, value):
         self._use_homography = value
-        self.update_image()
+        self.update()
+
+    def on_homography_matrixChanged(self):
+        # The warp happens in the fragment shader, an alignment change only updates the uniform on the next paint.
+        self.inverse_homography = np.linalg.inv(self.homography_transform.matrix).astype(np.float32)
+        self.update()
 
     @property
     def use_intensity_mask(self):
@@ -544,89 +489,15 @@ class StimulusWidget(QOpenGLWidget):
     @use_intensity_mask.setter
     def use_intensity_mask(self, new_value):
         self._use_intensity_mask = new_value
-        self.update_image()
+        self.update()
 
     def update_image(self):
 
-        img = self._image
-
-        if img is not None:
-            if self._use_intensity_mask:
-                mask = cv2.resize(self.intensity_mask, img.shape)
-                img = img * mask
-
-            if self._use_homography:
-                height, width = img.shape
-                img = cv2.warpPerspective(img, self.homography_transform.matrix, (height, width))
-
-        self.image_to_upload = img
+        self.image_to_upload = self._image
         self.texture_uploaded = False
         self.update()
 
 
-VERTEX_INTENSITY = """#version 330
-        in vec3 vertexPosition;
-        in vec2 vertexTexCoords;
-        
-        out vec2 textureCoords;
-
-        void main() {
-           gl_Position = vec4(vertexPosition, 0.0);
-            textureCoords = vertexTexCoords;
-        }"""
-
-FRAGMENT_INTENSITY = """#version 330
-        in vec2 textureCoords;
-        uniform sampler2D texture_framebuffer;
-        out vec4 colour;
-
-        uniform float centre_x = 678;
-        uniform float centre_y = 987;        
-        uniform float height = 213;
-        uniform float rotation = 26;
-        uniform float max_height;
-        uniform vec2 shape;
-        uniform float width_x = 231;
-        uniform float width_y = 254;
-
-        float gaussianMask(float x, float y)
-        {
-            float rotation_radians = radians(rotation);
-
-            float centre_x2 = centre_x * cos(rotation_radians) - centre_y * sin(rotation_radians);
-            float centre_y2 = centre_x * sin(rotation_radians) + centre_y * cos(rotation_radians);
-
-            float xp = x * cos(rotation_radians) - y * sin(rotation_radians);
-            float yp = x * sin(rotation_radians) + y * cos(rotation_radians);
-
-           float a = pow((centre_x2 - xp) / width_x, 2);
-           float b = pow((centre_y2 - yp) / width_y, 2);
-
-            float gaussian = height * exp(-0.5 * (a + b));
-
-            return (1.0 - gaussian / height);
-        }
-
-        void main() {
-             colour = texture(texture_framebuffer, textureCoords) * gaussianMask(gl_FragCoord.x, gl_FragCoord.y);
-             //vec2 blah = textureCoords;
-             //colour = vec4(1.0, 0.0, 0.0, 1.0);
-             
-
-             /* if (intensity_mask)
-              {
-              vec3 transformed = homography_matrix * vec3(textureCoords.x, textureCoords.y, 1.0);
-
-                  float y = transformed.x;// * shape.y;
-                  float x = (1 - transformed.y);// * shape.x;
-
-                    colour.xyz = vec3(gaussianMask(x,  y));
-                    colour = colour * gaussianMask();
-               }*/
-
-        }"""
-
-
 class StimulusWindowGraphicsView(QGraphicsView, InvertSceneColoursMixin):
 
     visibilityChanged = pyqtSignal(bool)
@@ -647,6 +518,9 @@ class StimulusWindowGraphicsView(QGraphicsView, InvertSceneColoursMixin):
         self.intensity_mask = intensity_mask
 
         self.intensity_mask_renderer = GaussianIntensityMaskRenderer(parent=self)
+        self.intensity_mask.fitChanged.connect(self.on_intensity_mask_fitChanged)
+        if self.intensity_mask.is_set:
+            self.on_intensity_mask_fitChanged(self.intensity_mask.gaussian_fit)
 
         # background_brush = QBrush()
         # background_brush.setStyle(Qt.SolidPattern)
@@ -733,6 +607,7 @@ class StimulusWindowGraphicsView(QGraphicsView, InvertSceneColoursMixin):
     def drawBackground(self, painter, rect):
         if not self.initialised:
             self.initialise_gl()
+            self.viewport().context().aboutToBeDestroyed.connect(self.on_viewport_context_aboutToBeDestroyed)
 
         # if not self.intensity_mask_renderer.initialised:
         #     self.intensity_mask_renderer.initialise_gl()
@@ -740,7 +615,8 @@ class StimulusWindowGraphicsView(QGraphicsView, InvertSceneColoursMixin):
         if self.recreate_frame_buffer:
             self.resize_texture()
 
-        if self.invert:
+        # Inverting and the intensity mask are post-process passes, the scene is drawn to a texture first.
+        if self.invert or self.apply_intensity_mask:
             GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, self.frame_buffer)
 
         GL.glClearColor(0.0, 0.0, 0.0, 1.0)
@@ -748,17 +624,20 @@ class StimulusWindowGraphicsView(QGraphicsView, InvertSceneColoursMixin):
         super().drawBackground(painter, rect)
 
     def drawForeground(self, painter, rect):
+        painter.beginNativePainting()
+        projection = QMatrix4x4()
+        projection.ortho(0, self.viewport().width(), self.viewport().height(), 0, -1, 1)
+        self.scene().point_renderer.draw(projection * QMatrix4x4(self.viewportTransform()))
+        painter.endNativePainting()
+
         if self.crosshair:
             self.draw_crosshair(painter, rect)
 
-        if self.apply_intensity_mask:
-            log.debug("apply_intensity_mask")
-            self.intensity_mask_renderer.draw()
-            # self.draw_intensity_mask()
-
         GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, self.viewport().defaultFramebufferObject())
 
-        if self.invert:
+        if self.apply_intensity_mask:
+            self.intensity_mask_renderer.draw(self.texture, self.width(), self.height(), inverted=self.invert)
+        elif self.invert:
             self.draw_texture_to_screen()
 
     # def init_intensity_mask_gl(self):
@@ -846,6 +725,20 @@ class StimulusWindowGraphicsView(QGraphicsView, InvertSceneColoursMixin):
     def mousePressEvent(self, event):
         event.ignore()
 
+    def on_viewport_context_aboutToBeDestroyed(self):
+        # Shared programs and geometry are released by the registry, everything else is recreated in the next
+        # context the viewport gets.
+        self.initialised = False
+        self.recreate_frame_buffer = True
+        self.texture = 0
+        self.frame_buffer = 0
+        self.intensity_mask_renderer.initialised = False
+
+    def on_intensity_mask_fitChanged(self, gaussian):
+        self.intensity_mask_renderer.set_gaussian(gaussian, self.intensity_mask.shape)
+        if self.scene():
+            self.scene().update()
+
     def open(self):
         desktop = QApplication.desktop()
         is_fullscreen = desktop.screenCount() > 1